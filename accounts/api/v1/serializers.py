@@ -1,6 +1,7 @@
 from accounts.models import User
 from django.contrib.auth import password_validation
 from rest_framework import serializers
+from blog.serializers import AsyncValidationMixin
 
 
 class UserReadSerializer(serializers.ModelSerializer):
@@ -15,7 +16,8 @@ class UserReadSerializer(serializers.ModelSerializer):
                   'created_at', 'updated_at']
 
 
-class UserCreateSerializer(serializers.ModelSerializer):
+class UserCreateSerializer(AsyncValidationMixin,
+                           serializers.ModelSerializer):
     """
     Serializer for the User model.
     Used for creating users.
@@ -45,6 +47,15 @@ class UserCreateSerializer(serializers.ModelSerializer):
         validated_data.pop('password2')
         return User.objects.create_user(**validated_data)
 
+    async def asave(self):
+        """
+        See save(). The password is hashed in the hashing pool.
+        """
+        validated_data = dict(self.validated_data)
+        validated_data.pop('password2')
+        self.instance = await User.objects.acreate_user(**validated_data)
+        return self.instance
+
 
 class UserUpdateSerializer(serializers.ModelSerializer):
     """
@@ -56,7 +67,7 @@ class UserUpdateSerializer(serializers.ModelSerializer):
         fields = ['id', 'username', 'name', 'surname', 'email']
 
 
-class ChangePasswordSerializer(serializers.Serializer):
+class ChangePasswordSerializer(AsyncValidationMixin, serializers.Serializer):
     """
     Serializer for changing password.
     """
@@ -64,12 +75,6 @@ class ChangePasswordSerializer(serializers.Serializer):
     new_password = serializers.CharField(write_only=True)
     confirm_password = serializers.CharField(write_only=True)
 
-    def validate_current_password(self, value):
-        user = self.context['request'].user
-        if not user.check_password(value):
-            raise serializers.ValidationError("Current password is incorrect.")
-        return value
-
     def validate(self, attrs):
         new_password = attrs['new_password']
         confirm_password = attrs['confirm_password']
@@ -78,8 +83,25 @@ class ChangePasswordSerializer(serializers.Serializer):
             raise serializers.ValidationError('New password and confirmation password do not match.')
         return attrs
 
-    def save(self, **kwargs):
+    async def avalidate(self, attrs):
+        """
+        Check the current password in the hashing pool, once the new one
+        passed the cheaper checks.
+        """
+        attrs = await super().avalidate(attrs)
+        user = self.context['request'].user
+        if not await user.acheck_password(attrs['current_password']):
+            raise serializers.ValidationError(
+                {'current_password': ["Current password is incorrect."]})
+        return attrs
+
+    async def asave(self):
+        """
+        See save(). The password is hashed in the hashing pool.
+        """
         user = self.context['request'].user
-        user.set_password(self.validated_data['new_password'])
-        user.save()
+        await user.aset_password(self.validated_data['new_password'])
+        # The user may come from the authentication cache, so only
+        # the password is written.
+        await user.asave(update_fields=['password', 'updated_at'])
         return user
\ No newline at end of file
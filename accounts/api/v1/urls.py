@@ -1,8 +1,8 @@
 from django.urls import path, include
 from rest_framework.routers import SimpleRouter
-from .views import UserModelViewSet, ChangePasswordAPIView
-from rest_framework_simplejwt.views import (TokenObtainPairView,
-                                            TokenRefreshView,
+from .views import (UserModelViewSet, ChangePasswordAPIView,
+                    TokenObtainPairAPIView)
+from rest_framework_simplejwt.views import (TokenRefreshView,
                                             TokenBlacklistView)
 
 
@@ -10,7 +10,7 @@ router = SimpleRouter()
 router.register(r'users', UserModelViewSet, basename='users')
 
 urlpatterns = [
-    path('auth/token/', TokenObtainPairView.as_view(),
+    path('auth/token/', TokenObtainPairAPIView.as_view(),
          name='token_obtain_pair'),
     path('auth/token/refresh/', TokenRefreshView.as_view(),
          name='token_refresh'),
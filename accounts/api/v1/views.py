@@ -1,9 +1,16 @@
+from rest_framework import status
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.generics import GenericAPIView
 from rest_framework.response import Response
 from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from blog.pagination import KeysetPaginationMixin, PaginationMixin
+from blog.planner import QueryPlanMixin
+from blog.views import AsyncAPIViewMixin
+from blog.values import ValuesListMixin
 from rest_framework.permissions import IsAuthenticated
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.views import TokenObtainPairView
 from accounts.models import User
 from .serializers import (UserReadSerializer,
                           UserCreateSerializer,
@@ -12,25 +19,8 @@ from .serializers import (UserReadSerializer,
 from accounts.api.permissions import IsOwnerOrReadOnlyOrSuperuser
 
 
-class PaginationMixin:
-    """
-    Mixin for safe pagination with fallback for invalid pages.
-    """
-    def paginate_queryset(self, queryset, request, view=None):
-        try:
-            return super().paginate_queryset(queryset, request, view)
-        except NotFound:
-            page = request.GET.get('page')
-            request._request.GET = request._request.GET.copy()
-            if not page.isdigit():
-                request._request.GET['page'] = 1
-            else:
-                last_page = (queryset.count() - 1) // self.page_size + 1
-                request._request.GET['page'] = last_page
-            return super().paginate_queryset(queryset, request, view)
-
-
-class UserPagination(PaginationMixin, PageNumberPagination):
+class UserPagination(KeysetPaginationMixin, PaginationMixin,
+                     PageNumberPagination):
     """
     Pagination class for the User model.
     """
@@ -39,7 +29,8 @@ class UserPagination(PaginationMixin, PageNumberPagination):
     max_page_size = 100
 
 
-class UserModelViewSet(ModelViewSet):
+class UserModelViewSet(AsyncAPIViewMixin, ValuesListMixin, QueryPlanMixin,
+                       ModelViewSet):
     """
     API endpoint for managing users.
 
@@ -61,17 +52,40 @@ class UserModelViewSet(ModelViewSet):
             return UserUpdateSerializer
         return NotFound('Method not allowed')
 
+    async def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        await serializer.ais_valid(raise_exception=True)
+        await serializer.asave()
+        headers = self.get_success_headers(serializer.data)
+        return Response(serializer.data, status=status.HTTP_201_CREATED,
+                        headers=headers)
+
 
-class ChangePasswordAPIView(GenericAPIView):
+class ChangePasswordAPIView(AsyncAPIViewMixin, GenericAPIView):
     """
     API endpoint for changing password.
     """
     serializer_class = ChangePasswordSerializer
     permission_classes = [IsAuthenticated]
 
-    def post(self, request, *args, **kwargs):
+    async def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
-        if serializer.is_valid(raise_exception=True):
-            serializer.save()
-            return Response({'detail': 'Password was changed.'})
-        return Response(serializer)
\ No newline at end of file
+        await serializer.ais_valid(raise_exception=True)
+        await serializer.asave()
+        return Response({'detail': 'Password was changed.'})
+
+
+class TokenObtainPairAPIView(AsyncAPIViewMixin, TokenObtainPairView):
+    """
+    Takes a set of user credentials and returns an access and refresh JSON web
+    token pair to prove the authentication of those credentials.
+    """
+    async def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+
+        try:
+            await serializer.ais_valid(raise_exception=True)
+        except TokenError as e:
+            raise InvalidToken(e.args[0]) from e
+
+        return Response(serializer.validated_data, status=status.HTTP_200_OK)
@@ -1,14 +1,14 @@
 from django.urls import path
 from .views import (UserListCreateAPIView,
                     UserRetrieveUpdateDestroyAPIView,
-                    ChangePasswordAPIView)
-from rest_framework_simplejwt.views import (TokenObtainPairView,
-                                            TokenRefreshView,
+                    ChangePasswordAPIView,
+                    TokenObtainPairAPIView)
+from rest_framework_simplejwt.views import (TokenRefreshView,
                                             TokenBlacklistView)
 
 
 urlpatterns = [
-    path('auth/token/', TokenObtainPairView.as_view(),
+    path('auth/token/', TokenObtainPairAPIView.as_view(),
          name='token_obtain_pair'),
     path('auth/token/refresh/', TokenRefreshView.as_view(),
          name='token_refresh'),
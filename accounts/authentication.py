@@ -0,0 +1,150 @@
+"""
+JWT authentication with cached users.
+
+Users of authenticated requests are resolved from an in-process LRU
+cache, then from the shared cache (Redis when configured) and only then
+from the database. Cached rows are dropped from the shared cache and the
+local one of the current process when the user is saved or deleted, once
+the transaction commits; local caches of other processes keep serving a
+row for at most USER_LOCAL_CACHE_TIMEOUT seconds. Users are read from the
+database while Redis fails.
+
+The password hash is not cached: it is loaded on first access, e.g. when
+a password is checked.
+"""
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import router, transaction
+from django.utils.translation import gettext_lazy as _
+from redis import RedisError
+from drf_spectacular.contrib.rest_framework_simplejwt import SimpleJWTScheme
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import (AuthenticationFailed,
+                                                 InvalidToken)
+from rest_framework_simplejwt.settings import api_settings
+
+
+USER_CACHE_KEY = 'accounts:user:{user_id}'
+
+
+class LocalCache:
+    """
+    Thread-safe LRU cache of up to 'size' entries that expire
+    'timeout' seconds after they are set.
+    """
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.timeout, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+
+local_cache = LocalCache(settings.USER_LOCAL_CACHE_SIZE,
+                         settings.USER_LOCAL_CACHE_TIMEOUT)
+
+
+def get_cached_fields():
+    return [field.attname for field in get_user_model()._meta.concrete_fields
+            if field.name != 'password']
+
+
+def get_user(user_id):
+    """
+    Return the user whose USER_ID_FIELD equals 'user_id', or None.
+    """
+    User = get_user_model()
+    key = USER_CACHE_KEY.format(user_id=user_id)
+    fields = get_cached_fields()
+    row = local_cache.get(key)
+    if row is None:
+        try:
+            row = cache.get(key)
+        except RedisError:
+            row = None
+        if row is None:
+            row = User.objects.filter(
+                **{api_settings.USER_ID_FIELD: user_id}
+            ).values_list(*fields).first()
+            if row is None:
+                return None
+            try:
+                cache.set(key, row, settings.USER_CACHE_TIMEOUT)
+            except RedisError:
+                pass
+        local_cache.set(key, row)
+    # A new instance per request, so that changes made while handling
+    # one request never leak into the cached row.
+    return User.from_db(router.db_for_read(User), fields, row)
+
+
+def invalidate_user(user_id):
+    """
+    Drop the cached user once the current transaction commits.
+    """
+    key = USER_CACHE_KEY.format(user_id=user_id)
+
+    def delete():
+        cache.delete(key)
+        local_cache.delete(key)
+    local_cache.delete(key)
+    transaction.on_commit(delete, robust=True)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that resolves the user of the token from
+    the user cache instead of a query per request.
+
+    Users are checked exactly as by JWTAuthentication. With
+    CHECK_REVOKE_TOKEN, which compares the password hash on every
+    request, users are always read from the database.
+    """
+    def get_user(self, validated_token):
+        if api_settings.CHECK_REVOKE_TOKEN:
+            return super().get_user(validated_token)
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(
+                _('Token contained no recognizable user identification')
+            ) from e
+
+        user = get_user(user_id)
+        if user is None:
+            raise AuthenticationFailed(_('User not found'),
+                                       code='user_not_found')
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'),
+                                       code='user_inactive')
+        return user
+
+
+class CachedJWTScheme(SimpleJWTScheme):
+    target_class = 'accounts.authentication.CachedJWTAuthentication'
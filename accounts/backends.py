@@ -0,0 +1,29 @@
+from django.contrib.auth import backends, get_user_model
+from accounts import hashing
+
+
+UserModel = get_user_model()
+
+
+class ModelBackend(backends.ModelBackend):
+    """
+    Authentication backend that, when called through aauthenticate(),
+    hashes passwords in the hashing pool instead of on the event loop.
+    """
+    async def aauthenticate(self, request, username=None, password=None,
+                            **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return
+        try:
+            user = await UserModel._default_manager.aget_by_natural_key(
+                username)
+        except UserModel.DoesNotExist:
+            # Run the default password hasher once to reduce the timing
+            # difference between an existing and a nonexistent user.
+            await hashing.make_password(password)
+        else:
+            if (await user.acheck_password(password)
+                    and self.user_can_authenticate(user)):
+                return user
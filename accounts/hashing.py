@@ -0,0 +1,73 @@
+"""
+Password hashing pool.
+
+With the default PBKDF2 hasher each hash takes hundreds of milliseconds
+of CPU. Async views hash and check passwords in a pool of
+PASSWORD_HASHING_WORKERS threads, which run in parallel since hashlib
+releases the GIL while hashing, while the request only waits on the event
+loop. At most PASSWORD_HASHING_QUEUE_SIZE more calls wait for a thread;
+calls beyond that fail right away with 503, so a burst of logins cannot
+take the CPU from the other requests of the process.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth import hashers
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+_executor = None
+_slots = None
+_lock = threading.Lock()
+
+
+class HashingUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many password checks in progress, try again later.'
+    default_code = 'hashing_unavailable'
+
+
+def get_executor():
+    global _executor, _slots
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                workers = settings.PASSWORD_HASHING_WORKERS
+                _slots = threading.BoundedSemaphore(
+                    workers + settings.PASSWORD_HASHING_QUEUE_SIZE)
+                _executor = ThreadPoolExecutor(
+                    max_workers=workers, thread_name_prefix='hashing')
+    return _executor
+
+
+async def run(func, *args):
+    """
+    Run func(*args) in the hashing pool and return its result.
+    Raise HashingUnavailable if the pool and its queue are full.
+    """
+    executor = get_executor()
+    if not _slots.acquire(blocking=False):
+        raise HashingUnavailable()
+    try:
+        future = executor.submit(func, *args)
+    except BaseException:
+        _slots.release()
+        raise
+    # The slot is held until the hash is done, even if the request
+    # is cancelled while waiting for it.
+    future.add_done_callback(lambda future: _slots.release())
+    return await asyncio.wrap_future(future)
+
+
+async def make_password(password):
+    return await run(hashers.make_password, password)
+
+
+async def verify_password(password, encoded):
+    """
+    Return whether the password matches the encoded hash
+    and whether the hash must be regenerated.
+    """
+    return await run(hashers.verify_password, password, encoded)
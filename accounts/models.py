@@ -1,8 +1,8 @@
 from django.db import models
-from django.contrib.auth import password_validation
 from django.contrib.auth.models import (AbstractBaseUser,
                                         PermissionsMixin,
                                         BaseUserManager)
+from accounts import hashing
 
 
 class UserManager(BaseUserManager):
@@ -10,17 +10,23 @@ class UserManager(BaseUserManager):
         if not email:
             raise ValueError('Users must have an email address')
 
-        try:
-            password_validation.validate_password(password)
-        except password_validation.ValidationError as e:
-            message = e.messages[0]
-            raise ValueError(message)
-
         user = self.model(email=email, **extra_fields)
         user.set_password(password)
         user.save(using=self._db)
         return user
 
+    async def acreate_user(self, email, password=None, **extra_fields):
+        """
+        See create_user(). The password is hashed in the hashing pool.
+        """
+        if not email:
+            raise ValueError('Users must have an email address')
+
+        user = self.model(email=email, **extra_fields)
+        await user.aset_password(password)
+        await user.asave(using=self._db)
+        return user
+
     def create_superuser(self, email, password, **extra_fields):
         extra_fields.setdefault('is_staff', True)
         extra_fields.setdefault('is_superuser', True)
@@ -45,6 +51,41 @@ class User(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
     objects = UserManager()
+    # The column rendered by __str__, read by the query planner and
+    # ValuesSerializer for StringRelatedField.
+    STR_FIELD = 'email'
 
     def __str__(self):
-        return self.email
\ No newline at end of file
+        return self.email
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the loaded username and email, rendered with posts
+        # and comments, to detect changes on save.
+        instance._loaded_username = instance.__dict__.get('username')
+        instance._loaded_email = instance.__dict__.get('email')
+        return instance
+
+    async def aset_password(self, raw_password):
+        """
+        See set_password(). The password is hashed in the hashing pool.
+        """
+        self.password = await hashing.make_password(raw_password)
+        self._password = raw_password
+
+    async def acheck_password(self, raw_password):
+        """
+        See check_password(). The password is checked, and rehashed if
+        the hasher changed, in the hashing pool.
+        """
+        if 'password' in self.get_deferred_fields():
+            await self.arefresh_from_db(fields=['password'])
+        is_correct, must_update = await hashing.verify_password(
+            raw_password, self.password)
+        if is_correct and must_update:
+            await self.aset_password(raw_password)
+            # Password hash upgrades shouldn't be considered password changes.
+            self._password = None
+            await self.asave(update_fields=['password'])
+        return is_correct
\ No newline at end of file
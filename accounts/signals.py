@@ -0,0 +1,15 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.settings import api_settings
+from accounts.authentication import invalidate_user
+from accounts.models import User
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """
+    Signal handler to drop the user cached for JWT authentication
+    when the user is saved, e.g. deactivated or given a new password,
+    or deleted.
+    """
+    invalidate_user(getattr(instance, api_settings.USER_ID_FIELD))
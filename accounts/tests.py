@@ -1,3 +1,211 @@
-from django.test import TestCase
+import threading
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.test import (SimpleTestCase, TransactionTestCase,
+                         override_settings)
+from redis import RedisError
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.token_blacklist.models import (
+    BlacklistedToken, OutstandingToken)
+from rest_framework_simplejwt.tokens import AccessToken
+from accounts.authentication import (CachedJWTAuthentication, LocalCache,
+                                     local_cache)
+from accounts import hashing
+from accounts.tokens import BLACKLIST_KEY
+from blog.testing import SHARED_REDIS_CACHES, FakeRedisMixin
 
-# Create your tests here.
+
+API_URL = '/api/v1/accounts/'
+
+
+def create_user(name, **kwargs):
+    return get_user_model().objects.create_user(
+        email=f'{name}@local.host', password='password', username=name,
+        **kwargs)
+
+
+class LocalCacheTest(SimpleTestCase):
+    def test_least_recently_used_evicted(self):
+        cache = LocalCache(size=2, timeout=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')),
+                         (1, None, 3))
+
+    def test_expired(self):
+        cache = LocalCache(size=2, timeout=60)
+        with mock.patch('time.monotonic', return_value=100):
+            cache.set('a', 1)
+        with mock.patch('time.monotonic', return_value=159):
+            self.assertEqual(cache.get('a'), 1)
+        with mock.patch('time.monotonic', return_value=161):
+            self.assertIsNone(cache.get('a'))
+
+
+# Users are saved in their own transactions, so that cached rows are
+# dropped when they commit, as they are outside of tests.
+@override_settings(CACHES=SHARED_REDIS_CACHES)
+class CachedJWTAuthenticationTest(FakeRedisMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        local_cache.entries.clear()
+        self.addCleanup(local_cache.entries.clear)
+        self.user = create_user('reader')
+        self.token = AccessToken.for_user(self.user)
+
+    def get_user(self):
+        return CachedJWTAuthentication().get_user(self.token)
+
+    def test_user_cached(self):
+        self.assertEqual(self.get_user().email, 'reader@local.host')
+        with self.assertNumQueries(0):
+            user = self.get_user()
+        self.assertEqual(user.pk, self.user.pk)
+        local_cache.entries.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_user().pk, self.user.pk)
+
+    def test_password_not_cached(self):
+        user = self.get_user()
+        with self.assertNumQueries(1):
+            self.assertTrue(user.check_password('password'))
+
+    def test_change_invalidates(self):
+        self.get_user()
+        self.user.email = 'changed@local.host'
+        self.user.save()
+        self.assertEqual(self.get_user().email, 'changed@local.host')
+
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.get_user()
+
+    def test_deleted_user(self):
+        self.get_user()
+        self.user.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.get_user()
+
+    def test_redis_error_reads_database(self):
+        with mock.patch('django.core.cache.backends.redis.RedisCacheClient'
+                        '.get', side_effect=RedisError), \
+                mock.patch('django.core.cache.backends.redis.RedisCacheClient'
+                           '.set', side_effect=RedisError):
+            with self.assertNumQueries(1):
+                self.assertEqual(self.get_user().pk, self.user.pk)
+
+
+class RefreshTokenBlacklistTest(FakeRedisMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        # accounts.tokens imports get_client by name.
+        patcher = mock.patch('accounts.tokens.get_client',
+                             return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        create_user('reader')
+        self.client = APIClient()
+
+    def obtain_refresh_token(self):
+        response = self.client.post(f'{API_URL}auth/token/', {
+            'email': 'reader@local.host', 'password': 'password'})
+        self.assertEqual(response.status_code, 200)
+        return response.data['refresh']
+
+    def refresh(self, token):
+        return self.client.post(f'{API_URL}auth/token/refresh/',
+                                {'refresh': token})
+
+    def blacklist(self, token):
+        response = self.client.post(f'{API_URL}auth/token/blacklist/',
+                                    {'refresh': token})
+        self.assertEqual(response.status_code, 200)
+
+    def test_blacklisted_in_redis(self):
+        token = self.obtain_refresh_token()
+        self.assertEqual(self.refresh(token).status_code, 200)
+
+        self.blacklist(token)
+        self.assertEqual(self.refresh(token).status_code, 401)
+        keys = self.redis.keys(BLACKLIST_KEY.format(jti='*'))
+        self.assertEqual(len(keys), 1)
+        self.assertLessEqual(self.redis.ttl(keys[0]), 30 * 60)
+        self.assertFalse(OutstandingToken.objects.exists())
+        self.assertFalse(BlacklistedToken.objects.exists())
+
+    def test_blacklisted_in_database_without_redis(self):
+        with mock.patch('accounts.tokens.get_client', return_value=None):
+            token = self.obtain_refresh_token()
+            self.blacklist(token)
+            self.assertEqual(self.refresh(token).status_code, 401)
+        self.assertEqual(BlacklistedToken.objects.count(), 1)
+        self.assertEqual(self.redis.keys(), [])
+
+
+class AsyncAuthViewsTest(TransactionTestCase):
+    def setUp(self):
+        self.user = create_user('reader')
+        self.client = APIClient()
+
+    def login(self, password='password'):
+        return self.client.post(f'{API_URL}auth/token/', {
+            'email': 'reader@local.host', 'password': password})
+
+    def test_login(self):
+        self.assertEqual(self.login().status_code, 200)
+        self.assertEqual(self.login('wrong').status_code, 401)
+
+    def test_register(self):
+        data = {'username': 'writer', 'email': 'writer@local.host',
+                'name': 'Writer', 'surname': 'Writer',
+                'password': 'Secret-passw0rd', 'password2': 'Other-passw0rd'}
+        response = self.client.post(f'{API_URL}users/', data)
+        self.assertEqual(response.status_code, 400)
+
+        data['password2'] = data['password']
+        with mock.patch('django.contrib.auth.password_validation'
+                        '.validate_password') as validate_password:
+            response = self.client.post(f'{API_URL}users/', data)
+        self.assertEqual(response.status_code, 201)
+        validate_password.assert_called_once()
+        self.assertNotIn('password', response.data)
+        user = get_user_model().objects.get(pk=response.data['id'])
+        self.assertTrue(user.check_password('Secret-passw0rd'))
+
+    def test_change_password(self):
+        self.client.force_authenticate(self.user)
+        url = f'{API_URL}change-password/'
+        data = {'current_password': 'wrong',
+                'new_password': 'Secret-passw0rd',
+                'confirm_password': 'Secret-passw0rd'}
+        self.assertEqual(self.client.post(url, data).status_code, 400)
+
+        data['current_password'] = 'password'
+        self.assertEqual(self.client.post(url, data).status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('Secret-passw0rd'))
+
+    def test_hashing_pool_full(self):
+        hashing.get_executor()
+        slots = threading.BoundedSemaphore(1)
+        with mock.patch.object(hashing, '_slots', slots):
+            slots.acquire()
+            response = self.login()
+            self.assertEqual(response.status_code, 503)
+            slots.release()
+            self.assertEqual(self.login().status_code, 200)
+
+    def test_hashing_pool_releases_slots(self):
+        hashing.get_executor()
+        slots = threading.BoundedSemaphore(1)
+        with mock.patch.object(hashing, '_slots', slots):
+            encoded = async_to_sync(hashing.make_password)('password')
+            self.assertEqual(
+                async_to_sync(hashing.verify_password)('password', encoded),
+                (True, False))
+            self.assertTrue(slots.acquire(blocking=False))
@@ -0,0 +1,118 @@
+"""
+Refresh tokens blacklisted in Redis.
+
+The token_blacklist app of simplejwt records every issued refresh token
+in OutstandingToken and every blacklisted one in BlacklistedToken, tables
+that only shrink when flushexpiredtokens runs. When REDIS_URL is set, the
+tokens below are not recorded as outstanding and a blacklisted token's
+jti is kept in a Redis key that expires together with the token, so the
+check is a single EXISTS and the blacklist cleans itself up. Without
+Redis the database tables are used.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth import aauthenticate
+from django.contrib.auth.models import update_last_login
+from django.utils.translation import gettext_lazy as _
+from drf_spectacular.contrib.rest_framework_simplejwt import (
+    TokenObtainPairSerializerExtension, TokenRefreshSerializerExtension)
+from rest_framework import exceptions
+from rest_framework_simplejwt import serializers
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import BlacklistMixin
+from rest_framework_simplejwt.tokens import RefreshToken as BaseRefreshToken
+from rest_framework_simplejwt.utils import datetime_to_epoch
+from blog.redis_client import get_client
+from blog.serializers import AsyncValidationMixin
+
+
+BLACKLIST_KEY = 'accounts:token:blacklist:{jti}'
+
+
+class RefreshToken(BaseRefreshToken):
+    """
+    Refresh token blacklisted in Redis when it is configured.
+    """
+    @classmethod
+    def for_user(cls, user):
+        if get_client() is None:
+            return super().for_user(user)
+        # Skip the outstanding token list of BlacklistMixin.
+        return super(BlacklistMixin, cls).for_user(user)
+
+    def get_blacklist_key(self):
+        return BLACKLIST_KEY.format(jti=self.payload[api_settings.JTI_CLAIM])
+
+    def check_blacklist(self):
+        client = get_client()
+        if client is None:
+            return super().check_blacklist()
+        if client.exists(self.get_blacklist_key()):
+            raise TokenError(_('Token is blacklisted'))
+
+    def blacklist(self):
+        client = get_client()
+        if client is None:
+            return super().blacklist()
+        timeout = self.payload['exp'] - datetime_to_epoch(self.current_time)
+        if timeout > 0:
+            client.set(self.get_blacklist_key(), 1, ex=timeout)
+
+    def outstand(self):
+        if get_client() is None:
+            return super().outstand()
+
+
+class TokenObtainPairSerializer(AsyncValidationMixin,
+                                serializers.TokenObtainPairSerializer):
+    """
+    Serializer for obtaining a token pair. With ais_valid() the user is
+    authenticated with aauthenticate(), which checks the password in
+    the hashing pool.
+    """
+    token_class = RefreshToken
+
+    async def avalidate(self, attrs):
+        authenticate_kwargs = {
+            self.username_field: attrs[self.username_field],
+            'password': attrs['password'],
+        }
+        try:
+            authenticate_kwargs['request'] = self.context['request']
+        except KeyError:
+            pass
+
+        self.user = await aauthenticate(**authenticate_kwargs)
+
+        if not api_settings.USER_AUTHENTICATION_RULE(self.user):
+            raise exceptions.AuthenticationFailed(
+                self.error_messages['no_active_account'],
+                'no_active_account',
+            )
+
+        refresh = await sync_to_async(self.get_token)(self.user)
+        data = {
+            'refresh': str(refresh),
+            'access': str(refresh.access_token),
+        }
+
+        if api_settings.UPDATE_LAST_LOGIN:
+            await sync_to_async(update_last_login)(None, self.user)
+
+        return data
+
+
+class TokenRefreshSerializer(serializers.TokenRefreshSerializer):
+    token_class = RefreshToken
+
+
+class TokenBlacklistSerializer(serializers.TokenBlacklistSerializer):
+    token_class = RefreshToken
+
+
+class TokenObtainPairSerializerSchema(TokenObtainPairSerializerExtension):
+    target_class = 'accounts.tokens.TokenObtainPairSerializer'
+
+
+class TokenRefreshSerializerSchema(TokenRefreshSerializerExtension):
+    target_class = 'accounts.tokens.TokenRefreshSerializer'
@@ -0,0 +1,208 @@
+"""
+Row counts for paginated querysets without a full COUNT(*) scan.
+
+Small tables are always counted exactly. For large tables the count of a
+queryset filtered by a registered field (e.g. Post.status) is read from a
+Redis counter that is maintained by signal handlers, seeded with an exact
+count when it is missing and periodically overwritten with exact counts by
+reseed(), which corrects any drift of the deltas. Other plain equality filtered querysets get
+the Postgres planner row estimate, anything more complex is counted.
+"""
+import time
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count, Q
+from django.db.models.expressions import Col
+from django.db.models.lookups import Exact
+from redis import RedisError
+from blog import redis_client
+
+
+COUNTER_PREFIX = 'counter'
+TABLE_SIZE_TTL = 60
+
+INCRBY_IF_EXISTS = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('INCRBY', KEYS[1], ARGV[1])
+end
+return nil
+"""
+
+_registry = {}
+_table_sizes = {}
+
+
+def register(model, field):
+    """
+    Maintain counters for 'model' split by the values of 'field'.
+    """
+    _registry[model._meta.label_lower] = field
+
+
+def get_exact_filters(queryset):
+    """
+    Return the queryset filters as a {attname: value} dict when they are
+    plain ANDed equality lookups on the model's own columns, else None.
+    """
+    query = queryset.query
+    if (query.distinct or query.combinator or query.low_mark
+            or query.high_mark is not None):
+        return None
+    where = query.where
+    if where.negated or (len(where.children) > 1 and where.connector != Q.AND):
+        return None
+
+    filters = {}
+    for child in where.children:
+        if not isinstance(child, Exact) or not isinstance(child.lhs, Col):
+            return None
+        if child.lhs.alias != query.get_initial_alias():
+            return None
+        if hasattr(child.rhs, 'resolve_expression'):
+            return None
+        filters[child.lhs.target.attname] = child.rhs
+    return filters
+
+
+def get_counter_key(model, value=None):
+    label = model._meta.label_lower
+    if value is None:
+        return f'{COUNTER_PREFIX}:{label}'
+    return f'{COUNTER_PREFIX}:{label}:{_registry[label]}={value}'
+
+
+def get_queryset_counter_key(queryset):
+    """
+    Return the counter key matching the queryset, or None if the
+    queryset is not covered by a registered counter.
+    """
+    field = _registry.get(queryset.model._meta.label_lower)
+    if field is None:
+        return None
+    filters = get_exact_filters(queryset)
+    if filters is None:
+        return None
+    if not filters:
+        return get_counter_key(queryset.model)
+    if list(filters) != [field]:
+        return None
+    return get_counter_key(queryset.model, filters[field])
+
+
+def adjust(model, value, delta, total=True):
+    """
+    Add 'delta' to the counter of rows where the registered field equals
+    'value' and, if 'total' is set, to the counter of all rows, once the
+    current transaction commits.
+
+    Counters that are not seeded yet are left alone, they are filled with
+    an exact count on the next read.
+    """
+    keys = [get_counter_key(model, value)]
+    if total:
+        keys.append(get_counter_key(model))
+
+    def incrby(pipe):
+        for key in keys:
+            pipe.eval(INCRBY_IF_EXISTS, 1, key, delta)
+    redis_client.on_commit(incrby)
+
+
+def move(model, old_value, new_value, count=1):
+    """
+    Move 'count' rows between the counters of two field values.
+    """
+    adjust(model, old_value, -count, total=False)
+    adjust(model, new_value, count, total=False)
+
+
+def reseed():
+    """
+    Overwrite the counters of all registered models with exact counts and
+    drop the counters of field values without rows. Deltas committed while
+    counting may be lost and are corrected by the next reseed.
+
+    Return the number of counters written, or None without Redis.
+    """
+    client = redis_client.get_client()
+    if client is None:
+        return None
+    written = 0
+    for label, field in _registry.items():
+        model = apps.get_model(label)
+        rows = model._base_manager.order_by().values_list(field).annotate(
+            count=Count('pk'))
+        values = {get_counter_key(model): 0}
+        for value, rows_count in rows:
+            values[get_counter_key(model)] += rows_count
+            if value is not None:
+                values[get_counter_key(model, value)] = rows_count
+
+        stale = [key for key in client.scan_iter(
+                     match=f'{get_counter_key(model)}:*')
+                 if key.decode() not in values]
+        pipe = client.pipeline()
+        for key, value in values.items():
+            pipe.set(key, value, ex=settings.COUNTER_TTL)
+        if stale:
+            pipe.delete(*stale)
+        pipe.execute()
+        written += len(values)
+    return written
+
+
+def count(queryset):
+    """
+    Return an exact or estimated number of rows in the queryset.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    if get_table_size(queryset.model, connection) < settings.COUNTER_EXACT_THRESHOLD:
+        return queryset.count()
+
+    if get_exact_filters(queryset) is None:
+        return queryset.count()
+    key = get_queryset_counter_key(queryset)
+    if key is None:
+        return get_planner_estimate(queryset, connection)
+
+    client = redis_client.get_client()
+    if client is None:
+        return queryset.count()
+    try:
+        value = client.get(key)
+        if value is not None:
+            return max(int(value), 0)
+        value = queryset.count()
+        client.set(key, value, ex=settings.COUNTER_TTL, nx=True)
+        return value
+    except RedisError:
+        return queryset.count()
+
+
+def get_table_size(model, connection):
+    """
+    Return the planner's row estimate for the model table, cached briefly.
+    A table that was never analyzed is reported as empty.
+    """
+    table = model._meta.db_table
+    cached = _table_sizes.get(table)
+    if cached is not None and cached[1] > time.monotonic():
+        return cached[0]
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                       [table])
+        row = cursor.fetchone()
+    size = max(int(row[0]), 0) if row else 0
+    _table_sizes[table] = (size, time.monotonic() + TABLE_SIZE_TTL)
+    return size
+
+
+def get_planner_estimate(queryset, connection):
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    return int(plan[0]['Plan']['Plan Rows'])
@@ -0,0 +1,379 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q, QuerySet
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from blog import counters
+
+
+TRUE_VALUES = ('1', 'true', 'yes')
+
+
+class CountedPaginator(Paginator):
+    """
+    Paginator that takes the total count from blog.counters
+    instead of running COUNT(*) on every page.
+    """
+    @cached_property
+    def count(self):
+        if isinstance(self.object_list, QuerySet):
+            return counters.count(self.object_list)
+        return super().count
+
+
+class PaginationMixin:
+    """
+    Mixin for safe pagination with fallback for invalid pages.
+    """
+    def paginate_queryset(self, queryset, request, view=None):
+        try:
+            return super().paginate_queryset(queryset, request, view)
+        except NotFound:
+            page = request.GET.get('page')
+            request._request.GET = request._request.GET.copy()
+            if not page.isdigit():
+                request._request.GET['page'] = 1
+            else:
+                paginator = self.django_paginator_class(
+                    queryset, self.get_page_size(request)
+                )
+                request._request.GET['page'] = paginator.num_pages
+            return super().paginate_queryset(queryset, request, view)
+
+
+class KeysetPaginationMixin:
+    """
+    Mixin that adds an opt-in keyset (cursor) mode to page number pagination.
+
+    The mode is enabled by the 'cursor' query parameter, an empty value
+    requests the first page. Pages are sliced with a WHERE clause built
+    from the queryset ordering plus a primary key tiebreaker, so no
+    OFFSET is used and the total count is only computed on '?count=true'.
+    The response keeps the 'count', 'next', 'previous', 'results' shape.
+    With 'keyset_only' set, every request is paginated in keyset mode.
+    Querysets ordered by expressions are paginated by page number instead.
+    """
+    keyset_only = False
+    cursor_query_param = 'cursor'
+    cursor_query_description = ('The pagination cursor value. '
+                                'Pass an empty value to start '
+                                'cursor pagination.')
+    count_query_param = 'count'
+    count_query_description = ('Include the total count in cursor mode. '
+                               'Values: true, false.')
+    invalid_cursor_message = 'Invalid cursor.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = (self.keyset_only
+                       or self.cursor_query_param in request.query_params)
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.ordering = self.get_ordering(queryset)
+        if self.ordering is None:
+            self.keyset = False
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        values, reverse = self.decode_cursor(request)
+
+        self.count = None
+        count = request.query_params.get(self.count_query_param, '')
+        if count.lower() in TRUE_VALUES:
+            self.count = queryset.count()
+
+        if values is not None:
+            try:
+                queryset = queryset.filter(
+                    self.get_keyset_filter(values, reverse)
+                )
+            except (ValidationError, ValueError, TypeError):
+                raise NotFound(self.invalid_cursor_message)
+        ordering = self.ordering
+        if reverse:
+            ordering = [self.reverse_field(field) for field in ordering]
+
+        results = list(queryset.order_by(*ordering)[:page_size + 1])
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+            self.has_next = values is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = values is not None
+
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        return Response({
+            'count': self.count,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.keyset:
+            return super().get_previous_link()
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_ordering(self, queryset):
+        """
+        Return the queryset ordering with a primary key tiebreaker, or None
+        if it contains expressions, which cursors can not encode.
+        """
+        pk = queryset.model._meta.pk.attname
+        if queryset.query.order_by:
+            ordering = list(queryset.query.order_by)
+        elif queryset.query.default_ordering:
+            ordering = list(queryset.model._meta.ordering)
+        else:
+            ordering = []
+
+        if any(not isinstance(field, str) for field in ordering):
+            return None
+        ordering = [
+            field.replace('pk', pk) if field.lstrip('-') == 'pk' else field
+            for field in ordering
+        ]
+        if pk not in [field.lstrip('-') for field in ordering]:
+            descending = bool(ordering) and ordering[0].startswith('-')
+            ordering.append(f'-{pk}' if descending else pk)
+        return ordering
+
+    def get_keyset_filter(self, values, reverse):
+        """
+        Build the lexicographic "after the cursor row" condition.
+        """
+        if len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        condition = Q()
+        for index, field in enumerate(self.ordering):
+            descending = field.startswith('-')
+            lookup = 'lt' if descending != reverse else 'gt'
+            row = Q(**{f'{field.lstrip("-")}__{lookup}': values[index]})
+            for previous, value in zip(self.ordering[:index], values):
+                row &= Q(**{previous.lstrip('-'): value})
+            condition |= row
+        return condition
+
+    def encode_cursor(self, obj, reverse):
+        values = [self.get_value(obj, field.lstrip('-'))
+                  for field in self.ordering]
+        payload = json.dumps({'v': values, 'r': int(reverse)},
+                             default=str, separators=(',', ':'))
+        cursor = urlsafe_b64encode(payload.encode()).decode()
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        """
+        Return the cursor row values and direction, or (None, False)
+        for the first page.
+        """
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+        try:
+            payload = json.loads(urlsafe_b64decode(cursor.encode()))
+            return list(payload['v']), bool(payload['r'])
+        except (BinasciiError, ValueError, TypeError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def get_value(obj, attr):
+        if isinstance(obj, dict):
+            return obj[attr]
+        return getattr(obj, attr)
+
+    @staticmethod
+    def reverse_field(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['count']['nullable'] = True
+        return response_schema
+
+    def get_schema_operation_parameters(self, view):
+        parameters = super().get_schema_operation_parameters(view)
+        if self.keyset_only:
+            parameters = [parameter for parameter in parameters
+                          if parameter['name'] != self.page_query_param]
+        parameters += [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': self.cursor_query_description,
+                'schema': {
+                    'type': 'string',
+                },
+            },
+            {
+                'name': self.count_query_param,
+                'required': False,
+                'in': 'query',
+                'description': self.count_query_description,
+                'schema': {
+                    'type': 'boolean',
+                },
+            },
+        ]
+        return parameters
+
+
+class ThreadPagination(BasePagination):
+    """
+    Keyset pagination over the threads of a materialized path tree.
+
+    A page holds 'page_size' top-level rows with their replies at any
+    depth, read as one range of the path ordering: from the path of the
+    page's first top-level row up to that of the next page's, which is
+    the cursor of the next page. Top-level rows are those matching
+    'root_filter'.
+    """
+    page_size = None
+    page_size_query_param = 'page_size'
+    page_size_query_description = 'Number of threads to return per page.'
+    max_page_size = None
+    cursor_query_param = 'cursor'
+    cursor_query_description = 'The pagination cursor value.'
+    path_field = 'path'
+    root_filter = {'parent__isnull': True}
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        path = self.path_field
+        self.cursor = request.query_params.get(self.cursor_query_param, '')
+        roots = queryset.filter(**self.root_filter).values_list(
+            path, flat=True)
+        boundary = list(roots.filter(
+            **{f'{path}__gte': self.cursor}
+        ).order_by(path)[page_size:page_size + 1])
+        self.next_cursor = boundary[0] if boundary else None
+
+        self.previous_cursor = None
+        if self.cursor:
+            previous = list(roots.filter(
+                **{f'{path}__lt': self.cursor}
+            ).order_by(f'-{path}')[:page_size])
+            if previous:
+                self.previous_cursor = (previous[-1]
+                                        if len(previous) == page_size else '')
+
+        rows = queryset.filter(**{f'{path}__gte': self.cursor})
+        if self.next_cursor is not None:
+            rows = rows.filter(**{f'{path}__lt': self.next_cursor})
+        return list(rows.order_by(path))
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                return _positive_int(
+                    request.query_params[self.page_size_query_param],
+                    strict=True,
+                    cutoff=self.max_page_size
+                )
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': None,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return self.get_link(self.next_cursor)
+
+    def get_previous_link(self):
+        if self.previous_cursor is None:
+            return None
+        return self.get_link(self.previous_cursor)
+
+    def get_link(self, cursor):
+        url = self.request.build_absolute_uri()
+        if not cursor:
+            return remove_query_param(url, self.cursor_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'count': {
+                    'type': 'integer',
+                    'nullable': True,
+                },
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                    'format': 'uri',
+                },
+                'previous': {
+                    'type': 'string',
+                    'nullable': True,
+                    'format': 'uri',
+                },
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': self.cursor_query_description,
+                'schema': {
+                    'type': 'string',
+                },
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': self.page_size_query_description,
+                'schema': {
+                    'type': 'integer',
+                },
+            },
+        ]
@@ -0,0 +1,209 @@
+"""
+Query planning from serializer fields.
+
+The planner walks the fields of a serializer and applies to a queryset
+exactly the select_related() joins, prefetch_related() lookups and only()
+columns that the serializer renders. Fields whose data cannot be derived
+from their source, such as SerializerMethodField, declare it in
+'Meta.field_sources' as a lookup path, a Prefetch or a list of them:
+
+    class Meta:
+        field_sources = {
+            'author_username': 'author__username',
+            'comments': Prefetch('comments', to_attr='first_comments'),
+        }
+
+StringRelatedField is read from the column named by the related model's
+'STR_FIELD', which must be the column its __str__() renders.
+
+If any rendered field is left undeclared the columns are not restricted,
+apart from stored generated columns the serializer does not render, such
+as search vectors, which are never loaded.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import GeneratedField, Prefetch
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+
+def get_str_path(model, path):
+    """
+    Return the lookup path of the column that __str__() of the object at
+    the forward relation 'path' renders, or None if its model does not
+    declare 'STR_FIELD'.
+    """
+    for part in path.split('__'):
+        try:
+            field = model._meta.get_field(part)
+        except FieldDoesNotExist:
+            return None
+        if not field.is_relation or field.many_to_many or field.one_to_many:
+            return None
+        model = field.related_model
+    str_field = getattr(model, 'STR_FIELD', None)
+    if str_field is None:
+        return None
+    return f'{path}__{str_field}'
+
+
+class QueryPlan:
+    """
+    Joins, prefetches and columns needed to render a serializer.
+    """
+    def __init__(self, model):
+        self.model = model
+        self.select = set()
+        self.prefetch = []
+        self.columns = set()
+        self.whole = set()
+        self.complete = True
+
+    def add_path(self, path, whole=False):
+        """
+        Add a lookup path like 'author__username' or 'tags'.
+
+        Forward relations are joined, many-valued relations are prefetched.
+        A path ending on a forward relation loads the whole related object
+        if 'whole' is set, otherwise only its foreign key column.
+        """
+        model = self.model
+        parts = path.split('__')
+        for index, part in enumerate(parts):
+            prefix = '__'.join(parts[:index + 1])
+            try:
+                field = model._meta.get_field(part)
+            except FieldDoesNotExist:
+                self.complete = False
+                return
+            if not field.is_relation or part != field.name:
+                # Plain columns and foreign key attnames like 'author_id'.
+                self.columns.add(prefix)
+                return
+            if field.many_to_many or field.one_to_many:
+                self.add_prefetch(prefix)
+                return
+            self.select.add(prefix)
+            self.columns.add(prefix)
+            if index == len(parts) - 1 and whole:
+                self.whole.add(prefix)
+            model = field.related_model
+
+    def add_prefetch(self, lookup):
+        to_attr = getattr(lookup, 'prefetch_to', lookup)
+        for existing in self.prefetch:
+            if getattr(existing, 'prefetch_to', existing) == to_attr:
+                return
+        self.prefetch.append(lookup)
+
+    def add_source(self, source):
+        if isinstance(source, (list, tuple)):
+            for item in source:
+                self.add_source(item)
+        elif isinstance(source, Prefetch):
+            self.add_prefetch(source)
+        else:
+            self.add_path(source)
+
+    def add_field(self, field, field_sources):
+        if field.write_only:
+            return
+        if field.field_name in field_sources:
+            self.add_source(field_sources[field.field_name])
+            return
+        if isinstance(field, serializers.SerializerMethodField):
+            self.complete = False
+            return
+        if field.source == '*':
+            self.complete = False
+            return
+
+        path = '__'.join(field.source_attrs)
+        if (isinstance(field, serializers.StringRelatedField)
+                and get_str_path(self.model, path) is not None):
+            self.add_path(get_str_path(self.model, path))
+        elif isinstance(field, serializers.PrimaryKeyRelatedField):
+            self.add_path(path)
+        elif isinstance(field, (serializers.RelatedField,
+                                serializers.ManyRelatedField,
+                                serializers.BaseSerializer)):
+            self.add_path(path, whole=True)
+        else:
+            self.add_path(path)
+
+    def get_only_fields(self):
+        pk = self.model._meta.pk.name
+        columns = {pk}
+        for column in self.columns:
+            relation = column.rpartition('__')[0]
+            if column in self.whole or not any(
+                    relation == whole or relation.startswith(f'{whole}__')
+                    for whole in self.whole):
+                columns.add(column)
+        return sorted(columns)
+
+    def get_deferred_fields(self):
+        return [field.name for field in self.model._meta.concrete_fields
+                if isinstance(field, GeneratedField)
+                and field.name not in self.columns]
+
+    def apply(self, queryset, defer=True):
+        # Ordering columns are read by keyset pagination.
+        if queryset.query.order_by:
+            ordering = queryset.query.order_by
+        elif queryset.query.default_ordering:
+            ordering = queryset.model._meta.ordering
+        else:
+            ordering = []
+        for field in ordering:
+            name = field.lstrip('-') if isinstance(field, str) else None
+            if name and name != 'pk' and name not in queryset.query.annotations:
+                self.columns.add(name)
+
+        if self.select:
+            queryset = queryset.select_related(*sorted(self.select))
+        if self.prefetch:
+            queryset = queryset.prefetch_related(*self.prefetch)
+        if defer and self.complete:
+            queryset = queryset.only(*self.get_only_fields())
+        elif self.get_deferred_fields():
+            queryset = queryset.defer(*self.get_deferred_fields())
+        return queryset
+
+
+def get_query_plan(model, serializer):
+    """
+    Build the QueryPlan for rendering 'model' instances with 'serializer'.
+    """
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    meta = getattr(serializer, 'Meta', None)
+    field_sources = getattr(meta, 'field_sources', {})
+
+    plan = QueryPlan(model)
+    for field in serializer.fields.values():
+        plan.add_field(field, field_sources)
+    return plan
+
+
+def plan_queryset(queryset, serializer, defer=True):
+    """
+    Apply the serializer's query plan to the queryset. Columns are
+    restricted with only() when 'defer' is set.
+    """
+    return get_query_plan(queryset.model, serializer).apply(queryset, defer)
+
+
+class QueryPlanMixin:
+    """
+    Mixin for generic views that shapes the queryset after the serializer
+    of the current request. Columns are only restricted for safe methods,
+    so that instances saved by write actions are fully loaded.
+    """
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        serializer_class = self.get_serializer_class()
+        if not (isinstance(serializer_class, type)
+                and issubclass(serializer_class, serializers.BaseSerializer)):
+            return queryset
+        return plan_queryset(queryset, self.get_serializer(),
+                             defer=self.request.method in SAFE_METHODS)
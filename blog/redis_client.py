@@ -0,0 +1,294 @@
+"""
+Process-wide Redis client.
+
+All Redis access, including the Django cache, goes through one client
+that is created on first use with a bounded, blocking connection pool,
+connect and read timeouts and periodic health checks. The pool checks
+the process id on every use and starts over with fresh connections in a
+forked child, so the client is safe to create before gunicorn forks its
+workers.
+
+Async views use an asyncio client per event loop, configured the same
+way, whose connections belong to that loop. The Django cache reads and
+writes through it in aget_many() and aset(). Its pool takes
+REDIS_ASYNC_MAX_CONNECTIONS of the REDIS_MAX_CONNECTIONS of the process,
+and the shared client keeps the rest; uvicorn workers run a single loop.
+
+Writes that must only happen if a database transaction commits are queued
+with on_commit() and sent in a single pipeline after the commit.
+
+The settings check at startup that REDIS_MAX_CONNECTIONS leaves the shared
+client at least one connection.
+"""
+import asyncio
+import os
+import threading
+from weakref import WeakKeyDictionary
+import django
+from django.conf import settings
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.redis import RedisCache, RedisCacheClient
+from django.db import transaction
+from redis import BlockingConnectionPool, StrictRedis
+from redis import asyncio as aioredis
+
+
+_client = None
+_lock = threading.Lock()
+_async_clients = WeakKeyDictionary()
+
+
+class StatsConnectionPool(BlockingConnectionPool):
+    """
+    Blocking connection pool that records its peak usage and how often
+    callers had to wait for a free connection.
+    """
+    def reset(self):
+        self.peak_in_use = 0
+        self.waits = 0
+        super().reset()
+
+    def get_connection(self, *args, **kwargs):
+        if self.pool.empty():
+            self.waits += 1
+        connection = super().get_connection(*args, **kwargs)
+        self.peak_in_use = max(self.peak_in_use, self.get_in_use())
+        return connection
+
+    def get_in_use(self):
+        # The queue holds idle connections and placeholders
+        # for connections that are not created yet.
+        return self.max_connections - self.pool.qsize()
+
+    def get_stats(self):
+        created = len(self._connections)
+        in_use = self.get_in_use()
+        return {
+            'max_connections': self.max_connections,
+            'created': created,
+            'in_use': in_use,
+            'idle': created - in_use,
+            'peak_in_use': self.peak_in_use,
+            'waits': self.waits,
+        }
+
+
+class AsyncStatsConnectionPool(aioredis.BlockingConnectionPool):
+    """
+    Asyncio counterpart of StatsConnectionPool.
+    """
+    def __init__(self, *args, **kwargs):
+        self.peak_in_use = 0
+        self.waits = 0
+        super().__init__(*args, **kwargs)
+
+    async def get_connection(self, *args, **kwargs):
+        if not self.can_get_connection():
+            self.waits += 1
+        connection = await super().get_connection(*args, **kwargs)
+        self.peak_in_use = max(self.peak_in_use, self.get_in_use())
+        return connection
+
+    def get_in_use(self):
+        return len(self._in_use_connections)
+
+    def get_stats(self):
+        in_use = self.get_in_use()
+        idle = len(self._available_connections)
+        return {
+            'max_connections': self.max_connections,
+            'created': in_use + idle,
+            'in_use': in_use,
+            'idle': idle,
+            'peak_in_use': self.peak_in_use,
+            'waits': self.waits,
+        }
+
+
+def get_client():
+    """
+    Return the shared Redis client, or None if REDIS_URL is not set.
+    """
+    global _client
+    if not settings.REDIS_URL:
+        return None
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = StrictRedis(connection_pool=create_pool())
+    return _client
+
+
+def create_pool():
+    return StatsConnectionPool.from_url(
+        settings.REDIS_URL,
+        max_connections=(settings.REDIS_MAX_CONNECTIONS
+                         - settings.REDIS_ASYNC_MAX_CONNECTIONS),
+        timeout=settings.REDIS_POOL_TIMEOUT,
+        socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT,
+        socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+    )
+
+
+def get_async_client():
+    """
+    Return the asyncio Redis client of the running event loop,
+    or None if REDIS_URL is not set.
+    """
+    if not settings.REDIS_URL:
+        return None
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = aioredis.StrictRedis(
+            connection_pool=create_async_pool())
+    return client
+
+
+def create_async_pool():
+    return AsyncStatsConnectionPool.from_url(
+        settings.REDIS_URL,
+        max_connections=settings.REDIS_ASYNC_MAX_CONNECTIONS,
+        timeout=settings.REDIS_POOL_TIMEOUT,
+        socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT,
+        socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+    )
+
+
+def get_pool_stats():
+    """
+    Return the connection pool usage of the current process: of the
+    shared client, and in 'async' of the asyncio client of each loop.
+    """
+    client = get_client()
+    if client is None:
+        return None
+    return {
+        'pid': os.getpid(),
+        **client.connection_pool.get_stats(),
+        'async': [async_client.connection_pool.get_stats()
+                  for async_client in list(_async_clients.values())],
+    }
+
+
+class CommitPipeline:
+    """
+    Functions queued in one savepoint of a transaction, called with
+    a single pipeline once the transaction commits.
+    """
+    def __init__(self):
+        self.funcs = []
+
+    def execute(self):
+        with get_client().pipeline() as pipe:
+            for func in self.funcs:
+                func(pipe)
+            pipe.execute()
+
+
+def on_commit(func, using=None):
+    """
+    Call 'func' with a Redis pipeline to queue commands on once the current
+    transaction commits, or right away outside of a transaction.
+
+    Functions queued in the same savepoint share one pipeline, so they cost
+    a single round trip, and are dropped if the savepoint is rolled back.
+    Errors are logged without failing the committed transaction. Nothing
+    is queued if Redis is not configured.
+    """
+    if get_client() is None:
+        return
+    batch = get_commit_pipeline(transaction.get_connection(using))
+    if batch is not None:
+        batch.funcs.append(func)
+        return
+    batch = CommitPipeline()
+    batch.funcs.append(func)
+    transaction.on_commit(batch.execute, using=using, robust=True)
+
+
+def get_commit_pipeline(connection):
+    """
+    Return the CommitPipeline queued in the current savepoint of the
+    connection, or None.
+
+    Django has no public API to list the callbacks of a transaction, so
+    this reads the connection's run_on_commit list of (savepoint ids,
+    callback, robust) tuples, as of Django 5. With other versions every
+    function gets a pipeline of its own.
+    """
+    if django.VERSION[0] != 5 or not connection.in_atomic_block:
+        return None
+    sids = set(connection.savepoint_ids)
+    for callback_sids, callback, _ in connection.run_on_commit:
+        batch = getattr(callback, '__self__', None)
+        if isinstance(batch, CommitPipeline) and callback_sids == sids:
+            return batch
+    return None
+
+
+class SharedRedisCacheClient(RedisCacheClient):
+    def _get_connection_pool(self, write):
+        return get_client().connection_pool
+
+    def set_many(self, data, timeout, pipeline=None):
+        if pipeline is None:
+            return super().set_many(data, timeout)
+        pipeline.mset({k: self._serializer.dumps(v) for k, v in data.items()})
+        if timeout is not None:
+            for key in data:
+                pipeline.expire(key, timeout)
+
+    async def aset(self, key, value, timeout):
+        client = get_async_client()
+        value = self._serializer.dumps(value)
+        if timeout == 0:
+            await client.delete(key)
+        else:
+            await client.set(key, value, ex=timeout)
+
+    async def aget_many(self, keys):
+        client = get_async_client()
+        ret = await client.mget(keys)
+        return {
+            k: self._serializer.loads(v) for k, v in zip(keys, ret)
+            if v is not None
+        }
+
+
+class SharedRedisCache(RedisCache):
+    """
+    Redis cache backend that uses the connection pool of the shared client,
+    and the asyncio client of the running event loop in aget_many()
+    and aset().
+    """
+    def __init__(self, server, params):
+        super().__init__(server, params)
+        self._class = SharedRedisCacheClient
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None,
+                 pipeline=None):
+        """
+        Set the values, queueing the commands on 'pipeline' if given.
+        """
+        if not data:
+            return []
+        safe_data = {self.make_and_validate_key(key, version=version): value
+                     for key, value in data.items()}
+        self._cache.set_many(safe_data, self.get_backend_timeout(timeout),
+                             pipeline=pipeline)
+        return []
+
+    async def aset(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        await self._cache.aset(key, value, self.get_backend_timeout(timeout))
+
+    async def aget_many(self, keys, version=None):
+        key_map = {
+            self.make_and_validate_key(key, version=version): key
+            for key in keys
+        }
+        ret = await self._cache.aget_many(list(key_map))
+        return {key_map[k]: v for k, v in ret.items()}
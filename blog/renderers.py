@@ -0,0 +1,76 @@
+"""
+JSON rendering and parsing with orjson.
+
+ORJSONRenderer produces the same output as DRF's JSONRenderer with the
+default COMPACT_JSON and UNICODE_JSON settings, apart from floats: orjson
+writes exponents without a plus sign or leading zeros (1e20 and 1.5e-7
+instead of 1e+20 and 1.5e-07, the same values), and renders NaN and
+infinities as null where JSONRenderer raises with STRICT_JSON. Datetimes,
+which orjson formats differently, and types it does not support natively,
+such as Decimal and lazy strings, are converted by DRF's JSONEncoder.
+"""
+import orjson
+from django.conf import settings
+from drf_spectacular.renderers import OpenApiJsonRenderer
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    Renderer which serializes to JSON with orjson.
+
+    orjson only supports an indent of two spaces, which is used
+    for any requested indent.
+    """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        renderer_context = renderer_context or {}
+        option = ORJSON_OPTIONS
+        if self.get_indent(accepted_media_type, renderer_context):
+            option |= orjson.OPT_INDENT_2
+
+        ret = orjson.dumps(data, default=self.encoder_class().default,
+                           option=option)
+        # Escape the line and paragraph separators like JSONRenderer,
+        # they are valid in JSON but not in JavaScript.
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(
+            b'\xe2\x80\xa9', b'\\u2029')
+
+
+class ORJSONParser(JSONParser):
+    """
+    Parses JSON-serialized data with orjson.
+    """
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        data = stream.read()
+        try:
+            if encoding.lower().replace('-', '') != 'utf8':
+                data = data.decode(encoding)
+            return orjson.loads(data)
+        except (UnicodeDecodeError, orjson.JSONDecodeError) as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
+
+
+class OpenApiORJSONRenderer(ORJSONRenderer):
+    """
+    Renderer for the OpenAPI schema in JSON format.
+    """
+    media_type = OpenApiJsonRenderer.media_type
+
+    def get_indent(self, accepted_media_type, renderer_context):
+        return super().get_indent(accepted_media_type, renderer_context) or 2
+
+
+class OpenApiORJSONRenderer2(OpenApiORJSONRenderer):
+    media_type = 'application/json'
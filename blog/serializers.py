@@ -0,0 +1,137 @@
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import models
+from rest_framework import serializers
+
+
+class SparseFieldsMixin:
+    """
+    Mixin for model serializers that selects the rendered fields with
+    the 'fields' and 'expand' query parameters.
+
+    Fields listed in 'Meta.expandable_fields' are expensive sections
+    that are only rendered if named in 'expand':
+
+    - '?fields=id,title' renders the listed fields plus the expanded ones;
+    - '?expand=comments' renders all other fields plus the expanded ones;
+    - without both parameters all fields are rendered.
+
+    Unknown field names are ignored. Only the top level serializer is
+    trimmed, and since views plan their queries from the serializer
+    fields, skipped fields are not loaded either.
+
+    Fields in 'required_fields' are always rendered, e.g. for
+    finalize_representation(); the ones that were not selected are
+    listed in 'hidden_fields' and are for the serializer to drop.
+    """
+    fields_query_param = 'fields'
+    expand_query_param = 'expand'
+    hidden_fields = ()
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is None or not self.is_top_level():
+            return fields
+
+        only = self.get_query_param_names(request, self.fields_query_param)
+        expand = self.get_query_param_names(request, self.expand_query_param)
+        if only is None and expand is None:
+            return fields
+
+        expandable = set(getattr(self.Meta, 'expandable_fields', ()))
+        expand = set(expand or ()) & expandable
+        if only is None:
+            selected = (set(fields) - expandable) | expand
+        else:
+            selected = set(only) | expand
+        self.hidden_fields = (
+            set(getattr(self, 'required_fields', ())) - selected)
+        selected |= self.hidden_fields
+        return {name: field for name, field in fields.items()
+                if name in selected}
+
+    def is_top_level(self):
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        return parent is None
+
+    @staticmethod
+    def get_query_param_names(request, param):
+        """
+        Return the comma separated names of the query parameter,
+        or None if it is absent or empty.
+        """
+        value = request.query_params.get(param)
+        if not value:
+            return None
+        names = [name.strip() for name in value.split(',')]
+        return [name for name in names if name] or None
+
+
+class PrimaryKeyOrderedListSerializer(serializers.ListSerializer):
+    """
+    List serializer that renders related objects ordered by primary key,
+    the order ValuesSerializer loads them in.
+
+    The objects are sorted in Python, so prefetched ones are not queried
+    again.
+    """
+    def to_representation(self, data):
+        if isinstance(data, models.manager.BaseManager):
+            data = data.all()
+        data = sorted(data, key=lambda obj: obj.pk)
+        return super().to_representation(data)
+
+
+class AsyncValidationMixin:
+    """
+    Mixin for serializers of async views.
+
+    ais_valid() runs the field validation in a thread, like is_valid(),
+    and then awaits avalidate() in place of validate(), so that expensive
+    object level checks, e.g. password checks, are awaited instead of
+    holding a thread. By default avalidate() runs validate() in a thread.
+    """
+    async def avalidate(self, attrs):
+        return await sync_to_async(self.validate)(attrs)
+
+    def run_field_validation(self, data):
+        """
+        Return the values of run_validation(), without calling validate().
+        """
+        value = self.to_internal_value(data)
+        try:
+            self.run_validators(value)
+        except (serializers.ValidationError, DjangoValidationError) as exc:
+            raise serializers.ValidationError(
+                detail=serializers.as_serializer_error(exc))
+        return value
+
+    async def arun_validation(self, data):
+        is_empty_value, data = self.validate_empty_values(data)
+        if is_empty_value:
+            return data
+        value = await sync_to_async(self.run_field_validation)(data)
+        try:
+            value = await self.avalidate(value)
+        except (serializers.ValidationError, DjangoValidationError) as exc:
+            raise serializers.ValidationError(
+                detail=serializers.as_serializer_error(exc))
+        return value
+
+    async def ais_valid(self, *, raise_exception=False):
+        if not hasattr(self, '_validated_data'):
+            try:
+                self._validated_data = await self.arun_validation(
+                    self.initial_data)
+            except serializers.ValidationError as exc:
+                self._validated_data = {}
+                self._errors = exc.detail
+            else:
+                self._errors = {}
+
+        if self._errors and raise_exception:
+            raise serializers.ValidationError(self.errors)
+        return not bool(self._errors)
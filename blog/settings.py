@@ -14,6 +14,7 @@ import os
 from dotenv import load_dotenv
 from pathlib import Path
 from datetime import timedelta
+from django.core.exceptions import ImproperlyConfigured
 
 load_dotenv()
 
@@ -55,6 +56,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 ]
 
 MIDDLEWARE = [
@@ -148,9 +150,24 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'accounts.User'
 
+AUTHENTICATION_BACKENDS = ['accounts.backends.ModelBackend']
+
+BROWSABLE_API = os.environ.get('BROWSABLE_API', str(DEBUG)) == 'True'
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.CachedJWTAuthentication',
+    ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'blog.renderers.ORJSONRenderer',
+    ) + (
+        ('rest_framework.renderers.BrowsableAPIRenderer',)
+        if BROWSABLE_API else ()
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'blog.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ),
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
 }
@@ -160,6 +177,9 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(minutes=30),
     'ROTATE_REFRESH_TOKENS': False,
     'BLACKLIST_AFTER_ROTATION': True,
+    'TOKEN_OBTAIN_SERIALIZER': 'accounts.tokens.TokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'accounts.tokens.TokenRefreshSerializer',
+    'TOKEN_BLACKLIST_SERIALIZER': 'accounts.tokens.TokenBlacklistSerializer',
 }
 
 CORS_ALLOW_ALL_ORIGINS = True
@@ -168,6 +188,82 @@ INTERNAL_IPS = ['127.0.0.1']
 
 REDIS_URL = os.environ.get('REDIS_URL')
 
+# Connections to Redis per process and the number of seconds to wait for
+# a free one before failing. REDIS_ASYNC_MAX_CONNECTIONS of them belong to
+# the asyncio client of async views, the rest to the shared client.
+REDIS_MAX_CONNECTIONS = int(os.environ.get('REDIS_MAX_CONNECTIONS', 10))
+REDIS_ASYNC_MAX_CONNECTIONS = int(
+    os.environ.get('REDIS_ASYNC_MAX_CONNECTIONS', 4)
+)
+REDIS_POOL_TIMEOUT = float(os.environ.get('REDIS_POOL_TIMEOUT', 5))
+REDIS_CONNECT_TIMEOUT = float(os.environ.get('REDIS_CONNECT_TIMEOUT', 2))
+REDIS_SOCKET_TIMEOUT = float(os.environ.get('REDIS_SOCKET_TIMEOUT', 2))
+REDIS_HEALTH_CHECK_INTERVAL = int(
+    os.environ.get('REDIS_HEALTH_CHECK_INTERVAL', 30)
+)
+if REDIS_URL and not 0 < REDIS_ASYNC_MAX_CONNECTIONS < REDIS_MAX_CONNECTIONS:
+    raise ImproperlyConfigured(
+        'REDIS_ASYNC_MAX_CONNECTIONS must be at least 1 and less than '
+        'REDIS_MAX_CONNECTIONS, the rest of which the shared Redis '
+        'client uses.'
+    )
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'blog.redis_client.SharedRedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+
+# Lifetime of users cached for JWT authentication, in seconds, in the
+# shared cache and in the LRU cache of each process, and its size.
+USER_CACHE_TIMEOUT = int(os.environ.get('USER_CACHE_TIMEOUT', 300))
+USER_LOCAL_CACHE_TIMEOUT = int(os.environ.get('USER_LOCAL_CACHE_TIMEOUT', 5))
+USER_LOCAL_CACHE_SIZE = int(os.environ.get('USER_LOCAL_CACHE_SIZE', 1000))
+
+# Threads hashing passwords for async views in each process, and the
+# number of calls that may wait for a free one before failing with 503.
+PASSWORD_HASHING_WORKERS = int(os.environ.get('PASSWORD_HASHING_WORKERS', 2))
+PASSWORD_HASHING_QUEUE_SIZE = int(
+    os.environ.get('PASSWORD_HASHING_QUEUE_SIZE', 32)
+)
+
+# Lifetime of cached anonymous post responses, in seconds.
+POST_CACHE_TIMEOUT = int(os.environ.get('POST_CACHE_TIMEOUT', 300))
+
+# Tables with fewer rows than this are paginated with an exact COUNT(*),
+# larger ones use counters kept in Redis or planner estimates.
+COUNTER_EXACT_THRESHOLD = int(os.environ.get('COUNTER_EXACT_THRESHOLD', 10000))
+
+COUNTER_TTL = int(os.environ.get('COUNTER_TTL', 3600))
+
+# Buffer changes of post likes, dislikes and comment counts in Redis,
+# to be applied by the 'flush_post_counters' command.
+COUNTER_WRITE_BEHIND = os.environ.get('COUNTER_WRITE_BEHIND', 'False') == 'True'
+
+# Trending post windows by name with the half-life of events in seconds,
+# None for no decay, and the number of posts ranked in each window.
+TRENDING_WINDOWS = {
+    '24h': 24 * 60 * 60,
+    '7d': 7 * 24 * 60 * 60,
+    'all': None,
+}
+TRENDING_DEFAULT_WINDOW = 'all'
+TRENDING_SIZE = int(os.environ.get('TRENDING_SIZE', 100))
+
+# Weights of the post counters in trending scores.
+TRENDING_WEIGHTS = {
+    'likes': 1.0,
+    'dislikes': -1.0,
+    'comments_count': 2.0,
+}
+
+# Minimum trigram similarity of post titles found by search.
+SEARCH_SIMILARITY_THRESHOLD = float(
+    os.environ.get('SEARCH_SIMILARITY_THRESHOLD', 0.1)
+)
+
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Blog',
     'DESCRIPTION': 'Documentation for blog',
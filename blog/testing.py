@@ -0,0 +1,43 @@
+"""
+Test helpers.
+
+Needs the packages in requirements-dev.txt.
+"""
+from unittest import mock
+import fakeredis
+from fakeredis import aioredis as fake_aioredis
+
+
+# Cache settings for the shared client, which FakeRedisMixin replaces.
+SHARED_REDIS_CACHES = {
+    'default': {
+        'BACKEND': 'blog.redis_client.SharedRedisCache',
+        'LOCATION': 'redis://localhost:6379/0',
+    }
+}
+
+
+class FakeRedisMixin:
+    """
+    Mixin for test cases that replaces the shared Redis client and the
+    asyncio clients with in-memory ones on one fake server.
+
+    In TestCase, commands queued with redis_client.on_commit() are only
+    sent by callbacks run with captureOnCommitCallbacks(execute=True).
+    """
+    def setUp(self):
+        super().setUp()
+        self.redis_server = fakeredis.FakeServer()
+        self.redis = fakeredis.FakeStrictRedis(server=self.redis_server)
+        patchers = [
+            mock.patch('blog.redis_client.get_client',
+                       return_value=self.redis),
+            mock.patch('blog.redis_client.get_async_client',
+                       side_effect=self.get_async_redis),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def get_async_redis(self):
+        return fake_aioredis.FakeRedis(server=self.redis_server)
@@ -0,0 +1,92 @@
+from datetime import datetime, timezone
+from decimal import Decimal
+from io import BytesIO
+from unittest import mock
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TransactionTestCase
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from blog import redis_client
+from blog.renderers import ORJSONParser, ORJSONRenderer
+from blog.testing import FakeRedisMixin
+
+
+class OnCommitTest(FakeRedisMixin, TransactionTestCase):
+    def set(self, key):
+        redis_client.on_commit(lambda pipe: pipe.set(key, 1))
+
+    def get_keys(self):
+        return sorted(key.decode() for key in self.redis.keys())
+
+    def test_savepoint_shares_pipeline(self):
+        with transaction.atomic():
+            self.set('a')
+            self.set('b')
+            with transaction.atomic():
+                self.set('c')
+                self.set('d')
+            self.assertEqual(len(connection.run_on_commit), 2)
+            self.assertEqual(self.get_keys(), [])
+        self.assertEqual(self.get_keys(), ['a', 'b', 'c', 'd'])
+
+    def test_rolled_back_savepoint_is_dropped(self):
+        with transaction.atomic():
+            self.set('a')
+            try:
+                with transaction.atomic():
+                    self.set('b')
+                    raise ValueError
+            except ValueError:
+                pass
+            self.set('c')
+        self.assertEqual(self.get_keys(), ['a', 'c'])
+
+    def test_outside_transaction(self):
+        self.set('a')
+        self.assertEqual(self.get_keys(), ['a'])
+
+    def test_other_django_versions(self):
+        with mock.patch('django.VERSION', (6, 0, 0, 'final', 0)):
+            with transaction.atomic():
+                self.set('a')
+                self.set('b')
+                self.assertEqual(len(connection.run_on_commit), 2)
+        self.assertEqual(self.get_keys(), ['a', 'b'])
+
+    def test_error_is_not_raised(self):
+        # The pipeline is a Redis transaction, aborted as a whole.
+        with transaction.atomic():
+            self.set('a')
+            redis_client.on_commit(lambda pipe: pipe.execute_command('NOPE'))
+        self.assertEqual(self.get_keys(), [])
+
+
+class ORJSONTest(SimpleTestCase):
+    def test_renders_like_json_renderer(self):
+        data = {
+            'id': 1,
+            'title': 'Caf\u00e9 \u2028 \u2029 "quoted"',
+            'likes': 1.5,
+            'price': Decimal('1.10'),
+            'label': gettext_lazy('Posts'),
+            'publish': datetime(2024, 1, 2, 3, 4, 5, 678901,
+                                tzinfo=timezone.utc),
+            'tags': [{'id': 2, 'name': 'python'}],
+            'counts': {3: None, 'active': True},
+        }
+        self.assertEqual(ORJSONRenderer().render(data),
+                         JSONRenderer().render(data))
+        self.assertEqual(ORJSONRenderer().render(None), b'')
+
+    def test_parse(self):
+        parser = ORJSONParser()
+        self.assertEqual(parser.parse(BytesIO('{"title": "Caf\u00e9"}'
+                                              .encode())),
+                         {'title': 'Caf\u00e9'})
+        self.assertEqual(
+            parser.parse(BytesIO('["Caf\u00e9"]'.encode('latin-1')),
+                         parser_context={'encoding': 'latin-1'}),
+            ['Caf\u00e9'])
+        with self.assertRaises(ParseError):
+            parser.parse(BytesIO(b'{"title": '))
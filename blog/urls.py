@@ -19,6 +19,12 @@ from django.urls import path, include
 from drf_spectacular.views import (SpectacularAPIView,
                                    SpectacularSwaggerView,
                                    SpectacularRedocView)
+from drf_spectacular.renderers import OpenApiYamlRenderer, OpenApiYamlRenderer2
+from blog.renderers import OpenApiORJSONRenderer, OpenApiORJSONRenderer2
+from blog.views import RedisPoolStatsAPIView
+
+SCHEMA_RENDERER_CLASSES = [OpenApiYamlRenderer, OpenApiYamlRenderer2,
+                           OpenApiORJSONRenderer, OpenApiORJSONRenderer2]
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -27,7 +33,10 @@ urlpatterns = [
 
     path('api/v1/content/', include('content.api.v1.urls')),
     path('api/v2/content/', include('content.api.v2.urls')),
-    path('api/schema/', SpectacularAPIView.as_view(),
+    path('api/redis/stats/', RedisPoolStatsAPIView.as_view(),
+         name='redis_stats'),
+    path('api/schema/',
+         SpectacularAPIView.as_view(renderer_classes=SCHEMA_RENDERER_CLASSES),
          name='schema'),
     path('api/schema/swagger/', SpectacularSwaggerView.as_view(),
          name='swagger'),
@@ -0,0 +1,224 @@
+"""
+Read-only serialization of list pages straight from values() rows.
+
+ValuesSerializer compiles a ModelSerializer once into the values() lookups
+and converters of its fields, then renders whole pages from plain rows
+without building model instances or running the serializer per row. The
+output is the same as the serializer's:
+
+- model fields are read from their column and converted with the
+  serializer field's to_representation();
+- method fields are read from their single lookup path in
+  'Meta.field_sources', e.g. 'author__username', which must be the
+  rendered value;
+- string related fields are read from the column named by the related
+  model's 'STR_FIELD', like the query planner does;
+- nested PrimaryKeyOrderedListSerializer fields are loaded for the whole
+  page in one query joined through the relation, ordered by the related
+  primary key as that serializer orders them.
+
+Serializers with other fields are not supported and are rendered as usual.
+
+A serializer can adjust the rendered items of a whole page in place in
+a 'finalize_representation(items)' method.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.response import Response
+from blog.planner import get_str_path
+from blog.serializers import PrimaryKeyOrderedListSerializer
+
+
+PASSTHROUGH_FIELDS = (serializers.BooleanField,
+                      serializers.CharField,
+                      serializers.IntegerField,
+                      serializers.ReadOnlyField)
+
+
+def is_column(model, path):
+    """
+    Check that the lookup path ends on a column of the model or of a
+    model joined through forward single-valued relations.
+    """
+    parts = path.split('__')
+    for index, part in enumerate(parts):
+        try:
+            field = model._meta.get_field(part)
+        except FieldDoesNotExist:
+            return False
+        if not field.is_relation or part != field.name:
+            return index == len(parts) - 1 and field.concrete
+        if field.many_to_many or field.one_to_many:
+            return False
+        model = field.related_model
+    return False
+
+
+def is_many_relation(model, path):
+    try:
+        field = model._meta.get_field(path)
+    except FieldDoesNotExist:
+        return False
+    return field.is_relation and (field.many_to_many or field.one_to_many)
+
+
+class ValuesSerializer:
+    """
+    Renders querysets of a model as the given serializer would.
+
+    'supported' is False if any of the serializer fields can not be
+    read from values() rows.
+    """
+    def __init__(self, serializer):
+        if isinstance(serializer, serializers.ListSerializer):
+            serializer = serializer.child
+        meta = getattr(serializer, 'Meta', None)
+        self.model = getattr(meta, 'model', None)
+        self.fields = []
+        self.nested = {}
+        self.finalize = getattr(serializer, 'finalize_representation', None)
+        self.supported = (
+            self.model is not None
+            and type(serializer).to_representation
+            is serializers.ModelSerializer.to_representation
+        )
+        if not self.supported:
+            return
+
+        self.pk = self.model._meta.pk.attname
+        self.lookups = {self.pk}
+        field_sources = getattr(meta, 'field_sources', {})
+        for field in serializer.fields.values():
+            if not field.write_only:
+                self.add_field(field, field_sources)
+
+    def add_field(self, field, field_sources):
+        name = field.field_name
+        source = field_sources.get(name)
+        if isinstance(field, serializers.ListSerializer):
+            path = '__'.join(field.source_attrs)
+            child = ValuesSerializer(field.child)
+            if (source is not None
+                    or not isinstance(field, PrimaryKeyOrderedListSerializer)
+                    or not child.supported or child.nested
+                    or not is_many_relation(self.model, path)):
+                self.supported = False
+                return
+            self.nested[name] = (path, child)
+            self.fields.append((name, self.pk, None))
+        elif isinstance(field, serializers.StringRelatedField):
+            path = get_str_path(self.model, '__'.join(field.source_attrs))
+            if (source is not None or path is None
+                    or not is_column(self.model, path)):
+                self.supported = False
+                return
+            self.add_column(name, path, None)
+        elif isinstance(field, serializers.SerializerMethodField):
+            if not isinstance(source, str) or not is_column(self.model, source):
+                self.supported = False
+                return
+            self.add_column(name, source, None)
+        elif isinstance(field, (serializers.RelatedField,
+                                serializers.ManyRelatedField,
+                                serializers.BaseSerializer)):
+            self.supported = False
+        else:
+            path = '__'.join(field.source_attrs)
+            if source is not None or not is_column(self.model, path):
+                self.supported = False
+                return
+            if isinstance(field, PASSTHROUGH_FIELDS):
+                self.add_column(name, path, None)
+            else:
+                self.add_column(name, path, field.to_representation)
+
+    def add_column(self, name, lookup, convert):
+        self.lookups.add(lookup)
+        self.fields.append((name, lookup, convert))
+
+    def get_values(self, queryset):
+        """
+        Return the queryset as values() rows with the columns needed to
+        render it, including the ordering fields used by keyset pagination.
+        """
+        lookups = set(self.lookups)
+        if queryset.query.order_by:
+            ordering = queryset.query.order_by
+        elif queryset.query.default_ordering:
+            ordering = queryset.model._meta.ordering
+        else:
+            ordering = []
+        for field in ordering:
+            if isinstance(field, str) and field.lstrip('-') != 'pk':
+                lookups.add(field.lstrip('-'))
+        return queryset.prefetch_related(None).values(*sorted(lookups))
+
+    def render(self, rows):
+        """
+        Render values() rows to a list of dicts.
+        """
+        rows = list(rows)
+        related = {
+            name: self.get_related(path, child, rows)
+            for name, (path, child) in self.nested.items()
+        }
+        data = []
+        for row in rows:
+            item = {}
+            for name, lookup, convert in self.fields:
+                value = row[lookup]
+                if name in related:
+                    item[name] = related[name].get(value, [])
+                elif value is None or convert is None:
+                    item[name] = value
+                else:
+                    item[name] = convert(value)
+            data.append(item)
+        if self.finalize is not None:
+            self.finalize(data)
+        return data
+
+    def get_related(self, path, child, rows):
+        """
+        Return the rendered related objects of the rows by primary key.
+        """
+        pks = [row[self.pk] for row in rows]
+        if not pks:
+            return {}
+        lookups = {f'{path}__{lookup}': lookup for lookup in child.lookups}
+        related_pk = f'{path}__{child.pk}'
+        related_rows = self.model._base_manager.filter(pk__in=pks).values(
+            self.pk, *lookups).order_by(related_pk)
+
+        owners = []
+        child_rows = []
+        for row in related_rows:
+            if row[related_pk] is None:
+                continue
+            owners.append(row[self.pk])
+            child_rows.append({
+                lookup: row[key] for key, lookup in lookups.items()
+            })
+
+        related = {}
+        for owner, item in zip(owners, child.render(child_rows)):
+            related.setdefault(owner, []).append(item)
+        return related
+
+
+class ValuesListMixin:
+    """
+    Mixin for list views that renders the list action with ValuesSerializer
+    when the serializer supports it.
+    """
+    def list(self, request, *args, **kwargs):
+        values_serializer = ValuesSerializer(self.get_serializer())
+        if not values_serializer.supported:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = values_serializer.get_values(queryset)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(values_serializer.render(page))
+        return Response(values_serializer.render(rows))
@@ -0,0 +1,68 @@
+import inspect
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from asgiref.sync import sync_to_async
+from rest_framework.exceptions import NotFound
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from drf_spectacular.utils import extend_schema, OpenApiTypes
+from blog.redis_client import get_pool_stats
+
+
+class AsyncAPIViewMixin:
+    """
+    Mixin for API views and viewsets with async handlers.
+
+    The view is served as a coroutine function. Async handlers run on the
+    event loop, while the authentication, permission and throttling checks
+    and the sync handlers of the view run in a thread, so a view can mix
+    both, e.g. an async create() with the sync actions of a viewset.
+    """
+    view_is_async = True
+
+    @classmethod
+    def as_view(cls, *args, **kwargs):
+        return markcoroutinefunction(super().as_view(*args, **kwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            method = request.method.lower()
+            if method in self.http_method_names:
+                handler = getattr(self, method, self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            if not iscoroutinefunction(handler):
+                handler = sync_to_async(handler)
+            response = await handler(request, *args, **kwargs)
+            # Sync wrappers of async handlers, e.g. the ones made by
+            # @extend_schema_view, return the coroutine of the handler.
+            if inspect.isawaitable(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args,
+                                               **kwargs)
+        return self.response
+
+
+class RedisPoolStatsAPIView(APIView):
+    """
+    API endpoint for representing the Redis connection pool usage
+    of the worker process serving the request.
+    """
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(responses=OpenApiTypes.OBJECT)
+    def get(self, request):
+        stats = get_pool_stats()
+        if stats is None:
+            raise NotFound('Redis is not configured.')
+        return Response(stats)
@@ -1,4 +1,5 @@
 from django.contrib import admin
+from content import moderation
 from content.models import Post, Comment
 
 
@@ -16,4 +17,37 @@ class PostAdmin(admin.ModelAdmin):
 @admin.register(Comment)
 class CommentAdmin(admin.ModelAdmin):
     list_display = ['user', 'post', 'created_at', 'updated_at', 'active']
-    list_filter = ['active', 'created_at', 'updated_at']
\ No newline at end of file
+    list_filter = ['active', 'created_at', 'updated_at']
+    raw_id_fields = ['parent']
+    actions = ['activate_comments', 'deactivate_comments', 'delete_comments']
+
+    def get_actions(self, request):
+        # Deleting selected comments one by one is replaced
+        # by the bulk 'delete_comments' action.
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+    @admin.action(description='Activate selected comments',
+                  permissions=['change'])
+    def activate_comments(self, request, queryset):
+        self.moderate(request, queryset, moderation.ACTIVATE)
+
+    @admin.action(description='Deactivate selected comments',
+                  permissions=['change'])
+    def deactivate_comments(self, request, queryset):
+        self.moderate(request, queryset, moderation.DEACTIVATE)
+
+    @admin.action(description='Delete selected comments with their replies',
+                  permissions=['delete'])
+    def delete_comments(self, request, queryset):
+        self.moderate(request, queryset, moderation.DELETE)
+
+    def moderate(self, request, queryset, action):
+        result = moderation.moderate(
+            action, comment_ids=queryset.values_list('pk', flat=True))
+        self.message_user(
+            request,
+            f"{action.capitalize()}d {result['comments']} comments "
+            f"on {len(result['posts'])} posts.",
+        )
\ No newline at end of file
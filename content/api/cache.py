@@ -0,0 +1,196 @@
+"""
+Response cache for anonymous post reads.
+
+Cached entries are stored together with the versions they were built from
+and are only served while those versions are current, so a single cache
+round trip both looks up the entry and validates it. Versions are bumped
+by the content signal handlers once the writing transaction commits.
+Post details also embed the similar posts, so they are validated with
+the version of those too, bumped whenever a post changes in a way that
+can change the similar posts of others. The other embedded blocks are
+about the post itself.
+
+Redis errors are not fatal: the response is then built uncached.
+
+Trending windows are cached whole, rendered for every user, with versions
+bumped by content.trending in Redis, so a hit is one MGET.
+
+The mixins are for async views: hits are served on the event loop with
+the async cache methods, and only misses run the view in a thread.
+"""
+import hashlib
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.db import transaction
+from redis import RedisError
+from rest_framework.response import Response
+from blog import redis_client
+from blog.redis_client import SharedRedisCache
+from blog.values import ValuesSerializer
+
+
+GLOBAL_VERSION_KEY = 'posts:cache:version'
+LIST_VERSION_KEY = 'posts:cache:list:version'
+POST_VERSION_KEY = 'posts:cache:post:{pk}:version'
+SIMILAR_VERSION_KEY = 'posts:cache:similar:version'
+RESPONSE_KEY = 'posts:cache:response:{path}:{query}'
+TRENDING_VERSION_KEY = 'posts:cache:trending:{window}:version'
+TRENDING_KEY = 'posts:cache:trending:{window}:{path}:{query}'
+
+
+def invalidate_post(pk):
+    """
+    Invalidate the cached detail of a post and all cached post lists.
+    """
+    _bump_versions(LIST_VERSION_KEY, POST_VERSION_KEY.format(pk=pk))
+
+
+def invalidate_similar_posts():
+    """
+    Invalidate all cached post details, which embed similar posts.
+    """
+    _bump_versions(SIMILAR_VERSION_KEY)
+
+
+def invalidate_post_lists():
+    """
+    Invalidate all cached post lists.
+    """
+    _bump_versions(LIST_VERSION_KEY)
+
+
+def invalidate_all():
+    """
+    Invalidate every cached post response, e.g. after a tag
+    or an author is changed.
+    """
+    _bump_versions(GLOBAL_VERSION_KEY)
+
+
+def _bump_versions(*keys):
+    def get_versions():
+        version = time.time_ns()
+        return {key: version for key in keys}
+
+    if isinstance(caches[DEFAULT_CACHE_ALIAS], SharedRedisCache):
+        # Sent in the pipeline of the other Redis writes of the transaction.
+        redis_client.on_commit(
+            lambda pipe: cache.set_many(get_versions(), timeout=None,
+                                        pipeline=pipe)
+        )
+    else:
+        transaction.on_commit(
+            lambda: cache.set_many(get_versions(), timeout=None)
+        )
+
+
+class AnonymousResponseCacheMixin:
+    """
+    Mixin that caches list and retrieve responses for anonymous users.
+
+    Keys include the request path, which carries the API version and
+    the post pk, and every query parameter (status, page, page_size...).
+    """
+    cache_timeout = settings.POST_CACHE_TIMEOUT
+
+    async def list(self, request, *args, **kwargs):
+        return await self.get_cached_response(
+            [GLOBAL_VERSION_KEY, LIST_VERSION_KEY],
+            super().list, request, *args, **kwargs
+        )
+
+    async def retrieve(self, request, *args, **kwargs):
+        return await self.get_cached_response(
+            [GLOBAL_VERSION_KEY, SIMILAR_VERSION_KEY,
+             POST_VERSION_KEY.format(pk=kwargs.get('pk'))],
+            super().retrieve, request, *args, **kwargs
+        )
+
+    async def get_cached_response(self, version_keys, handler, request,
+                                  *args, **kwargs):
+        handler = sync_to_async(handler)
+        if request.user.is_authenticated:
+            return await handler(request, *args, **kwargs)
+
+        key = self.get_response_cache_key(request)
+        try:
+            cached = await cache.aget_many([key, *version_keys])
+        except RedisError:
+            return await handler(request, *args, **kwargs)
+        versions = [cached.get(version_key, 0) for version_key in version_keys]
+        entry = cached.get(key)
+        if entry is not None and entry[0] == versions:
+            return Response(entry[1])
+
+        response = await handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            try:
+                await cache.aset(key, (versions, response.data),
+                                 self.cache_timeout)
+            except RedisError:
+                pass
+        return response
+
+    def get_response_cache_key(self, request):
+        query = sorted(request.query_params.lists())
+        digest = hashlib.md5(repr(query).encode()).hexdigest()
+        return RESPONSE_KEY.format(path=request.path, query=digest)
+
+
+class TrendingCacheMixin:
+    """
+    Mixin for the trending posts list that caches the rendered posts of
+    the whole window and slices pages from them.
+
+    Keys include the request path and every query parameter except the
+    pagination ones. Views define get_window().
+    """
+    cache_timeout = settings.POST_CACHE_TIMEOUT
+    pagination_query_params = ('limit', 'offset')
+
+    async def list(self, request, *args, **kwargs):
+        if not isinstance(caches[DEFAULT_CACHE_ALIAS], SharedRedisCache):
+            return await sync_to_async(super().list)(request, *args, **kwargs)
+
+        window = self.get_window()
+        key = self.get_trending_cache_key(request, window)
+        version_keys = [GLOBAL_VERSION_KEY,
+                        TRENDING_VERSION_KEY.format(window=window)]
+        try:
+            cached = await cache.aget_many([key, *version_keys])
+        except RedisError:
+            return await sync_to_async(super().list)(request, *args, **kwargs)
+        versions = [cached.get(version_key, 0) for version_key in version_keys]
+        entry = cached.get(key)
+        if entry is not None and entry[0] == versions:
+            data = entry[1]
+        else:
+            data = await sync_to_async(self.render_window)()
+            try:
+                await cache.aset(key, (versions, data), self.cache_timeout)
+            except RedisError:
+                pass
+
+        page = self.paginate_queryset(data)
+        if page is not None:
+            return self.get_paginated_response(page)
+        return Response(data)
+
+    def render_window(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        values_serializer = ValuesSerializer(self.get_serializer())
+        if values_serializer.supported:
+            return values_serializer.render(
+                values_serializer.get_values(queryset))
+        return self.get_serializer(queryset, many=True).data
+
+    def get_trending_cache_key(self, request, window):
+        query = sorted(
+            (name, values) for name, values in request.query_params.lists()
+            if name not in self.pagination_query_params
+        )
+        digest = hashlib.md5(repr(query).encode()).hexdigest()
+        return TRENDING_KEY.format(window=window, path=request.path,
+                                   query=digest)
@@ -1,9 +1,61 @@
+from django.db.models import prefetch_related_objects
+from django.http import Http404
 from rest_framework.permissions import BasePermission
-from content.models import Post
+from rest_framework import serializers
+from blog.counters import get_exact_filters
+from blog.planner import get_query_plan
+from content.models import Post, Comment
 
 
 SAFE_METHODS = ['GET', 'HEAD', 'OPTIONS']
 
+# Foreign keys to the user owning each model's objects.
+OWNER_FIELDS = {
+    Post: 'author',
+    Comment: 'user',
+}
+
+# Columns of the plain equality filters of the views' querysets, which
+# TargetObjectMixin.get_object() compares with the target.
+FILTER_FIELDS = {
+    Post: ('status',),
+    Comment: ('active',),
+}
+
+
+def get_owner_id(obj):
+    field = obj._meta.get_field(OWNER_FIELDS[type(obj)])
+    return getattr(obj, field.attname)
+
+
+def get_target(request, view):
+    """
+    Return the object of the view's 'target_model' (Post by default)
+    addressed by the 'pk' URL kwarg, or None.
+
+    The object is fetched once per request, with its owner, and shared
+    by the ownership checks in get_queryset(), the object permission
+    checks and TargetObjectMixin.get_object().
+    """
+    pk = view.kwargs.get('pk', None)
+    if pk is None:
+        return None
+    model = getattr(view, 'target_model', Post)
+    targets = getattr(request, '_targets', None)
+    if targets is None:
+        targets = request._targets = {}
+    key = (model, str(pk))
+    if key not in targets:
+        if hasattr(view, 'get_target_queryset'):
+            queryset = view.get_target_queryset()
+        else:
+            queryset = model.objects.all()
+        try:
+            targets[key] = queryset.filter(pk=pk).first()
+        except (TypeError, ValueError):
+            targets[key] = None
+    return targets[key]
+
 
 def is_owner_or_superuser(request, view):
     """
@@ -14,13 +66,8 @@ def is_owner_or_superuser(request, view):
         return False
     if user.is_superuser:
         return True
-    pk = view.kwargs.get('pk', None)
-    if pk is not None:
-        try:
-            obj = Post.objects.get(pk=pk)
-            return obj.author == user
-        except Post.DoesNotExist:
-            return False
+    obj = get_target(request, view)
+    return obj is not None and get_owner_id(obj) == user.pk
 
 
 class IsSuperuser(BasePermission):
@@ -43,4 +90,55 @@ class IsOwnerOrReadOnlyOrSuperuser(BasePermission):
         if request.user.is_authenticated:
             if request.user.is_superuser:
                 return True
-            return obj.author == request.user
\ No newline at end of file
+            return get_owner_id(obj) == request.user.pk
+
+
+class TargetObjectMixin:
+    """
+    Mixin for detail views that returns the request's shared target
+    from get_object(), fetched with the joins of the serializer, instead
+    of querying it again. Related lists are only prefetched once the
+    target is found.
+
+    The target is only returned if it matches the plain equality filters
+    of the view's queryset, e.g. Post.published. Other querysets fall back
+    to the regular lookup.
+    """
+    target_model = Post
+
+    def get_target_queryset(self):
+        model = self.target_model
+        owner = OWNER_FIELDS[model]
+        serializer_class = self.get_serializer_class()
+        if not (isinstance(serializer_class, type)
+                and issubclass(serializer_class, serializers.BaseSerializer)):
+            return model.objects.select_related(owner)
+
+        # Safe requests only load the rendered columns and those read by
+        # the ownership checks and get_object(), writes the whole row.
+        defer = self.request.method in SAFE_METHODS
+        plan = get_query_plan(model, self.get_serializer())
+        plan.add_path(model._meta.get_field(owner).attname)
+        for name in FILTER_FIELDS[model]:
+            plan.add_path(name)
+        queryset = model.objects.all()
+        if not defer:
+            queryset = queryset.select_related(owner)
+        return plan.apply(queryset, defer).prefetch_related(None)
+
+    def get_object(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        filters = get_exact_filters(queryset)
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        if (filters is None or self.lookup_field != 'pk'
+                or lookup_url_kwarg != 'pk'):
+            return super().get_object()
+
+        obj = get_target(self.request, self)
+        if obj is None or any(getattr(obj, attname) != value
+                              for attname, value in filters.items()):
+            raise Http404('No %s matches the given query.'
+                          % self.target_model._meta.object_name)
+        self.check_object_permissions(self.request, obj)
+        prefetch_related_objects([obj], *queryset._prefetch_related_lookups)
+        return obj
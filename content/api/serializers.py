@@ -0,0 +1,64 @@
+from rest_framework import serializers
+from content import write_behind
+from content.models import Comment, Post
+
+
+class PendingCountersListSerializer(serializers.ListSerializer):
+    """
+    List serializer that overlays the pending counters of a whole page
+    at once.
+    """
+    def to_representation(self, data):
+        items = super().to_representation(data)
+        self.child.finalize_representation(items)
+        return items
+
+
+class PendingCountersMixin:
+    """
+    Mixin for post serializers that adds the counter deltas not flushed
+    yet in write-behind mode to the rendered likes, dislikes and
+    comments_count.
+
+    Serializers used for lists set 'Meta.list_serializer_class' to
+    PendingCountersListSerializer. The 'id' of posts is rendered for
+    the overlay even if not selected with SparseFieldsMixin, and
+    dropped afterwards.
+    """
+    required_fields = ('id',)
+
+    @property
+    def data(self):
+        data = super().data
+        self.finalize_representation([data])
+        return data
+
+    def finalize_representation(self, items):
+        write_behind.apply_pending(items)
+        for name in getattr(self, 'hidden_fields', ()):
+            for item in items:
+                item.pop(name, None)
+
+
+class CommentReplyMixin:
+    """
+    Mixin for comment create serializers that accepts an optional
+    'parent' comment to reply to. The post is loaded without its
+    search vector.
+    """
+    def get_fields(self):
+        fields = super().get_fields()
+        fields['post'].queryset = Post.objects.defer('search_vector')
+        fields['parent'].queryset = Comment.objects.filter(active=True)
+        return fields
+
+    def validate(self, attrs):
+        parent = attrs.get('parent')
+        if parent is not None:
+            if parent.post_id != attrs['post'].pk:
+                raise serializers.ValidationError(
+                    {'parent': 'Replies must belong to the same post.'})
+            if parent.depth >= Comment.MAX_DEPTH:
+                raise serializers.ValidationError(
+                    {'parent': 'Maximum reply depth reached.'})
+        return super().validate(attrs)
@@ -1,9 +1,20 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Prefetch
 from rest_framework import serializers
+from blog.serializers import (PrimaryKeyOrderedListSerializer,
+                              SparseFieldsMixin)
+from content.api.serializers import (CommentReplyMixin,
+                                     PendingCountersMixin,
+                                     PendingCountersListSerializer)
 from content.models import Post, Comment
+from content.moderation import ACTIONS
 from taggit.models import Tag
 from taggit.serializers import TagListSerializerField
 
 
+RELATED_LIMIT = 5
+
+
 class TagSerializer(serializers.ModelSerializer):
     """
     Serializer for the Tag model.
@@ -30,13 +41,15 @@ class SimilarPostsSerializer(serializers.ModelSerializer):
         fields = ['id', 'title', 'tags']
 
 
-class PostListSerializer(serializers.ModelSerializer):
+class PostListSerializer(SparseFieldsMixin, PendingCountersMixin,
+                         serializers.ModelSerializer):
     """
     Serializer for Post model.
 
     Used for representing list posts.
     """
-    tags = TagSerializer(many=True, read_only=True)
+    tags = PrimaryKeyOrderedListSerializer(child=TagSerializer(),
+                                           read_only=True)
     author_username = serializers.SerializerMethodField()
     author_email = serializers.StringRelatedField(
         read_only=True,
@@ -45,22 +58,28 @@ class PostListSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Post
+        list_serializer_class = PendingCountersListSerializer
         fields = ['id', 'title', 'slug', 'author_id',
                   'author_username', 'author_email',
                   'publish', 'created_at', 'updated_at',
                   'likes', 'dislikes', 'comments_count', 'tags','status']
+        field_sources = {
+            'author_username': 'author__username',
+        }
 
     def get_author_username(self, obj):
         return obj.author.username
 
 
-class PostRetrieveSerializer(serializers.ModelSerializer):
+class PostRetrieveSerializer(SparseFieldsMixin, PendingCountersMixin,
+                             serializers.ModelSerializer):
     """
     Serializer for the Post model.
 
     Used for representing retrieve posts.
     """
-    tags = TagSerializer(many=True, read_only=True)
+    tags = PrimaryKeyOrderedListSerializer(child=TagSerializer(),
+                                           read_only=True)
     author_username = serializers.SerializerMethodField()
     author_email = serializers.StringRelatedField(
         read_only=True,
@@ -73,30 +92,69 @@ class PostRetrieveSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Post
+        list_serializer_class = PendingCountersListSerializer
         fields = ['id', 'title', 'slug', 'author_id',
                   'author_username', 'author_email', 'body',
                   'publish', 'created_at', 'updated_at',
                   'likes', 'users_liked', 'dislikes', 'users_disliked',
                   'comments_count', 'comments', 'tags', 'similar_posts',
                   'status']
+        expandable_fields = ['users_liked', 'users_disliked',
+                             'comments', 'similar_posts']
+        # Only the first RELATED_LIMIT likers, dislikers and comments
+        # are fetched, in one batched query per relation.
+        field_sources = {
+            'author_username': 'author__username',
+            'users_liked': Prefetch(
+                'users_liked',
+                queryset=get_user_model().objects.only(
+                    'id', 'username')[:RELATED_LIMIT],
+                to_attr='first_users_liked'
+            ),
+            'users_disliked': Prefetch(
+                'users_disliked',
+                queryset=get_user_model().objects.only(
+                    'id', 'username')[:RELATED_LIMIT],
+                to_attr='first_users_disliked'
+            ),
+            'comments': Prefetch(
+                'comments',
+                queryset=Comment.objects.filter(
+                    active=True).select_related('user')[:RELATED_LIMIT],
+                to_attr='first_comments'
+            ),
+            'similar_posts': 'tags',
+        }
 
     def get_author_username(self, obj):
         return obj.author.username
 
     def get_users_liked(self, obj):
-        return obj.users_liked.values_list('username', flat=True)[:5]
+        if hasattr(obj, 'first_users_liked'):
+            return [user.username for user in obj.first_users_liked]
+        return obj.users_liked.values_list(
+            'username', flat=True)[:RELATED_LIMIT]
 
     def get_users_disliked(self, obj):
-        return obj.users_disliked.values_list('username', flat=True)[:5]
+        if hasattr(obj, 'first_users_disliked'):
+            return [user.username for user in obj.first_users_disliked]
+        return obj.users_disliked.values_list(
+            'username', flat=True)[:RELATED_LIMIT]
 
     def get_similar_posts(self, obj):
-        tags_ids = obj.tags.values_list('id', flat=True)
+        tags_ids = [tag.id for tag in obj.tags.all()]
         similar_posts = Post.published.filter(
-            tags__in=tags_ids).exclude(id=obj.id).distinct()[:5]
+            tags__in=tags_ids).exclude(id=obj.id).only(
+            'id', 'title').prefetch_related(
+            'tags').distinct()[:RELATED_LIMIT]
         return SimilarPostsSerializer(similar_posts, many=True).data
 
     def get_comments(self, obj):
-        comments = obj.comments.select_related('user').filter(active=True)[:5]
+        if hasattr(obj, 'first_comments'):
+            comments = obj.first_comments
+        else:
+            comments = obj.comments.select_related('user').filter(
+                active=True)[:RELATED_LIMIT]
         return CommentReadSerializer(comments, many=True).data
 
 
@@ -147,21 +205,24 @@ class CommentReadSerializer(serializers.ModelSerializer):
     """
     user = serializers.StringRelatedField(read_only=True)
     post = serializers.StringRelatedField(read_only=True)
+    parent = serializers.ReadOnlyField(source='parent_id')
 
     class Meta:
         model = Comment
-        fields = '__all__'
+        fields = ['id', 'user', 'post', 'parent', 'body',
+                  'created_at', 'updated_at', 'active']
 
 
-class CommentCreateSerializer(serializers.ModelSerializer):
+class CommentCreateSerializer(CommentReplyMixin,
+                              serializers.ModelSerializer):
     """
     Serializer for the Comment model.
 
-    Used for creating comments.
+    Used for creating comments and replies.
     """
     class Meta:
         model = Comment
-        fields = ['id', 'post', 'body']
+        fields = ['id', 'post', 'parent', 'body']
 
     def create(self, validated_data):
         """
@@ -190,5 +251,30 @@ class LikeSerializer(serializers.Serializer):
     Used for validating post.
     """
     post = serializers.PrimaryKeyRelatedField(
-        queryset=Post.published.all(),
+        queryset=Post.published.only('id', 'title', 'status'),
     )
+
+
+class CommentModerationSerializer(serializers.Serializer):
+    """
+    Serializer for bulk comment moderation.
+
+    Used for validating the action and the comments, given by ids
+    or by user, it applies to.
+    """
+    action = serializers.ChoiceField(choices=ACTIONS)
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        required=False,
+        allow_empty=False,
+    )
+    user = serializers.PrimaryKeyRelatedField(
+        queryset=get_user_model().objects.only('id'),
+        required=False,
+    )
+
+    def validate(self, attrs):
+        if ('ids' in attrs) == ('user' in attrs):
+            raise serializers.ValidationError(
+                'Either ids or user must be provided.')
+        return attrs
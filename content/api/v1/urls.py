@@ -6,7 +6,11 @@ from .views import (PostViewSet,
                     CommentViewSet,
                     LikeAPIView,
                     DislikeAPIView,
-                    PopularPostListAPIView)
+                    PopularPostListAPIView,
+                    PostCommentListAPIView,
+                    PostThreadListAPIView,
+                    CommentThreadListAPIView,
+                    CommentModerationAPIView)
 
 
 router = SimpleRouter()
@@ -20,5 +24,13 @@ urlpatterns = [
     path('dislike/', DislikeAPIView.as_view(), name='dislike'),
     path('search/', SearchAPIView.as_view(), name='search'),
     path('posts/popular/', PopularPostListAPIView.as_view(), name='popular_posts'),
+    path('posts/<int:pk>/comments/', PostCommentListAPIView.as_view(),
+         name='post_comments'),
+    path('posts/<int:pk>/threads/', PostThreadListAPIView.as_view(),
+         name='post_threads'),
+    path('comments/moderate/', CommentModerationAPIView.as_view(),
+         name='comment_moderation'),
+    path('comments/<int:pk>/thread/', CommentThreadListAPIView.as_view(),
+         name='comment_thread'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -1,7 +1,14 @@
-from django.contrib.postgres.search import TrigramSimilarity
+from django.conf import settings
+from django.db.models import Case, IntegerField, When
 from rest_framework.viewsets import ModelViewSet
-from rest_framework.exceptions import NotFound
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import (LimitOffsetPagination,
+                                       PageNumberPagination)
+from blog.pagination import (KeysetPaginationMixin,
+                             PaginationMixin,
+                             CountedPaginator,
+                             ThreadPagination,
+                             TRUE_VALUES)
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.generics import GenericAPIView, ListAPIView
@@ -14,37 +21,33 @@ from .serializers import (PostListSerializer,
                           TagSerializer,
                           CommentReadSerializer,
                           CommentCreateSerializer,
-                          LikeSerializer, CommentUpdateSerializer)
+                          LikeSerializer, CommentUpdateSerializer,
+                          CommentModerationSerializer)
+from blog.planner import QueryPlanMixin
+from blog.views import AsyncAPIViewMixin
+from blog.values import ValuesListMixin, ValuesSerializer
+from content.api.cache import (AnonymousResponseCacheMixin,
+                               TrendingCacheMixin)
+from content import trending
+from content.moderation import moderate
+from content.reactions import toggle_reaction, LIKE, DISLIKE
+from content.search import (FULLTEXT_MODE,
+                            get_headlines,
+                            search_posts,
+                            similarity_threshold)
 from content.api.permissions import (IsSuperuser,
                                      IsOwnerOrReadOnlyOrSuperuser,
+                                     TargetObjectMixin,
+                                     get_target,
                                      is_owner_or_superuser)
-from redis import StrictRedis
-from django.conf import settings
 from drf_spectacular.utils import (extend_schema,
                                    extend_schema_view,
                                    OpenApiParameter,
                                    OpenApiTypes)
 
 
-class PaginationMixin:
-    """
-    Mixin for safe pagination with fallback for invalid pages.
-    """
-    def paginate_queryset(self, queryset, request, view=None):
-        try:
-            return super().paginate_queryset(queryset, request, view)
-        except NotFound:
-            page = request.GET.get('page')
-            request._request.GET = request._request.GET.copy()
-            if not page.isdigit():
-                request._request.GET['page'] = 1
-            else:
-                last_page = (queryset.count() - 1) // self.page_size + 1
-                request._request.GET['page'] = last_page
-            return super().paginate_queryset(queryset, request, view)
-
-
-class TagPagination(PaginationMixin, PageNumberPagination):
+class TagPagination(KeysetPaginationMixin, PaginationMixin,
+                    PageNumberPagination):
     """
     Pagination class for the Tag model.
     """
@@ -53,25 +56,54 @@ class TagPagination(PaginationMixin, PageNumberPagination):
     max_page_size = 50
 
 
-class PostPagination(PaginationMixin, PageNumberPagination):
+class PostPagination(KeysetPaginationMixin, PaginationMixin,
+                     PageNumberPagination):
     """
     Pagination class for the Post model.
     """
+    django_paginator_class = CountedPaginator
     page_size = 10
     page_size_query_param = 'page_size'
     max_page_size = 20
 
 
-class CommentPagination(PaginationMixin, PageNumberPagination):
+class CommentPagination(KeysetPaginationMixin, PaginationMixin,
+                        PageNumberPagination):
     """
     Pagination class for the Comment model.
     """
+    django_paginator_class = CountedPaginator
     page_size = 20
     page_size_query_param = 'page_size'
     max_page_size = 50
 
 
-class TagViewSet(ModelViewSet):
+class PostCommentPagination(CommentPagination):
+    """
+    Pagination class for the comments of a post, always in keyset mode.
+    """
+    keyset_only = True
+    cursor_query_description = 'The pagination cursor value.'
+
+
+class PostThreadPagination(ThreadPagination):
+    """
+    Pagination class for the comment threads of a post.
+    """
+    page_size = 10
+    max_page_size = 20
+
+
+class PopularPostPagination(LimitOffsetPagination):
+    """
+    Pagination class for trending posts.
+    """
+    default_limit = 10
+    max_limit = settings.TRENDING_SIZE
+
+
+class TagViewSet(AsyncAPIViewMixin, ValuesListMixin, QueryPlanMixin,
+                 ModelViewSet):
     """
     API endpoint for managing tags.
 
@@ -103,11 +135,38 @@ class TagViewSet(ModelViewSet):
                 description='The status of the posts. '
                             'Available for users with administrator permissions.'
                             'Status values: all, draft, published.',
+            ),
+            OpenApiParameter(
+                name='fields',
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                description='Comma separated fields to return.',
+            )
+        ]
+    ),
+    retrieve=extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name='fields',
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                description='Comma separated fields to return.',
+            ),
+            OpenApiParameter(
+                name='expand',
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                description='Comma separated sections to return '
+                            'along with the selected fields. '
+                            'Values: users_liked, users_disliked, '
+                            'comments, similar_posts.',
             )
         ]
     )
 )
-class PostViewSet(ModelViewSet):
+class PostViewSet(AsyncAPIViewMixin, AnonymousResponseCacheMixin,
+                  TargetObjectMixin, ValuesListMixin, QueryPlanMixin,
+                  ModelViewSet):
     """
     API endpoint for managing posts.
 
@@ -122,29 +181,21 @@ class PostViewSet(ModelViewSet):
 
         Admins or owners can access all posts or drafts if 'status' is specified.
         Non-owners see only published posts.
-        Optimizes queries with select_related and prefetch_related.
+        Related data is loaded according to the serializer by QueryPlanMixin.
         """
         status = self.request.query_params.get('status', None)
         is_access = is_owner_or_superuser(self.request, self)
 
-        if status is not None and is_access:
-            if status == 'all':
-                return Post.objects.prefetch_related(
-                    'tags', 'users_liked', 'users_disliked'
-                ).select_related('author')
-            elif status == 'draft':
-                return Post.draft.prefetch_related(
-                    'tags', 'users_liked', 'users_disliked'
-                ).select_related('author')
-
-        if self.action != 'list' and is_access:
-            return Post.objects.prefetch_related(
-                    'tags', 'users_liked', 'users_disliked'
-                ).select_related('author')
+        if status == 'all' and is_access:
+            posts = Post.objects.all()
+        elif status == 'draft' and is_access:
+            posts = Post.draft.all()
+        elif self.action != 'list' and is_access:
+            posts = Post.objects.all()
+        else:
+            posts = Post.published.all()
 
-        return Post.published.prefetch_related(
-                    'tags', 'users_liked', 'users_disliked'
-                ).select_related('author')
+        return posts
 
     def get_serializer_class(self):
         if self.action == 'list':
@@ -175,7 +226,8 @@ class PostViewSet(ModelViewSet):
         ]
     )
 )
-class CommentViewSet(ModelViewSet):
+class CommentViewSet(TargetObjectMixin, ValuesListMixin, QueryPlanMixin,
+                     ModelViewSet):
     """
     API endpoint for managing comments.
 
@@ -183,6 +235,7 @@ class CommentViewSet(ModelViewSet):
     for Comment instances.
     """
     pagination_class = CommentPagination
+    target_model = Comment
 
     def get_queryset(self):
         """
@@ -190,22 +243,20 @@ class CommentViewSet(ModelViewSet):
 
         Admins can access all comments if 'status' is specified.
         Non-admins see only active comments.
-        Optimizes queries with select_related.
+        Related data is loaded according to the serializer by QueryPlanMixin.
         """
         status = self.request.query_params.get('status', None)
         is_access = is_owner_or_superuser(self.request, self)
 
         if self.action != 'list' and is_access:
-            return Comment.objects.all().select_related('user', 'post')
+            return Comment.objects.all()
 
         if status is not None and is_access:
             if status == 'all':
-                return Comment.objects.all().select_related('user', 'post')
+                return Comment.objects.all()
             elif status == 'disabled':
-                return Comment.objects.filter(
-                    active=False).select_related('user', 'post')
-        return Comment.objects.filter(
-            active=True).select_related('user', 'post')
+                return Comment.objects.filter(active=False)
+        return Comment.objects.filter(active=True)
 
     def get_serializer_class(self):
         if self.action in ['list', 'retrieve']:
@@ -223,7 +274,99 @@ class CommentViewSet(ModelViewSet):
         return [IsSuperuser()]
 
 
-class SearchAPIView(APIView):
+class PostCommentListAPIView(ValuesListMixin, QueryPlanMixin, ListAPIView):
+    """
+    API endpoint for representing the active comments of a post,
+    newest first.
+
+    Pages are read from the partial (post, created_at, id) index
+    of active comments with keyset pagination.
+    """
+    pagination_class = PostCommentPagination
+
+    def get_queryset(self):
+        """
+        Return a queryset of the active comments of the post.
+
+        Owners and admins can access comments of any of their posts,
+        others only those of published posts.
+        """
+        post = get_target(self.request, self)
+        if post is None or not (post.status == Post.Status.PUBLISHED
+                                or is_owner_or_superuser(self.request, self)):
+            raise NotFound('Post not found.')
+        return Comment.objects.filter(post_id=post.pk, active=True)
+
+    def get_serializer_class(self):
+        return CommentReadSerializer
+
+
+class PostThreadListAPIView(PostCommentListAPIView):
+    """
+    API endpoint for representing the comment threads of a post,
+    newest first, each with its active replies depth first.
+
+    A page of threads is read as one range of the partial (post, path)
+    index of active comments. Replies below inactive comments are
+    skipped.
+    """
+    pagination_class = PostThreadPagination
+
+    def get_queryset(self):
+        return super().get_queryset().filter(~Comment.below_inactive())
+
+
+class CommentThreadListAPIView(ValuesListMixin, QueryPlanMixin,
+                               ListAPIView):
+    """
+    API endpoint for representing a comment with its active replies
+    at any depth, depth first.
+    """
+    pagination_class = PostCommentPagination
+
+    def get_queryset(self):
+        """
+        Return a queryset of the active comment and its active replies,
+        except those below inactive comments.
+
+        Admins can access threads of any post, others only those
+        of published posts.
+        """
+        comments = Comment.objects.filter(~Comment.below_inactive(),
+                                          active=True)
+        if not self.request.user.is_superuser:
+            comments = comments.filter(post__status=Post.Status.PUBLISHED)
+        comment = comments.filter(pk=self.kwargs['pk']).first()
+        if comment is None:
+            raise NotFound('Comment not found.')
+        return comment.get_thread().filter(~Comment.below_inactive(),
+                                           active=True)
+
+    def get_serializer_class(self):
+        return CommentReadSerializer
+
+
+class CommentModerationAPIView(GenericAPIView):
+    """
+    API endpoint for moderating comments in bulk.
+
+    Activates, deactivates or deletes the comments with the given ids,
+    or all comments of a user, and returns the number of comments changed
+    and the ids of their posts.
+    """
+    serializer_class = CommentModerationSerializer
+    permission_classes = [IsSuperuser]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        return Response(moderate(data['action'],
+                                 comment_ids=data.get('ids'),
+                                 user=data.get('user')))
+
+
+class SearchAPIView(AsyncAPIViewMixin, APIView):
     """
     API endpoint for searching posts.
     """
@@ -242,6 +385,21 @@ class SearchAPIView(APIView):
                 description='Search status. '
                             'Available for users with administrator permissions.'
                             'Status values: all, draft, published.',
+            ),
+            OpenApiParameter(
+                name='mode',
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                description='Search mode. '
+                            'Values: trigram (titles, default), '
+                            'fulltext (titles and bodies).',
+            ),
+            OpenApiParameter(
+                name='highlight',
+                type=OpenApiTypes.BOOL,
+                location=OpenApiParameter.QUERY,
+                description='Add a body snippet with highlighted matches '
+                            'to full-text results as "headline".',
             )
         ]
     )
@@ -251,42 +409,40 @@ class SearchAPIView(APIView):
 
         Admins can access all posts or drafts if 'status' is specified.
         Non-admins see only published posts.
-        Optimizes queries with select_related and prefetch_related.
+        Posts are matched by title trigrams or, with 'mode=fulltext',
+        by a full-text search over titles and bodies.
+        Rows are rendered as PostListSerializer by ValuesSerializer.
         """
 
         status = request.query_params.get('status', None)
         query = self.request.query_params.get('query', None)
-        search_rating = 0.1
+        mode = request.query_params.get('mode', None)
+        highlight = request.query_params.get('highlight', '')
         is_access = is_owner_or_superuser(self.request, self)
 
         if query is not None:
             if status == 'all' and is_access:
-                posts = Post.objects.annotate(
-                    similarity=TrigramSimilarity('title', query)
-                ).filter(similarity__gte=search_rating
-                         ).order_by('-similarity').prefetch_related(
-                    'tags', 'users_liked', 'users_disliked'
-                ).select_related('author')
+                posts = Post.objects.all()
             elif status == 'draft' and is_access:
-                posts = Post.draft.annotate(
-                    similarity=TrigramSimilarity('title', query)
-                ).filter(similarity__gte=search_rating
-                         ).order_by('-similarity').prefetch_related(
-                    'tags', 'users_liked', 'users_disliked'
-                ).select_related('author')
+                posts = Post.draft.all()
             else:
-                posts = Post.published.annotate(
-                    similarity=TrigramSimilarity('title', query)
-                ).filter(similarity__gte=search_rating
-                         ).order_by('-similarity').prefetch_related(
-                    'tags', 'users_liked', 'users_disliked'
-                ).select_related('author')
+                posts = Post.published.all()
+            values_serializer = ValuesSerializer(PostListSerializer())
+            posts = values_serializer.get_values(
+                search_posts(posts, query, mode)
+            )
 
             paginator = PostPagination()
-            page = paginator.paginate_queryset(posts, request)
-
-            serializer = PostListSerializer(page, many=True)
-            return paginator.get_paginated_response(serializer.data)
+            with similarity_threshold():
+                page = paginator.paginate_queryset(posts, request)
+
+            results = values_serializer.render(page)
+            if mode == FULLTEXT_MODE and highlight.lower() in TRUE_VALUES:
+                headlines = get_headlines([post['id'] for post in results],
+                                          query)
+                for post in results:
+                    post['headline'] = headlines.get(post['id'])
+            return paginator.get_paginated_response(results)
         return Response()
 
     def get_queryset(self):
@@ -296,6 +452,8 @@ class SearchAPIView(APIView):
 class LikeAPIView(GenericAPIView):
     """
     API endpoint for liking posts.
+
+    Toggles the like and returns the new likes and dislikes counters.
     """
     serializer_class = LikeSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -304,27 +462,23 @@ class LikeAPIView(GenericAPIView):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         user = self.request.user
-        post_id = serializer.data['post']
-        post = Post.objects.get(pk=post_id)
-
-        if post.users_liked.filter(id=user.id).exists():
-            post.users_liked.remove(user)
-            return Response(
-                {'detail': f'User {user.username} unliked post {post}'}
-            )
-
-        if post.users_disliked.filter(id=user.id).exists():
-            post.users_disliked.remove(user)
-        post.users_liked.add(user)
+        post = serializer.validated_data['post']
+        liked, likes, dislikes = toggle_reaction(post, user, LIKE)
 
+        if liked:
+            detail = f'User {user.username} liked post {post}'
+        else:
+            detail = f'User {user.username} unliked post {post}'
         return Response(
-            {'detail': f'User {user.username} liked post {post}'}
+            {'detail': detail, 'likes': likes, 'dislikes': dislikes}
         )
 
 
 class DislikeAPIView(GenericAPIView):
     """
     API endpoint for disliking posts.
+
+    Toggles the dislike and returns the new likes and dislikes counters.
     """
     serializer_class = LikeSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -333,34 +487,55 @@ class DislikeAPIView(GenericAPIView):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         user = self.request.user
-        post_id = serializer.data['post']
-        post = Post.objects.get(pk=post_id)
-
-        if post.users_disliked.filter(id=user.id).exists():
-            post.users_disliked.remove(user)
-            return Response(
-                {'detail': f'User {user.username} undisliked post {post}'}
-            )
-
-        if post.users_liked.filter(id=user.id).exists():
-            post.users_liked.remove(user)
-        post.users_disliked.add(user)
+        post = serializer.validated_data['post']
+        disliked, likes, dislikes = toggle_reaction(post, user, DISLIKE)
 
+        if disliked:
+            detail = f'User {user.username} disliked post {post}'
+        else:
+            detail = f'User {user.username} undisliked post {post}'
         return Response(
-            {'detail': f'User {user.username} disliked post {post}'}
+            {'detail': detail, 'likes': likes, 'dislikes': dislikes}
         )
 
 
-class PopularPostListAPIView(ListAPIView):
+class PopularPostListAPIView(AsyncAPIViewMixin, TrendingCacheMixin,
+                             ValuesListMixin, QueryPlanMixin, ListAPIView):
     """
-    API endpoint for representing popular posts.
+    API endpoint for representing trending posts.
     """
+    pagination_class = PopularPostPagination
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name='window',
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                description='Trending window. Values: '
+                            f'{", ".join(settings.TRENDING_WINDOWS)}, '
+                            f'by default {settings.TRENDING_DEFAULT_WINDOW}.',
+            )
+        ]
+    )
+    async def get(self, request, *args, **kwargs):
+        return await self.list(request, *args, **kwargs)
+
+    def get_window(self):
+        window = self.request.query_params.get(
+            'window', settings.TRENDING_DEFAULT_WINDOW)
+        if window not in settings.TRENDING_WINDOWS:
+            raise ValidationError({'window': 'Unknown trending window.'})
+        return window
+
     def get_queryset(self):
-        redis_client = StrictRedis.from_url(settings.REDIS_URL)
-        posts_ids = redis_client.zrevrange('popular_posts', 0, 9)
-        return Post.published.filter(id__in=posts_ids).prefetch_related(
-                    'tags', 'users_liked', 'users_disliked'
-                ).select_related('author').order_by('-likes')
+        posts_ids = trending.get_post_ids(self.get_window())
+        if not posts_ids:
+            return Post.published.none()
+        rank = Case(*[When(pk=post_id, then=index)
+                      for index, post_id in enumerate(posts_ids)],
+                    output_field=IntegerField())
+        return Post.published.filter(pk__in=posts_ids).order_by(rank)
 
     def get_serializer_class(self):
         return PostListSerializer
\ No newline at end of file
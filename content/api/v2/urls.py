@@ -8,7 +8,11 @@ from .views import (PostListCreateAPIView,
                     CommentRetrieveUpdateDestroyAPIView,
                     LikeAPIView,
                     DislikeAPIView,
-                    PopularPostListAPIView)
+                    PopularPostListAPIView,
+                    PostCommentListAPIView,
+                    PostThreadListAPIView,
+                    CommentThreadListAPIView,
+                    CommentModerationAPIView)
 
 
 urlpatterns = [
@@ -20,15 +24,23 @@ urlpatterns = [
          name='search'),
     path('comments/', CommentListCreateAPIView.as_view(),
          name='comments'),
+    path('comments/moderate/', CommentModerationAPIView.as_view(),
+         name='comment-moderation'),
     path('comments/<int:pk>/',
          CommentRetrieveUpdateDestroyAPIView.as_view(),
          name='comment-detail'),
+    path('comments/<int:pk>/thread/', CommentThreadListAPIView.as_view(),
+         name='comment-thread'),
     path('posts/popular/', PopularPostListAPIView.as_view(),
          name='popular-posts'),
     path('posts/', PostListCreateAPIView.as_view(),
          name='post-list'),
     path('posts/<int:pk>/', PostRetrieveUpdateDestroyAPIView.as_view(),
          name='post-detail'),
+    path('posts/<int:pk>/comments/', PostCommentListAPIView.as_view(),
+         name='post-comments'),
+    path('posts/<int:pk>/threads/', PostThreadListAPIView.as_view(),
+         name='post-threads'),
     path('tags/', TagCreateListAPIView.as_view(),
          name='tag-list'),
     path('tags/<int:pk>/', TagRetrieveUpdateDestroyAPIView.as_view(),
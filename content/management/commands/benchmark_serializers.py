@@ -0,0 +1,60 @@
+import timeit
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from accounts.models import User
+from accounts.api.v2.serializers import UserReadSerializer
+from blog.planner import plan_queryset
+from blog.values import ValuesSerializer
+from content.models import Post, Comment
+from content.api.v2.serializers import (PostListSerializer,
+                                        CommentReadSerializer,
+                                        TagSerializer)
+from taggit.models import Tag
+
+
+class Command(BaseCommand):
+    """
+    Compare list rendering of the serializers with ValuesSerializer.
+    """
+    help = ('Benchmark rendering a list page with the serializer classes '
+            'and with ValuesSerializer.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--number', type=int, default=200)
+
+    def handle(self, *args, **options):
+        page_size = options['page_size']
+        number = options['number']
+        cases = [
+            ('posts', Post.published.all(), PostListSerializer),
+            ('comments', Comment.objects.filter(active=True),
+             CommentReadSerializer),
+            ('tags', Tag.objects.order_by('pk'), TagSerializer),
+            ('users', User.objects.order_by('pk'), UserReadSerializer),
+        ]
+        renderer = JSONRenderer()
+
+        self.stdout.write(f'{"list":<10}{"serializer":>12}'
+                          f'{"values":>12}{"speedup":>10}  identical')
+        for name, queryset, serializer_class in cases:
+            values_serializer = ValuesSerializer(serializer_class())
+
+            def render_serializer():
+                page = plan_queryset(queryset, serializer_class())[:page_size]
+                return renderer.render(serializer_class(page, many=True).data)
+
+            def render_values():
+                page = values_serializer.get_values(queryset)[:page_size]
+                return renderer.render(values_serializer.render(page))
+
+            identical = render_serializer() == render_values()
+            serializer_time = timeit.timeit(render_serializer, number=number)
+            values_time = timeit.timeit(render_values, number=number)
+            self.stdout.write(
+                f'{name:<10}'
+                f'{serializer_time / number * 1000:>10.2f}ms'
+                f'{values_time / number * 1000:>10.2f}ms'
+                f'{serializer_time / values_time:>9.1f}x  '
+                f'{"yes" if identical else "no"}'
+            )
@@ -0,0 +1,41 @@
+import time
+from django.core.management.base import BaseCommand
+from blog import counters
+from content import write_behind
+
+
+class Command(BaseCommand):
+    """
+    Apply the post counter deltas buffered in write-behind mode.
+
+    With --reseed-interval the row counters used for pagination are also
+    overwritten with exact counts every that many seconds.
+    """
+    help = ('Flush the likes, dislikes and comment count deltas buffered '
+            'in Redis to the posts table, once or every --interval seconds, '
+            'and reseed the pagination row counters every --reseed-interval '
+            'seconds.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=None)
+        parser.add_argument('--reseed-interval', type=float, default=None)
+        parser.add_argument('--batch-size', type=int,
+                            default=write_behind.FLUSH_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        reseed_interval = options['reseed_interval']
+        reseed_at = time.monotonic()
+        while True:
+            updated = write_behind.flush(batch_size=options['batch_size'])
+            if updated is None:
+                self.stdout.write('Another flush is running, skipped.')
+            elif updated or interval is None:
+                self.stdout.write(f'Flushed counters of {updated} posts.')
+            if reseed_interval is not None and time.monotonic() >= reseed_at:
+                written = counters.reseed()
+                self.stdout.write(f'Reseeded {written or 0} row counters.')
+                reseed_at = time.monotonic() + reseed_interval
+            if interval is None:
+                return
+            time.sleep(interval)
@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from blog import redis_client
+from content import trending
+
+
+class Command(BaseCommand):
+    """
+    Rebuild the trending posts from the database and report the drift.
+    """
+    help = ('Rescore the published posts of every trending window, or of '
+            'the given ones, replace the ZSETs in Redis atomically and '
+            'report the posts that were missing, stale or moved.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('windows', nargs='*')
+        parser.add_argument('--chunk-size', type=int,
+                            default=trending.REBUILD_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if redis_client.get_client() is None:
+            raise CommandError('REDIS_URL is not set.')
+        windows = options['windows'] or list(settings.TRENDING_WINDOWS)
+        for window in windows:
+            if window not in settings.TRENDING_WINDOWS:
+                raise CommandError(f'Unknown trending window "{window}".')
+        for window in windows:
+            drift = trending.rebuild(window, options['chunk_size'])
+            self.stdout.write(
+                f'{window}: {drift["scored"]} posts scored, '
+                f'{drift["ranked"]} ranked, '
+                f'{len(drift["missing"])} missing, '
+                f'{len(drift["stale"])} stale '
+                f'({len(drift["unpublished"])} unpublished or deleted), '
+                f'{drift["moved"]} moved'
+            )
+            for name in ('missing', 'stale', 'unpublished'):
+                if drift[name] and options['verbosity'] > 1:
+                    ids = ', '.join(str(post_id) for post_id in drift[name])
+                    self.stdout.write(f'  {name}: {ids}')
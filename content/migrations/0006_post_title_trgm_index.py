@@ -0,0 +1,20 @@
+from django.contrib.postgres.indexes import GistIndex
+from django.contrib.postgres.operations import (AddIndexConcurrently,
+                                                TrigramExtension)
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('content', '0005_alter_comment_post_alter_comment_user'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        AddIndexConcurrently(
+            model_name='post',
+            index=GistIndex(fields=['title'], name='content_post_title_trgm_idx', opclasses=['gist_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,17 @@
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('content', '0007_post_search_vector'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('active', True)), fields=['post', '-created_at', '-id'], name='content_comment_post_list_idx'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2 on 2026-10-17 05:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+PATH_STEP = 8
+PATH_STEP_MAX = 36 ** PATH_STEP - 1
+
+# Existing comments are all top-level, so their path is the base 36 step
+# of PATH_STEP_MAX - id, built digit by digit in one UPDATE.
+SET_COMMENT_PATHS = """
+UPDATE "content_comment" SET "path" = (
+    SELECT string_agg(
+        substr('0123456789abcdefghijklmnopqrstuvwxyz',
+               ((%(max)s - "content_comment"."id")
+                / power(36, %(last)s - digit)::bigint %% 36)::integer + 1,
+               1),
+        '' ORDER BY digit)
+    FROM generate_series(0, %(last)s) AS digit
+)
+""" % {'max': PATH_STEP_MAX, 'last': PATH_STEP - 1}
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0008_comment_post_list_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='replies', to='content.comment'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(db_collation='C', default='', editable=False, max_length=255),
+        ),
+        migrations.RunSQL(SET_COMMENT_PATHS, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,33 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('content', '0010_comment_post_path_index'),
+    ]
+
+    # 0007_post_search_vector used to build this index itself, so databases
+    # migrated before it was split out already have it.
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    'CREATE INDEX CONCURRENTLY IF NOT EXISTS '
+                    '"content_post_search_vector_idx" ON "content_post" '
+                    'USING gin ("search_vector")',
+                    reverse_sql='DROP INDEX CONCURRENTLY IF EXISTS '
+                                '"content_post_search_vector_idx"',
+                ),
+            ],
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='post',
+                    index=GinIndex(fields=['search_vector'],
+                                   name='content_post_search_vector_idx'),
+                ),
+            ],
+        ),
+    ]
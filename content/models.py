@@ -1,11 +1,20 @@
-from django.db import models
+from django.db import models, router, transaction
 from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex, GistIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.db.models.functions import Left, Length
 from django.utils import timezone
+from django.utils.http import int_to_base36
 from django.utils.text import slugify
 from taggit.managers import TaggableManager
 
 
 USER = settings.AUTH_USER_MODEL
+SEARCH_CONFIG = 'english'
+
+# Comment paths are made of fixed-width base 36 steps, one per level.
+PATH_STEP = 8
+PATH_STEP_MAX = 36 ** PATH_STEP - 1
 
 
 class PublishedManager(models.Manager):
@@ -46,16 +55,40 @@ class Post(models.Model):
                               choices=Status.choices,
                               default=Status.DRAFT)
     tags = TaggableManager()
+    search_vector = models.GeneratedField(
+        expression=(
+            SearchVector('title', weight='A', config=SEARCH_CONFIG)
+            + SearchVector('body', weight='B', config=SEARCH_CONFIG)
+        ),
+        output_field=SearchVectorField(),
+        db_persist=True
+    )
     objects = models.Manager()
     published = PublishedManager()
     draft = DraftManager()
 
     class Meta:
         ordering = ('-publish',)
+        indexes = [
+            GistIndex(fields=['title'], name='content_post_title_trgm_idx',
+                      opclasses=['gist_trgm_ops']),
+            GinIndex(fields=['search_vector'],
+                     name='content_post_search_vector_idx'),
+        ]
+
+    # The column rendered by __str__, see User.STR_FIELD.
+    STR_FIELD = 'title'
 
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the loaded status to detect status changes on save.
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
     def save(self, *args, **kwargs):
         if not self.slug or self.slug != slugify(self.title):
             self.slug = slugify(self.title)
@@ -63,10 +96,23 @@ class Post(models.Model):
 
 
 class Comment(models.Model):
+    MAX_DEPTH = 255 // PATH_STEP - 1
+
     user = models.ForeignKey(USER, on_delete=models.CASCADE,
                              related_name='commented_on')
     post = models.ForeignKey(Post, on_delete=models.CASCADE,
                              related_name='comments')
+    parent = models.ForeignKey('self', on_delete=models.CASCADE,
+                               null=True, blank=True,
+                               related_name='replies')
+    # Materialized path: the parent's path followed by a step encoding the
+    # id, so ordering by path lists a thread depth first and the replies at
+    # any depth share its path as a prefix. Steps of top-level comments
+    # count down to list the threads of a post newest first. The "C"
+    # collation lets prefix lookups and ordering use the same index.
+    path = models.CharField(max_length=255, editable=False, default='',
+                            db_collation='C')
+    depth = models.PositiveSmallIntegerField(editable=False, default=0)
     body = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -74,6 +120,70 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ('-created_at',)
+        indexes = [
+            models.Index(fields=['post', '-created_at', '-id'],
+                         condition=models.Q(active=True),
+                         name='content_comment_post_list_idx'),
+            models.Index(fields=['post', 'path'],
+                         condition=models.Q(active=True),
+                         name='content_comment_post_path_idx'),
+        ]
 
     def __str__(self):
         return f"Comment by {self.user} on {self.post}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the loaded active state to detect changes on save.
+        instance._loaded_active = instance.__dict__.get('active')
+        return instance
+
+    @staticmethod
+    def below_inactive():
+        """
+        Return a condition matching the comments below an inactive one,
+        i.e. with an inactive comment of the post whose path is a prefix
+        of theirs. Deactivating a comment leaves its replies active,
+        but threads skip them.
+        """
+        return models.Exists(Comment.objects.filter(
+            post_id=models.OuterRef('post_id'),
+            active=False,
+            depth__lt=models.OuterRef('depth'),
+            path=Left(models.OuterRef('path'), Length('path')),
+        ))
+
+    def get_thread(self):
+        """
+        Return a queryset of the comment and its replies at any depth,
+        ordered depth first.
+        """
+        return Comment.objects.filter(
+            post_id=self.post_id, path__startswith=self.path
+        ).order_by('path')
+
+    @classmethod
+    def get_path_step(cls, pk, is_reply):
+        value = pk if is_reply else PATH_STEP_MAX - pk
+        return int_to_base36(value).rjust(PATH_STEP, '0')
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding or self.path:
+            return super().save(*args, **kwargs)
+        # The path step needs the id, so it is set right after the insert.
+        with transaction.atomic(using=router.db_for_write(Comment)):
+            if self.parent_id:
+                self.depth = self.parent.depth + 1
+            super().save(*args, **kwargs)
+            parent_path = self.parent.path if self.parent_id else ''
+            self.path = parent_path + self.get_path_step(
+                self.pk, bool(self.parent_id))
+            Comment.objects.filter(pk=self.pk).update(path=self.path)
+
+
+class CounterFlush(models.Model):
+    # Id of a batch of write-behind counter deltas, saved in the transaction
+    # that applies the batch, so that it is never applied twice.
+    id = models.CharField(primary_key=True, max_length=32)
+    created_at = models.DateTimeField(auto_now_add=True)
@@ -0,0 +1,170 @@
+"""
+Bulk moderation of comments.
+
+Comments are activated, deactivated or deleted by id or by user in
+batches. Each batch is one set-based statement that changes the comments
+and adjusts the comments_count of their posts by the per-post number of
+active comments gained or lost, in a single grouped UPDATE ... FROM.
+Deleted comments take their replies at any depth with them.
+
+No per-row signals are sent: the side effects of a batch on the comment
+counters, the trending posts and the cached post responses are applied
+once per post. In write-behind mode the posts are not updated and the
+grouped deltas are left to content.write_behind.
+"""
+from django.db import connections, router, transaction
+from django.utils import timezone
+from blog import counters
+from content import trending, write_behind
+from content.api import cache
+from content.models import Comment, Post
+
+
+ACTIVATE = 'activate'
+DEACTIVATE = 'deactivate'
+DELETE = 'delete'
+
+ACTIONS = (ACTIVATE, DEACTIVATE, DELETE)
+
+MODERATION_BATCH_SIZE = 500
+
+# Each changed comment returns its post and the change of the post's
+# number of active comments.
+SET_ACTIVE_CTE = """
+WITH changed AS (
+    UPDATE {comment_table} SET
+        {active_column} = %(active)s,
+        {updated_at_column} = %(now)s
+    WHERE {pk_column} = ANY(%(ids)s) AND {active_column} <> %(active)s
+    RETURNING {post_column} AS post_id, %(delta)s AS delta
+)"""
+
+DELETE_CTE = """
+WITH changed AS (
+    DELETE FROM {comment_table} AS comment
+    USING {comment_table} AS target
+    WHERE target.{pk_column} = ANY(%(ids)s)
+        AND comment.{post_column} = target.{post_column}
+        AND comment.{path_column} LIKE target.{path_column} || '%%'
+    RETURNING comment.{post_column} AS post_id,
+        CASE WHEN comment.{active_column} THEN -1 ELSE 0 END AS delta
+)"""
+
+DELTAS_CTE = """, deltas AS (
+    SELECT post_id, COUNT(*) AS comments, SUM(delta) AS delta
+    FROM changed
+    GROUP BY post_id
+)"""
+
+UPDATE_POSTS_CTE = """, updated AS (
+    UPDATE {post_table} AS post SET
+        {comments_count_column} = GREATEST(
+            post.{comments_count_column} + deltas.delta, 0)
+    FROM deltas
+    WHERE post.{post_pk_column} = deltas.post_id AND deltas.delta <> 0
+)"""
+
+SELECT_DELTAS = """
+SELECT post_id, comments, delta FROM deltas
+"""
+
+
+def get_moderation_sql(action, connection, behind=False):
+    quote = connection.ops.quote_name
+    sql = DELETE_CTE if action == DELETE else SET_ACTIVE_CTE
+    sql += DELTAS_CTE
+    if not behind:
+        sql += UPDATE_POSTS_CTE
+    sql += SELECT_DELTAS
+    return sql.format(
+        comment_table=quote(Comment._meta.db_table),
+        pk_column=quote(Comment._meta.pk.column),
+        post_column=quote(Comment._meta.get_field('post').column),
+        path_column=quote(Comment._meta.get_field('path').column),
+        active_column=quote(Comment._meta.get_field('active').column),
+        updated_at_column=quote(Comment._meta.get_field('updated_at').column),
+        post_table=quote(Post._meta.db_table),
+        post_pk_column=quote(Post._meta.pk.column),
+        comments_count_column=quote(
+            Post._meta.get_field('comments_count').column),
+    )
+
+
+def get_comment_ids(action, user):
+    """
+    Return the ids of the user's comments the action would change.
+    """
+    comments = Comment.objects.filter(user=user)
+    if action == ACTIVATE:
+        comments = comments.filter(active=False)
+    elif action == DEACTIVATE:
+        comments = comments.filter(active=True)
+    return list(comments.order_by('pk').values_list('pk', flat=True))
+
+
+def moderate(action, comment_ids=None, user=None,
+             batch_size=MODERATION_BATCH_SIZE):
+    """
+    Apply the action to the comments with the given ids, or to all
+    comments of the user, in batches of up to 'batch_size' comments.
+    Return the number of comments changed and the ids of their posts.
+    """
+    if comment_ids is None:
+        comment_ids = get_comment_ids(action, user)
+    comment_ids = sorted(set(comment_ids))
+    changed = 0
+    post_ids = set()
+    for start in range(0, len(comment_ids), batch_size):
+        deltas = moderate_batch(action, comment_ids[start:start + batch_size])
+        changed += sum(comments for comments, _ in deltas.values())
+        post_ids.update(deltas)
+    return {
+        'action': action,
+        'comments': changed,
+        'posts': sorted(post_ids),
+    }
+
+
+def moderate_batch(action, comment_ids):
+    """
+    Apply the action to a batch of comments in one statement and return
+    the number of comments changed and the comments_count delta by post.
+    """
+    using = router.db_for_write(Comment)
+    connection = connections[using]
+    behind = write_behind.is_enabled()
+    params = {
+        'ids': comment_ids,
+        'active': action == ACTIVATE,
+        'delta': 1 if action == ACTIVATE else -1,
+        'now': timezone.now(),
+    }
+    with transaction.atomic(using=using):
+        with connection.cursor() as cursor:
+            cursor.execute(get_moderation_sql(action, connection, behind),
+                           params)
+            deltas = {post_id: (comments, delta)
+                      for post_id, comments, delta in cursor.fetchall()}
+
+        changed = sum(comments for comments, _ in deltas.values())
+        lost = -sum(delta for _, delta in deltas.values())
+        if action == DELETE:
+            if lost:
+                counters.adjust(Comment, True, -lost)
+            if changed - lost:
+                counters.adjust(Comment, False, lost - changed)
+        elif changed:
+            counters.move(Comment, action != ACTIVATE, action == ACTIVATE,
+                          count=changed)
+        published = set()
+        if action == ACTIVATE and deltas:
+            published = set(Post.published.filter(
+                pk__in=list(deltas)).values_list('pk', flat=True))
+        for post_id, (_, delta) in deltas.items():
+            if delta:
+                if behind:
+                    write_behind.add(post_id, {'comments_count': delta})
+                trending.record(post_id, {'comments_count': delta},
+                                published=post_id in published)
+            cache.invalidate_post(post_id)
+    return deltas
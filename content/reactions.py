@@ -0,0 +1,146 @@
+"""
+Likes and dislikes of posts.
+
+A reaction is toggled in a transaction of two statements, whatever the
+number of users that reacted. The first one locks the post row, which
+the counter update would lock anyway, so that concurrent reactions on
+the post are serialized. The second one is a set-based statement that
+removes or adds the user in the relation, removes the opposite reaction
+and adjusts the likes and dislikes counters from the affected row
+counts. Side effects are left to the receivers of 'post_reacted', sent
+inside the transaction, which defer them until it commits. The post's
+status is sent along, so that they need not query it either.
+
+In write-behind mode the post row is neither locked nor updated: only the
+reactions of the user to the post are serialized with an advisory lock,
+and the counter deltas are left to content.write_behind.
+"""
+from django.db import connections, router, transaction
+from django.dispatch import Signal
+from content import write_behind
+from content.models import Post
+
+
+LIKE = 'like'
+DISLIKE = 'dislike'
+
+REACTIONS = {
+    LIKE: ('users_liked', 'likes', 'users_disliked', 'dislikes'),
+    DISLIKE: ('users_disliked', 'dislikes', 'users_liked', 'likes'),
+}
+
+# Sent with 'post_id', 'published', 'reaction', 'active', 'likes',
+# 'dislikes' and the counter 'deltas' in the transaction that toggles
+# a reaction.
+post_reacted = Signal()
+
+LOCK_SQL = 'SELECT 1 FROM {post_table} WHERE {pk_column} = %s FOR UPDATE'
+
+USER_LOCK_SQL = 'SELECT pg_advisory_xact_lock(%s, %s)'
+
+# Advisory lock keys are 32-bit integers.
+LOCK_KEY_MASK = 0x7FFFFFFF
+
+TOGGLE_CTE = """
+WITH removed AS (
+    DELETE FROM {table}
+    WHERE {post_column} = %(post)s AND {user_column} = %(user)s
+    RETURNING 1
+), removed_opposite AS (
+    DELETE FROM {opposite_table}
+    WHERE {opposite_post_column} = %(post)s
+        AND {opposite_user_column} = %(user)s
+        AND NOT EXISTS (SELECT 1 FROM removed)
+    RETURNING 1
+), added AS (
+    INSERT INTO {table} ({post_column}, {user_column})
+    SELECT %(post)s, %(user)s WHERE NOT EXISTS (SELECT 1 FROM removed)
+    ON CONFLICT DO NOTHING
+    RETURNING 1
+)
+"""
+
+TOGGLE_SQL = TOGGLE_CTE + """
+UPDATE {post_table} SET
+    {counter} = GREATEST({counter} - (SELECT COUNT(*) FROM removed)
+                         + (SELECT COUNT(*) FROM added), 0),
+    {opposite_counter} = GREATEST({opposite_counter}
+                                  - (SELECT COUNT(*) FROM removed_opposite), 0)
+WHERE {pk_column} = %(post)s
+RETURNING {likes_column}, {dislikes_column}, {deltas}
+"""
+
+# Returns the deltas of the reaction and opposite counters.
+TOGGLE_DELTAS_SQL = TOGGLE_CTE + """
+SELECT {deltas}
+"""
+
+DELTAS = """(SELECT COUNT(*) FROM added) - (SELECT COUNT(*) FROM removed),
+    -(SELECT COUNT(*) FROM removed_opposite),
+    NOT EXISTS (SELECT 1 FROM removed)"""
+
+
+def get_lock_sql(connection):
+    quote = connection.ops.quote_name
+    return LOCK_SQL.format(post_table=quote(Post._meta.db_table),
+                           pk_column=quote(Post._meta.pk.column))
+
+
+def get_toggle_sql(reaction, connection, deltas=False):
+    relation, counter, opposite, opposite_counter = REACTIONS[reaction]
+    field = Post._meta.get_field(relation)
+    opposite_field = Post._meta.get_field(opposite)
+    quote = connection.ops.quote_name
+    sql = TOGGLE_DELTAS_SQL if deltas else TOGGLE_SQL
+    return sql.format(
+        table=quote(field.m2m_db_table()),
+        post_column=quote(field.m2m_column_name()),
+        user_column=quote(field.m2m_reverse_name()),
+        opposite_table=quote(opposite_field.m2m_db_table()),
+        opposite_post_column=quote(opposite_field.m2m_column_name()),
+        opposite_user_column=quote(opposite_field.m2m_reverse_name()),
+        post_table=quote(Post._meta.db_table),
+        pk_column=quote(Post._meta.pk.column),
+        counter=quote(Post._meta.get_field(counter).column),
+        opposite_counter=quote(Post._meta.get_field(opposite_counter).column),
+        likes_column=quote(Post._meta.get_field('likes').column),
+        dislikes_column=quote(Post._meta.get_field('dislikes').column),
+        deltas=DELTAS,
+    )
+
+
+def toggle_reaction(post, user, reaction):
+    """
+    Toggle the user's like or dislike of the post, removing the opposite
+    reaction. Return whether the reaction is now set, and the likes and
+    dislikes counters of the post after the change.
+    """
+    using = router.db_for_write(Post)
+    connection = connections[using]
+    params = {'post': post.pk, 'user': user.pk}
+    behind = write_behind.is_enabled()
+    with transaction.atomic(using=using):
+        if behind:
+            with connection.cursor() as cursor:
+                cursor.execute(USER_LOCK_SQL, [post.pk & LOCK_KEY_MASK,
+                                               user.pk & LOCK_KEY_MASK])
+                cursor.execute(
+                    get_toggle_sql(reaction, connection, deltas=True), params)
+                delta, opposite_delta, active = cursor.fetchone()
+        else:
+            with connection.cursor() as cursor:
+                cursor.execute(get_lock_sql(connection), [post.pk])
+                cursor.execute(get_toggle_sql(reaction, connection), params)
+                likes, dislikes, delta, opposite_delta, active = (
+                    cursor.fetchone())
+        _, counter, _, opposite_counter = REACTIONS[reaction]
+        deltas = {counter: delta, opposite_counter: opposite_delta}
+        if behind:
+            write_behind.add(post.pk, deltas)
+            counters = write_behind.get_counters(post.pk, deltas)
+            likes, dislikes = counters['likes'], counters['dislikes']
+        post_reacted.send(sender=Post, post_id=post.pk,
+                          published=post.status == Post.Status.PUBLISHED,
+                          reaction=reaction, active=active, likes=likes,
+                          dislikes=dislikes, deltas=deltas)
+    return active, likes, dislikes
@@ -0,0 +1,111 @@
+"""
+Post search.
+
+The default trigram mode matches titles with the similarity operator (%)
+and orders them by trigram distance (<->), both of which are served by
+the GiST index on Post.title: the bare distance in ORDER BY lets the
+index return the closest titles first, without sorting all matches. The
+operator compares against pg_trgm.similarity_threshold, so searches run
+inside similarity_threshold().
+
+The full-text mode matches the stored, weighted Post.search_vector of
+title and body against a websearch query through its GIN index and
+orders posts by ts_rank.
+
+Distances are single precision (real) and are compared as RealField,
+ranks are cast from real to double precision, so that cursor pagination
+compares both exactly. Ties are ordered by publish date.
+"""
+import struct
+from contextlib import contextmanager
+from django.conf import settings
+from django.contrib.postgres.search import (SearchHeadline,
+                                           SearchQuery,
+                                           SearchRank,
+                                           TrigramDistance)
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
+from django.db import connections, router, transaction
+from content.models import Post, SEARCH_CONFIG
+
+
+FULLTEXT_MODE = 'fulltext'
+
+
+class RealField(FloatField):
+    """
+    Single precision float. Values compared with it are rounded to single
+    precision, so that the decimal values read back, e.g. in pagination
+    cursors, match the rows exactly.
+    """
+    def db_type(self, connection):
+        return 'real'
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        if value is None:
+            return None
+        return struct.unpack('f', struct.pack('f', value))[0]
+
+
+@contextmanager
+def similarity_threshold(threshold=None):
+    """
+    Run the block in a transaction with pg_trgm.similarity_threshold
+    set to 'threshold', by default SEARCH_SIMILARITY_THRESHOLD.
+    """
+    if threshold is None:
+        threshold = settings.SEARCH_SIMILARITY_THRESHOLD
+    using = router.db_for_read(Post)
+    with transaction.atomic(using=using):
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                "SELECT set_config('pg_trgm.similarity_threshold', %s, true)",
+                [str(threshold)]
+            )
+        yield
+
+
+def search_titles(queryset, query):
+    """
+    Filter the posts to titles similar to 'query', closest first.
+    """
+    return queryset.filter(title__trigram_similar=query).annotate(
+        distance=TrigramDistance('title', query, output_field=RealField())
+    ).order_by('distance', '-publish')
+
+
+def search_fulltext(queryset, query):
+    """
+    Filter the posts to those matching the websearch 'query' in title
+    or body, best ranked first.
+    """
+    search_query = get_search_query(query)
+    return queryset.filter(search_vector=search_query).annotate(
+        rank=Cast(SearchRank(F('search_vector'), search_query), FloatField())
+    ).order_by('-rank', '-publish')
+
+
+def search_posts(queryset, query, mode=None):
+    """
+    Search the posts in the given mode, by title trigrams by default.
+    """
+    if mode == FULLTEXT_MODE:
+        return search_fulltext(queryset, query)
+    return search_titles(queryset, query)
+
+
+def get_headlines(pks, query):
+    """
+    Return the body snippets of the posts with the words matching
+    the websearch 'query' highlighted, by primary key.
+    """
+    headline = SearchHeadline('body', get_search_query(query),
+                              config=SEARCH_CONFIG,
+                              start_sel='<b>', stop_sel='</b>')
+    return dict(Post.objects.filter(pk__in=pks).annotate(
+        headline=headline).values_list('pk', 'headline'))
+
+
+def get_search_query(query):
+    return SearchQuery(query, search_type='websearch', config=SEARCH_CONFIG)
@@ -1,71 +1,124 @@
-from django.db import models
 from django.db.models.signals import (m2m_changed,
                                       post_save,
                                       pre_save,
                                       post_delete)
 from django.dispatch import receiver
+from django.contrib.auth import get_user_model
 from content.models import Post, Comment
-from redis import StrictRedis
-from django.conf import settings
+from content.api import cache
+from content import trending, write_behind
+from content.reactions import post_reacted
+from taggit.models import Tag
+from blog import counters
+
+
+counters.register(Post, 'status')
+counters.register(Comment, 'active')
+
+
+def comments_count_change(post_id, delta):
+    """
+    Adjust the comments_count field of a post and its trending scores.
+    """
+    write_behind.adjust(post_id, 'comments_count', delta)
+    trending.record(post_id, {'comments_count': delta})
 
 
 @receiver(m2m_changed, sender=Post.users_liked.through)
-def users_liked_change(sender, instance, **kwargs):
+def users_liked_change(sender, instance, action, **kwargs):
     """
     Signal handler to update the number of likes on a post
     when the many-to-many relation 'users_liked' changes.
     """
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    previous_likes = instance.likes
     instance.likes = instance.users_liked.count()
     instance.save(update_fields=['likes'])
-
-    # Connect to Redis and update the ZSET storing popular posts:
-    redis_client = StrictRedis.from_url(settings.REDIS_URL)
-    redis_client.zadd('popular_posts',
-                      {instance.pk: instance.likes})
-
-    redis_client.zremrangebyrank('popular_posts', 0, -11)
+    write_behind.discard(instance.pk, 'likes')
+    trending.record(instance.pk, {'likes': instance.likes - previous_likes})
 
 
 @receiver(m2m_changed, sender=Post.users_disliked.through)
-def users_disliked_change(sender, instance, **kwargs):
+def users_disliked_change(sender, instance, action, **kwargs):
     """
-    Signal handler to update the number of likes on a post
+    Signal handler to update the number of dislikes on a post
     when the many-to-many relation 'users_disliked' changes.
     """
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    previous_dislikes = instance.dislikes
     instance.dislikes = instance.users_disliked.count()
-    instance.save()
+    instance.save(update_fields=['dislikes'])
+    write_behind.discard(instance.pk, 'dislikes')
+    trending.record(instance.pk,
+                    {'dislikes': instance.dislikes - previous_dislikes})
 
-    # Connect to Redis and update the ZSET storing popular posts:
-    redis_client = StrictRedis.from_url(settings.REDIS_URL)
-    redis_client.zadd('popular_posts',
-                      {instance.pk: instance.likes})
 
-    redis_client.zremrangebyrank('popular_posts', 0, -11)
+@receiver(post_reacted, sender=Post)
+def post_reacted_change(sender, post_id, deltas, published, **kwargs):
+    """
+    Signal handler to update the trending posts and invalidate
+    cached responses of a post when a user likes or dislikes it.
+    """
+    trending.record(post_id, deltas, published=published)
+    cache.invalidate_post(post_id)
+
+
+@receiver(post_save, sender=Post)
+def update_post_counters(sender, instance, created, raw, **kwargs):
+    """
+    Signal handler to update the per-status post counters
+    when a post is created or its status changes, and to remove
+    unpublished posts from the trending posts.
+    """
+    if raw:
+        return
+    previous_status = getattr(instance, '_loaded_status', None)
+    if created:
+        counters.adjust(Post, instance.status, 1)
+    elif previous_status is not None and previous_status != instance.status:
+        counters.move(Post, previous_status, instance.status)
+        if instance.status != Post.Status.PUBLISHED:
+            trending.remove(instance.pk)
+    instance._loaded_status = instance.status
+
+
+@receiver(post_delete, sender=Post)
+def decrement_post_counters(sender, instance, **kwargs):
+    """
+    Signal handler to update the per-status post counters
+    and the trending posts when a post is deleted.
+    """
+    counters.adjust(Post, instance.status, -1)
+    trending.remove(instance.pk)
 
 
 @receiver(post_save, sender=Comment)
 def increment_post_comments_count(sender, instance, created, raw, **kwargs):
     """
     Signal handler to increment the comments_count field
-    when a new comment is created for a post.
+    when a new active comment or reply is created for a post.
     """
     if raw:
         return
     if created:
-        Post.objects.filter(pk=instance.post.pk).update(
-            comments_count=models.F('comments_count') + 1
-        )
+        if instance.active:
+            comments_count_change(instance.post_id, 1)
+        counters.adjust(Comment, instance.active, 1)
+    instance._loaded_active = instance.active
 
 
 @receiver(post_delete, sender=Comment)
 def decrement_post_comments_count(sender, instance, **kwargs):
     """
     Signal handler to decrement the comments_count field
-    when a comment is deleted from a post.
+    when an active comment is deleted from a post, including
+    replies deleted along with the comment they reply to.
     """
-    Post.objects.filter(pk=instance.post.pk).update(
-        comments_count=models.F('comments_count') - 1
-    )
+    if instance.active:
+        comments_count_change(instance.post_id, -1)
+    counters.adjust(Comment, instance.active, -1)
 
 
 @receiver(pre_save, sender=Comment)
@@ -79,13 +132,89 @@ def increment_or_decrement_post_comments_count(sender, instance, raw, **kwargs):
     if not instance.pk:
         return
 
-    comment = Comment.objects.get(pk=instance.pk)
-    if comment.active != instance.active:
-        if instance.active:
-            Post.objects.filter(pk=instance.post.pk).update(
-                comments_count=models.F('comments_count') + 1
-            )
-        else:
-            Post.objects.filter(pk=instance.post.pk).update(
-                comments_count=models.F('comments_count') - 1
-            )
\ No newline at end of file
+    previous_active = getattr(instance, '_loaded_active', None)
+    if previous_active is None:
+        previous_active = Comment.objects.values_list(
+            'active', flat=True).get(pk=instance.pk)
+    if previous_active != instance.active:
+        counters.move(Comment, previous_active, instance.active)
+        comments_count_change(instance.post_id,
+                              1 if instance.active else -1)
+
+
+# Post fields rendered or filtered on in the similar posts of others.
+SIMILAR_POST_FIELDS = {'title', 'status', 'publish'}
+
+
+@receiver([post_save, post_delete], sender=Post)
+def invalidate_post_cache(sender, instance, **kwargs):
+    """
+    Signal handler to invalidate cached responses of a post
+    and of the trending windows ranking it when it is saved or deleted,
+    and the cached details listing it as similar post unless only
+    other fields were saved.
+    """
+    if kwargs.get('raw'):
+        return
+    cache.invalidate_post(instance.pk)
+    trending.touch(instance.pk)
+    update_fields = kwargs.get('update_fields')
+    if update_fields is None or SIMILAR_POST_FIELDS & update_fields:
+        cache.invalidate_similar_posts()
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def invalidate_post_cache_on_tags_change(sender, instance, action, **kwargs):
+    """
+    Signal handler to invalidate cached responses of a post,
+    of the trending windows ranking it and of the details listing it
+    as similar post when its tags change.
+    """
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        cache.invalidate_post(instance.pk)
+        cache.invalidate_similar_posts()
+        trending.touch(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Comment)
+def invalidate_post_cache_on_comment_change(sender, instance, **kwargs):
+    """
+    Signal handler to invalidate cached responses of a post
+    when one of its comments is saved or deleted.
+    """
+    if kwargs.get('raw'):
+        return
+    cache.invalidate_post(instance.post_id)
+
+
+@receiver([post_save, post_delete], sender=Tag)
+@receiver(post_delete, sender=get_user_model())
+def invalidate_all_post_cache(sender, **kwargs):
+    """
+    Signal handler to invalidate all cached post responses
+    when a tag is changed or a user is deleted.
+    """
+    if kwargs.get('raw'):
+        return
+    cache.invalidate_all()
+
+
+@receiver(post_save, sender=get_user_model())
+def invalidate_all_post_cache_on_user_change(sender, instance, created, raw,
+                                             update_fields, **kwargs):
+    """
+    Signal handler to invalidate all cached post responses
+    when the username or email of a user, rendered with posts
+    and comments, changes. New users and other changes, e.g. of
+    the password or last login, keep the cache.
+    """
+    if raw:
+        return
+    if update_fields is not None and not {'username', 'email'} & update_fields:
+        return
+    previous = (getattr(instance, '_loaded_username', None),
+                getattr(instance, '_loaded_email', None))
+    current = (instance.username, instance.email)
+    if not created and previous != current:
+        cache.invalidate_all()
+    instance._loaded_username, instance._loaded_email = current
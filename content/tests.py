@@ -1,3 +1,1030 @@
-from django.test import TestCase
+import json
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+from redis import RedisError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from blog import counters
+from blog.planner import plan_queryset
+from blog.testing import SHARED_REDIS_CACHES, FakeRedisMixin
+from blog.values import ValuesSerializer
+from content import moderation, trending, write_behind
+from content.api.cache import POST_VERSION_KEY
+from content.api.v1.serializers import PostListSerializer
+from content.api.v1.views import PostPagination
+from content.api.v2.serializers import (
+    CommentReadSerializer, PostListSerializer as PostListSerializerV2)
+from content.reactions import LIKE, toggle_reaction
+from content.models import Comment, CounterFlush, Post
 
-# Create your tests here.
+
+API_URL = '/api/v1/content/'
+
+
+def create_user(name, **kwargs):
+    return get_user_model().objects.create_user(
+        email=f'{name}@local.host', password='password', username=name,
+        **kwargs)
+
+
+def create_post(author, title, **kwargs):
+    kwargs.setdefault('status', Post.Status.PUBLISHED)
+    return Post.objects.create(author=author, title=title, body='Body',
+                               **kwargs)
+
+
+class ReactionCountersTest(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = create_user('author')
+        self.user = create_user('reader')
+        self.post = create_post(self.author, 'Post')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def react(self, reaction):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'{API_URL}{reaction}/',
+                                        {'post': self.post.pk})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def assertCounters(self, likes, dislikes):
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.likes, self.post.dislikes),
+                         (likes, dislikes))
+        self.assertEqual(self.post.users_liked.count(), likes)
+        self.assertEqual(self.post.users_disliked.count(), dislikes)
+
+    def test_like_toggles(self):
+        data = self.react('like')
+        self.assertEqual((data['likes'], data['dislikes']), (1, 0))
+        self.assertCounters(1, 0)
+
+        data = self.react('like')
+        self.assertEqual((data['likes'], data['dislikes']), (0, 0))
+        self.assertCounters(0, 0)
+
+    def test_dislike_removes_like(self):
+        self.react('like')
+        data = self.react('dislike')
+        self.assertEqual((data['likes'], data['dislikes']), (0, 1))
+        self.assertCounters(0, 1)
+
+        data = self.react('like')
+        self.assertEqual((data['likes'], data['dislikes']), (1, 0))
+        self.assertCounters(1, 0)
+
+    def test_toggle_statements(self):
+        post = Post.published.only('id', 'title', 'status').get(
+            pk=self.post.pk)
+        # The savepoint, the row lock, the toggle and the release.
+        with self.assertNumQueries(4):
+            toggle_reaction(post, self.user, LIKE)
+
+
+
+
+@override_settings(CACHES=SHARED_REDIS_CACHES)
+class RedisSideEffectsTest(FakeRedisMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = create_user('reader')
+        self.post = Post.published.only('id', 'title', 'status').get(
+            pk=create_post(create_user('author'), 'Post').pk)
+        trending.rebuild('all')
+
+    def test_toggle_sends_one_pipeline(self):
+        with mock.patch.object(self.redis, 'pipeline',
+                               wraps=self.redis.pipeline) as pipeline:
+            toggle_reaction(self.post, self.user, LIKE)
+        pipeline.assert_called_once()
+        self.assertEqual(
+            self.redis.zscore(trending.TRENDING_KEY.format(window='all'),
+                              self.post.pk), 1)
+        self.assertTrue(self.redis.keys(
+            '*' + POST_VERSION_KEY.format(pk=self.post.pk)))
+
+    def test_rolled_back_toggle_sends_nothing(self):
+        with mock.patch.object(self.redis, 'pipeline',
+                               wraps=self.redis.pipeline) as pipeline:
+            with self.assertRaises(ValueError):
+                with transaction.atomic():
+                    toggle_reaction(self.post, self.user, LIKE)
+                    raise ValueError
+        pipeline.assert_not_called()
+        self.assertEqual(
+            self.redis.zscore(trending.TRENDING_KEY.format(window='all'),
+                              self.post.pk), 0)
+
+
+class ValuesRenderingTest(TestCase):
+    def setUp(self):
+        author = create_user('author')
+        user = create_user('reader')
+        for index in range(3):
+            post = create_post(author, f'Post {index}')
+            post.tags.add(f'tag{index}', 'shared')
+            comment = Comment.objects.create(post=post, user=user,
+                                             body='Comment')
+            Comment.objects.create(post=post, user=author, body='Reply',
+                                   parent=comment)
+        create_post(author, 'Untagged')
+
+    def assertRenderedLikeSerializer(self, url, serializer_class, queryset):
+        self.assertTrue(ValuesSerializer(serializer_class()).supported)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        request = APIRequestFactory().get(url)
+        serializer = serializer_class(
+            queryset, many=True, context={'request': Request(request)})
+        expected = json.loads(JSONRenderer().render(serializer.data))
+        self.assertEqual(sorted(results, key=lambda item: item['id']),
+                         sorted(expected, key=lambda item: item['id']))
+
+    def test_post_list(self):
+        for url, serializer_class in (
+                (f'{API_URL}posts/', PostListSerializer),
+                ('/api/v2/content/posts/', PostListSerializerV2)):
+            with self.subTest(url=url):
+                self.assertRenderedLikeSerializer(url, serializer_class,
+                                                  Post.published.all())
+
+    def test_comment_list(self):
+        self.assertRenderedLikeSerializer('/api/v2/content/comments/',
+                                          CommentReadSerializer,
+                                          Comment.objects.all())
+
+
+# Flushes commit their own transactions, so that the hashes of a batch are
+# dropped once it is applied, as they are outside of tests.
+@override_settings(COUNTER_WRITE_BEHIND=True)
+class WriteBehindTest(FakeRedisMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = create_user('reader')
+        self.post = create_post(create_user('author'), 'Post')
+
+    def assertCounters(self, likes, dislikes=0, comments_count=0):
+        self.post.refresh_from_db()
+        self.assertEqual(
+            (self.post.likes, self.post.dislikes, self.post.comments_count),
+            (likes, dislikes, comments_count))
+
+    def test_reactions_are_buffered(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post(f'{API_URL}like/', {'post': self.post.pk})
+        self.assertEqual((response.data['likes'], response.data['dislikes']),
+                         (1, 0))
+        response = client.post(f'{API_URL}dislike/', {'post': self.post.pk})
+        self.assertEqual((response.data['likes'], response.data['dislikes']),
+                         (0, 1))
+
+        self.assertCounters(0)
+        self.assertEqual(write_behind.get_pending([self.post.pk]),
+                         {self.post.pk: {'dislikes': 1}})
+        self.assertEqual(write_behind.flush(), 1)
+        self.assertCounters(0, 1)
+        self.assertEqual(write_behind.get_pending([self.post.pk]), {})
+
+    def test_flush_applies_deltas_once(self):
+        write_behind.add(self.post.pk, {'likes': 2, 'dislikes': 1})
+        write_behind.add(self.post.pk, {'likes': 1, 'comments_count': 3})
+
+        self.assertEqual(write_behind.flush(), 1)
+        self.assertCounters(3, 1, 3)
+        self.assertEqual(write_behind.flush(), 0)
+        self.assertCounters(3, 1, 3)
+
+    def test_flush_skips_applied_batch_left_behind(self):
+        write_behind.add(self.post.pk, {'likes': 2})
+        # The batch is applied, but its hashes are not dropped.
+        with mock.patch.object(write_behind, 'DROP_BATCH', 'return nil'):
+            self.assertEqual(write_behind.flush(), 1)
+        self.assertCounters(2)
+        write_behind.add(self.post.pk, {'likes': 1})
+
+        self.assertEqual(write_behind.flush(), 1)
+        self.assertCounters(3)
+        self.assertEqual(write_behind.get_pending([self.post.pk]), {})
+
+    def test_flush_applies_batch_of_failed_flush(self):
+        write_behind.add(self.post.pk, {'likes': 2})
+        with mock.patch.object(write_behind, 'get_flush_sql',
+                               side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                write_behind.flush()
+        self.assertCounters(0)
+        self.assertFalse(CounterFlush.objects.exists())
+        write_behind.add(self.post.pk, {'likes': 1})
+
+        self.assertEqual(write_behind.flush(), 2)
+        self.assertCounters(3)
+        self.assertEqual(write_behind.flush(), 0)
+        self.assertCounters(3)
+
+    def test_flush_skipped_while_locked(self):
+        write_behind.add(self.post.pk, {'likes': 1})
+        lock = self.redis.lock(write_behind.FLUSH_LOCK_KEY)
+        lock.acquire()
+
+        self.assertIsNone(write_behind.flush())
+        self.assertCounters(0)
+
+        lock.release()
+        self.assertEqual(write_behind.flush(), 1)
+        self.assertCounters(1)
+
+
+class TargetObjectTest(TestCase):
+    def setUp(self):
+        self.author = create_user('author')
+        self.post = create_post(self.author, 'Post')
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def test_safe_request_defers_columns(self):
+        url = f'{API_URL}posts/{self.post.pk}/?fields=title'
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.data, {'title': 'Post'})
+        sql = [query['sql'] for query in queries.captured_queries
+               if 'FROM "content_post"' in query['sql']]
+        self.assertEqual(len(sql), 1)
+        self.assertNotIn('"body"', sql[0])
+        self.assertIn('"author_id"', sql[0])
+
+    def test_draft_hidden_from_others(self):
+        self.post.status = Post.Status.DRAFT
+        self.post.save()
+        self.client.force_authenticate(create_user('reader'))
+        response = self.client.get(
+            f'{API_URL}posts/{self.post.pk}/?fields=title')
+        self.assertEqual(response.status_code, 404)
+
+    def test_owner_update(self):
+        response = self.client.put(
+            f'{API_URL}posts/{self.post.pk}/',
+            {'title': 'Edited', 'body': 'Body', 'tags': [],
+             'status': Post.Status.PUBLISHED}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.title, 'Edited')
+
+
+@override_settings(CACHES=SHARED_REDIS_CACHES)
+class ResponseCacheTest(FakeRedisMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = create_user('author')
+        self.post = create_post(self.author, 'Post')
+        self.similar = create_post(self.author, 'Similar')
+        self.post.tags.add('django')
+        self.similar.tags.add('django')
+        self.client = APIClient()
+        self.url = f'{API_URL}posts/{self.post.pk}/'
+
+    def get(self, url=None):
+        response = self.client.get(url or self.url)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_hit_skips_database(self):
+        data = self.get()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get(), data)
+
+    def test_post_change_invalidates_detail(self):
+        self.get()
+        self.post.title = 'Edited'
+        self.post.save()
+        self.assertEqual(self.get()['title'], 'Edited')
+
+    def test_similar_post_change_invalidates_detail(self):
+        self.assertEqual(
+            [post['title'] for post in self.get()['similar_posts']],
+            ['Similar'])
+        self.similar.title = 'Renamed'
+        self.similar.save()
+        self.assertEqual(
+            [post['title'] for post in self.get()['similar_posts']],
+            ['Renamed'])
+
+        self.similar.tags.clear()
+        self.assertEqual(self.get()['similar_posts'], [])
+
+    def test_counter_save_keeps_other_details(self):
+        self.get()
+        self.similar.save(update_fields=['likes'])
+        with self.assertNumQueries(0):
+            self.get()
+
+    def test_redis_error_skips_cache(self):
+        self.get()
+        client = mock.AsyncMock()
+        client.mget.side_effect = RedisError
+        with mock.patch('blog.redis_client.get_async_client',
+                        return_value=client):
+            self.assertEqual(self.get()['title'], 'Post')
+            self.assertEqual(len(self.get(f'{API_URL}posts/')['results']), 2)
+            self.get(f'{API_URL}posts/popular/')
+        client.set.assert_not_called()
+
+    def test_redis_error_on_set(self):
+        client = mock.AsyncMock()
+        client.mget.return_value = [None, None, None, None]
+        client.set.side_effect = RedisError
+        with mock.patch('blog.redis_client.get_async_client',
+                        return_value=client):
+            self.assertEqual(self.get()['title'], 'Post')
+
+
+class RebuildTrendingTest(FakeRedisMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        author = create_user('author')
+        self.posts = [create_post(author, f'Post {index}', likes=index)
+                      for index in range(5)]
+        self.key = trending.TRENDING_KEY.format(window='all')
+
+    def get_ranked(self):
+        return [int(post_id)
+                for post_id in self.redis.zrevrange(self.key, 0, -1)]
+
+    def test_rebuild_replaces_window(self):
+        self.redis.zadd(self.key, {self.posts[0].pk: 100, 12345: 50})
+        self.posts[1].status = Post.Status.DRAFT
+        self.posts[1].save()
+
+        drift = trending.rebuild('all', chunk_size=2)
+        expected = [post.pk for post in reversed(self.posts)
+                    if post != self.posts[1]]
+        self.assertEqual(self.get_ranked(), expected)
+        self.assertEqual(drift['scored'], 4)
+        self.assertEqual(drift['missing'], expected[:3])
+        self.assertEqual(drift['stale'], [12345])
+        self.assertEqual(drift['unpublished'], [12345])
+        self.assertEqual(drift['moved'], 1)
+        self.assertEqual(self.redis.keys('trending:all:staging:*'), [])
+        self.assertEqual(self.redis.ttl(self.key), -1)
+
+    def test_rebuild_trims_to_size(self):
+        with override_settings(TRENDING_SIZE=2):
+            drift = trending.rebuild('all', chunk_size=2)
+        self.assertEqual(drift['ranked'], 2)
+        self.assertEqual(self.get_ranked(),
+                         [self.posts[4].pk, self.posts[3].pk])
+
+    def test_rebuild_without_posts(self):
+        self.redis.zadd(self.key, {self.posts[0].pk: 1})
+        Post.objects.all().delete()
+        drift = trending.rebuild('all')
+        self.assertEqual(drift['scored'], 0)
+        self.assertFalse(self.redis.exists(self.key))
+        self.assertTrue(self.redis.exists(
+            trending.EPOCH_KEY.format(window='all')))
+
+    def test_command(self):
+        out = StringIO()
+        call_command('rebuild_trending', 'all', '24h', stdout=out)
+        self.assertIn('all: 5 posts scored, 5 ranked, 5 missing',
+                      out.getvalue())
+        self.assertIn('24h: 5 posts scored', out.getvalue())
+        self.assertEqual(self.get_ranked(),
+                         [post.pk for post in reversed(self.posts)])
+
+
+class TrendingTest(FakeRedisMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        author = create_user('author')
+        self.posts = [create_post(author, f'Post {index}', likes=index)
+                      for index in range(3)]
+        self.draft = create_post(author, 'Draft', status=Post.Status.DRAFT,
+                                 likes=10)
+        self.ranked = [post.pk for post in reversed(self.posts)]
+
+    def test_cold_window_built_by_read(self):
+        self.assertEqual(trending.get_post_ids('all'), self.ranked)
+        self.assertTrue(self.redis.exists(trending.EPOCH_KEY.format(
+            window='all')))
+        with self.assertNumQueries(0):
+            self.assertEqual(trending.get_post_ids('all'), self.ranked)
+
+    def test_cold_window_ranked_in_database_while_rebuilt(self):
+        lock = self.redis.lock(trending.REBUILD_LOCK_KEY.format(window='all'))
+        lock.acquire()
+        self.assertEqual(trending.get_post_ids('all'), self.ranked)
+        self.assertFalse(self.redis.exists(trending.EPOCH_KEY.format(
+            window='all')))
+
+    def test_ranked_in_database_without_redis(self):
+        with mock.patch('blog.redis_client.get_client', return_value=None):
+            self.assertEqual(trending.get_post_ids('all'), self.ranked)
+        client = mock.Mock()
+        client.pipeline.side_effect = RedisError
+        with mock.patch('blog.redis_client.get_client', return_value=client):
+            self.assertEqual(trending.get_post_ids('all'), self.ranked)
+
+    def test_record_ranks_published_posts(self):
+        trending.get_post_ids('all')
+        trending.record(self.posts[0].pk, {'likes': 3})
+        trending.record(self.draft.pk, {'likes': 1})
+        self.assertEqual(trending.get_post_ids('all'),
+                         [self.posts[0].pk, *self.ranked[:2]])
+
+    def test_record_without_built_window(self):
+        trending.record(self.posts[0].pk, {'likes': 3})
+        self.assertFalse(self.redis.exists(trending.TRENDING_KEY.format(
+            window='all')))
+
+    def test_size(self):
+        with override_settings(TRENDING_SIZE=2):
+            self.assertEqual(trending.get_post_ids('all'), self.ranked[:2])
+            trending.record(self.posts[0].pk, {'likes': 3})
+            self.assertEqual(trending.get_post_ids('all'),
+                             [self.posts[0].pk, self.ranked[0]])
+
+    def test_decay(self):
+        half_life = settings.TRENDING_WINDOWS['24h']
+        Post.objects.update(likes=0)
+        now = time.time()
+        with mock.patch('time.time', return_value=now):
+            trending.rebuild('24h')
+        first, second = self.posts[:2]
+        with mock.patch('time.time', return_value=now):
+            trending.record(first.pk, {'likes': 3})
+        # An event one half-life later counts twice as much.
+        with mock.patch('time.time', return_value=now + half_life):
+            trending.record(second.pk, {'likes': 2})
+        key = trending.TRENDING_KEY.format(window='24h')
+        self.assertAlmostEqual(self.redis.zscore(key, first.pk), 3)
+        self.assertAlmostEqual(self.redis.zscore(key, second.pk), 4)
+        self.assertEqual(trending.get_post_ids('24h')[:2],
+                         [second.pk, first.pk])
+
+    def test_popular_posts_window(self):
+        client = APIClient()
+        response = client.get(f'{API_URL}posts/popular/',
+                              {'window': '7d', 'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([post['id'] for post in response.data['results']],
+                         self.ranked[:2])
+        response = client.get(f'{API_URL}posts/popular/', {'window': '1y'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(CACHES=SHARED_REDIS_CACHES)
+class TrendingCacheTest(FakeRedisMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        author = create_user('author')
+        self.posts = [create_post(author, f'Post {index}', likes=index)
+                      for index in range(3)]
+        trending.rebuild('all')
+        self.client = APIClient()
+        self.url = f'{API_URL}posts/popular/'
+
+    def get_titles(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return [post['title'] for post in response.data['results']]
+
+    def test_hit_skips_database(self):
+        self.assertEqual(self.get_titles(), ['Post 2', 'Post 1', 'Post 0'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_titles(limit=1, offset=1), ['Post 1'])
+
+    def test_ranking_change_invalidates(self):
+        self.get_titles()
+        trending.record(self.posts[0].pk, {'likes': 5}, published=True)
+        self.assertEqual(self.get_titles(), ['Post 0', 'Post 2', 'Post 1'])
+
+    def test_ranked_post_edit_invalidates(self):
+        self.get_titles()
+        self.posts[1].title = 'Edited'
+        self.posts[1].save()
+        self.assertEqual(self.get_titles(), ['Post 2', 'Edited', 'Post 0'])
+
+    def test_unranked_post_edit_keeps_payload(self):
+        self.get_titles()
+        draft = create_post(self.posts[0].author, 'Draft',
+                            status=Post.Status.DRAFT)
+        draft.title = 'Edited draft'
+        draft.save()
+        with self.assertNumQueries(0):
+            self.get_titles()
+
+
+class CommentThreadTest(TestCase):
+    def setUp(self):
+        self.user = create_user('reader')
+        self.post = create_post(create_user('author'), 'Post')
+        self.first = self.create_comment()
+        self.second = self.create_comment()
+        self.reply = self.create_comment(parent=self.first)
+        self.nested = self.create_comment(parent=self.reply)
+        inactive = self.create_comment(parent=self.second, active=False)
+        self.create_comment(parent=inactive)
+        self.client = APIClient()
+
+    def create_comment(self, **kwargs):
+        return Comment.objects.create(post=self.post, user=self.user,
+                                      body='Comment', **kwargs)
+
+    def get_ids(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return [comment['id'] for comment in response.data['results']]
+
+    def test_paths(self):
+        self.assertEqual((self.first.depth, self.reply.depth,
+                          self.nested.depth), (0, 1, 2))
+        self.assertTrue(self.nested.path.startswith(self.reply.path))
+        self.assertTrue(self.reply.path.startswith(self.first.path))
+        # Newer threads sort first, replies in order of creation.
+        self.assertLess(self.second.path, self.first.path)
+        self.assertEqual(
+            list(self.first.get_thread().values_list('pk', flat=True)),
+            [self.first.pk, self.reply.pk, self.nested.pk])
+
+    def test_post_threads(self):
+        url = f'{API_URL}posts/{self.post.pk}/threads/'
+        self.assertEqual(self.get_ids(url), [
+            self.second.pk, self.first.pk, self.reply.pk, self.nested.pk])
+
+        response = self.client.get(url, {'page_size': 1})
+        self.assertEqual(
+            [comment['id'] for comment in response.data['results']],
+            [self.second.pk])
+        self.assertEqual(self.get_ids(response.data['next']),
+                         [self.first.pk, self.reply.pk, self.nested.pk])
+
+    def test_comment_thread(self):
+        self.assertEqual(
+            self.get_ids(f'{API_URL}comments/{self.reply.pk}/thread/'),
+            [self.reply.pk, self.nested.pk])
+
+    def test_path_not_rendered(self):
+        response = self.client.get(f'{API_URL}comments/{self.reply.pk}/')
+        self.assertEqual(response.data['parent'], self.first.pk)
+        self.assertNotIn('path', response.data)
+        self.assertNotIn('depth', response.data)
+
+    def test_reply(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.post(f'{API_URL}comments/', {
+            'post': self.post.pk, 'parent': self.nested.pk, 'body': 'Reply'})
+        self.assertEqual(response.status_code, 201)
+        reply = Comment.objects.get(pk=response.data['id'])
+        self.assertEqual((reply.parent_id, reply.depth),
+                         (self.nested.pk, 3))
+
+        other_post = create_post(self.post.author, 'Other post')
+        response = self.client.post(f'{API_URL}comments/', {
+            'post': other_post.pk, 'parent': self.first.pk, 'body': 'Reply'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_comments_count(self):
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 5)
+        self.first.delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 2)
+
+
+class AsyncReadViewsTest(TestCase):
+    def setUp(self):
+        self.post = create_post(create_user('author'), 'Post', likes=1)
+        self.post.tags.add('django')
+        self.urls = [f'{API_URL}posts/', f'{API_URL}posts/{self.post.pk}/',
+                     f'{API_URL}posts/popular/', f'{API_URL}tags/',
+                     '/api/v2/content/posts/',
+                     f'/api/v2/content/posts/{self.post.pk}/',
+                     '/api/v2/content/posts/popular/',
+                     '/api/v2/content/tags/']
+
+    def test_views_are_async(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.assertTrue(iscoroutinefunction(resolve(url).func))
+
+    async def test_served_on_event_loop(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = await self.async_client.get(url)
+                self.assertEqual(response.status_code, 200)
+        response = await self.async_client.get(
+            f'{API_URL}posts/{self.post.pk}/')
+        self.assertEqual(response.json()['title'], 'Post')
+
+
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        author = create_user('author')
+        now = timezone.now()
+        # Two posts share a publish date to exercise the id tiebreaker.
+        self.posts = [
+            create_post(author, f'Post {index}',
+                        publish=now - timedelta(days=min(index, 3)))
+            for index in range(6)
+        ]
+        create_post(author, 'Draft', status=Post.Status.DRAFT)
+        self.url = f'{API_URL}posts/'
+
+    def get_page(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def get_ids(self, page):
+        return [post['id'] for post in page['results']]
+
+    def test_next_and_previous_pages(self):
+        expected = [post.pk for post in sorted(
+            self.posts, key=lambda post: (post.publish, post.pk),
+            reverse=True)]
+
+        first = self.get_page(self.url, cursor='', page_size=2)
+        self.assertEqual(self.get_ids(first), expected[:2])
+        self.assertIsNone(first['count'])
+        self.assertIsNone(first['previous'])
+
+        second = self.get_page(first['next'])
+        self.assertEqual(self.get_ids(second), expected[2:4])
+        third = self.get_page(second['next'])
+        self.assertEqual(self.get_ids(third), expected[4:])
+        self.assertIsNone(third['next'])
+
+        self.assertEqual(self.get_ids(self.get_page(third['previous'])),
+                         expected[2:4])
+        previous = self.get_page(second['previous'])
+        self.assertEqual(self.get_ids(previous), expected[:2])
+        self.assertIsNone(previous['previous'])
+
+    def test_count_and_invalid_cursor(self):
+        page = self.get_page(self.url, cursor='', count='true')
+        self.assertEqual(page['count'], len(self.posts))
+
+        response = self.client.get(self.url, {'cursor': 'invalid'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_expression_ordering_paginated_by_page(self):
+        request = Request(APIRequestFactory().get(self.url, {'cursor': ''}))
+        paginator = PostPagination()
+        queryset = Post.published.order_by(F('publish').desc(nulls_last=True))
+        page = paginator.paginate_queryset(queryset, request)
+        self.assertFalse(paginator.keyset)
+        self.assertEqual(len(page), len(self.posts))
+
+    def test_comments(self):
+        post = self.posts[0]
+        comments = [Comment.objects.create(post=post, user=post.author,
+                                           body='Comment')
+                    for _ in range(3)]
+        page = self.get_page(f'{API_URL}comments/', cursor='', page_size=2)
+        self.assertEqual(self.get_ids(page),
+                         [comments[2].pk, comments[1].pk])
+        self.assertEqual(self.get_ids(self.get_page(page['next'])),
+                         [comments[0].pk])
+
+    def test_post_comments(self):
+        post = self.posts[0]
+        comments = [Comment.objects.create(post=post, user=post.author,
+                                           body='Comment', active=active)
+                    for active in (True, False, True, True)]
+        Comment.objects.create(post=self.posts[1], user=post.author,
+                               body='Comment')
+        url = f'{API_URL}posts/{post.pk}/comments/'
+        page = self.get_page(url, page_size=2)
+        self.assertEqual(self.get_ids(page), [comments[3].pk, comments[2].pk])
+        self.assertIsNone(page['count'])
+        self.assertEqual(self.get_ids(self.get_page(page['next'])),
+                         [comments[0].pk])
+
+    def test_draft_post_comments(self):
+        draft = Post.objects.get(status=Post.Status.DRAFT)
+        url = f'/api/v2/content/posts/{draft.pk}/comments/'
+        self.assertEqual(self.client.get(url).status_code, 404)
+        client = APIClient()
+        client.force_authenticate(draft.author)
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [])
+
+
+# Counters are adjusted once the writing transactions commit.
+@override_settings(COUNTER_EXACT_THRESHOLD=0)
+class CountersTest(FakeRedisMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = create_user('author')
+        self.post = create_post(self.author, 'Post')
+        create_post(self.author, 'Draft', status=Post.Status.DRAFT)
+        self.key = counters.get_counter_key(Post, Post.Status.PUBLISHED)
+
+    def count(self, queryset):
+        with CaptureQueriesContext(connection) as queries:
+            value = counters.count(queryset)
+        return value, [query['sql'] for query in queries.captured_queries
+                       if 'COUNT(' in query['sql']]
+
+    def test_small_table_counted(self):
+        with override_settings(COUNTER_EXACT_THRESHOLD=1000):
+            value, counts = self.count(Post.published.all())
+        self.assertEqual((value, len(counts)), (1, 1))
+        self.assertIsNone(self.redis.get(self.key))
+
+    def test_counter_seeded_and_adjusted(self):
+        self.assertEqual(self.count(Post.published.all())[0], 1)
+        self.assertEqual(self.count(Post.objects.all())[0], 2)
+        self.assertEqual(int(self.redis.get(self.key)), 1)
+
+        create_post(self.author, 'Other post')
+        draft = Post.objects.get(status=Post.Status.DRAFT)
+        draft.status = Post.Status.PUBLISHED
+        draft.save()
+        self.assertEqual(self.count(Post.published.all()), (3, []))
+        self.assertEqual(self.count(Post.objects.all()), (3, []))
+
+    def test_other_filters_estimated(self):
+        with CaptureQueriesContext(connection) as queries:
+            counters.count(Post.objects.filter(author=self.author))
+        self.assertTrue(queries.captured_queries[-1]['sql'].startswith(
+            'EXPLAIN'))
+
+    def test_reseed(self):
+        counters.count(Post.published.all())
+        self.redis.set(self.key, 10)
+        stale_key = counters.get_counter_key(Post, 'archived')
+        self.redis.set(stale_key, 3)
+
+        self.assertIsNotNone(counters.reseed())
+        self.assertEqual(int(self.redis.get(self.key)), 1)
+        self.assertEqual(int(self.redis.get(counters.get_counter_key(Post))),
+                         2)
+        self.assertFalse(self.redis.exists(stale_key))
+
+    def test_paginated_count(self):
+        response = APIClient().get(f'{API_URL}posts/')
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(int(self.redis.get(self.key)), 1)
+
+
+class ModerationTest(FakeRedisMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = create_user('reader')
+        self.post = create_post(create_user('author'), 'Post')
+        self.other_post = create_post(self.post.author, 'Other post')
+        self.comment = self.create_comment(self.post)
+        self.reply = self.create_comment(self.post, parent=self.comment)
+        self.inactive = self.create_comment(self.post, active=False)
+        self.other = self.create_comment(self.other_post)
+        counters.reseed()
+
+    def create_comment(self, post, **kwargs):
+        return Comment.objects.create(post=post, user=self.user,
+                                      body='Comment', **kwargs)
+
+    def moderate(self, action, comments):
+        return moderation.moderate(
+            action, comment_ids=[comment.pk for comment in comments])
+
+    def assertCommentsCount(self, post, count):
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, count)
+        self.assertEqual(post.comments.filter(active=True).count(), count)
+
+    def assertCountersExact(self):
+        for key, queryset in (
+                (counters.get_counter_key(Comment), Comment.objects.all()),
+                (counters.get_counter_key(Comment, True),
+                 Comment.objects.filter(active=True)),
+                (counters.get_counter_key(Comment, False),
+                 Comment.objects.filter(active=False))):
+            self.assertEqual(int(self.redis.get(key)), queryset.count(), key)
+
+    def test_counters_seeded(self):
+        self.assertCommentsCount(self.post, 2)
+        self.assertCommentsCount(self.other_post, 1)
+        self.assertCountersExact()
+
+    def test_deactivate_and_activate(self):
+        result = self.moderate(moderation.DEACTIVATE,
+                               [self.comment, self.inactive, self.other])
+        self.assertEqual(result['comments'], 2)
+        self.assertEqual(result['posts'], [self.post.pk, self.other_post.pk])
+        self.assertCommentsCount(self.post, 1)
+        self.assertCommentsCount(self.other_post, 0)
+        self.assertCountersExact()
+
+        result = self.moderate(moderation.ACTIVATE,
+                               [self.comment, self.inactive])
+        self.assertEqual(result['comments'], 2)
+        self.assertCommentsCount(self.post, 3)
+        self.assertCountersExact()
+
+    def test_delete_takes_replies(self):
+        result = self.moderate(moderation.DELETE,
+                               [self.comment, self.inactive])
+        self.assertEqual(result['comments'], 3)
+        self.assertFalse(Comment.objects.filter(pk=self.reply.pk).exists())
+        self.assertCommentsCount(self.post, 0)
+        self.assertCommentsCount(self.other_post, 1)
+        self.assertCountersExact()
+
+    def test_batches(self):
+        result = moderation.moderate(
+            moderation.DEACTIVATE, user=self.user, batch_size=1)
+        self.assertEqual(result['comments'], 3)
+        self.assertCommentsCount(self.post, 0)
+        self.assertCommentsCount(self.other_post, 0)
+        self.assertCountersExact()
+
+    @override_settings(COUNTER_WRITE_BEHIND=True)
+    def test_delete_behind(self):
+        self.moderate(moderation.DELETE, [self.comment])
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 2)
+        self.assertEqual(write_behind.get_pending([self.post.pk]),
+                         {self.post.pk: {'comments_count': -2}})
+        self.assertCountersExact()
+
+        write_behind.flush()
+        self.assertCommentsCount(self.post, 0)
+
+    def test_endpoint(self):
+        client = APIClient()
+        url = f'{API_URL}comments/moderate/'
+        client.force_authenticate(self.user)
+        response = client.post(url, {'action': 'deactivate',
+                                     'ids': [self.comment.pk]}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+        client.force_authenticate(create_user('admin', is_superuser=True))
+        response = client.post(url, {'action': 'deactivate'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = client.post(url, {'action': 'deactivate',
+                                     'user': self.user.pk}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['comments'], 3)
+        self.assertCommentsCount(self.post, 0)
+
+
+class PostQueriesTest(TestCase):
+    def setUp(self):
+        self.author = create_user('author')
+        self.post = create_post(self.author, 'Post')
+        self.post.tags.add('python')
+        # Responses to anonymous users are cached.
+        self.client = APIClient()
+        self.client.force_authenticate(create_user('reader'))
+
+    def add_activity(self, post, count, prefix):
+        users = [create_user(f'{prefix}{index}') for index in range(count)]
+        post.users_liked.add(*users)
+        post.users_disliked.add(*users)
+        for user in users:
+            Comment.objects.create(post=post, user=user, body='Comment')
+        similar = create_post(self.author, f'{prefix} similar')
+        similar.tags.add('python', prefix)
+
+    def get(self, url, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data, queries
+
+    def test_retrieve_queries_bounded(self):
+        url = f'{API_URL}posts/{self.post.pk}/'
+        self.add_activity(self.post, 1, 'first')
+        data, queries = self.get(url)
+        self.assertEqual(len(data['users_liked']), 1)
+
+        self.add_activity(self.post, 8, 'second')
+        data, more_queries = self.get(url)
+        self.assertEqual(len(more_queries), len(queries))
+        self.assertEqual(len(data['users_liked']), 5)
+        self.assertEqual(len(data['users_disliked']), 5)
+        self.assertEqual(len(data['comments']), 5)
+        self.assertEqual(len(data['similar_posts']), 2)
+
+    def test_planned_queries_constant(self):
+        for index, serializer_class in enumerate(
+                (PostListSerializer, CommentReadSerializer)):
+            model = serializer_class.Meta.model
+            with self.subTest(serializer=serializer_class.__name__):
+                self.add_activity(self.post, 1, f'first{index}_')
+                with CaptureQueriesContext(connection) as queries:
+                    serializer_class(plan_queryset(
+                        model.objects.all(), serializer_class()),
+                        many=True).data
+                self.add_activity(self.post, 3, f'second{index}_')
+                with self.assertNumQueries(len(queries)):
+                    serializer_class(plan_queryset(
+                        model.objects.all(), serializer_class()),
+                        many=True).data
+
+    def test_sparse_fields(self):
+        url = f'{API_URL}posts/{self.post.pk}/'
+        data, queries = self.get(url, fields='id,title')
+        self.assertEqual(set(data), {'id', 'title'})
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('"content_post"."body"', queries[0]['sql'])
+
+        data, queries = self.get(url, fields='id,title', expand='comments')
+        self.assertEqual(set(data), {'id', 'title', 'comments'})
+        self.assertEqual(len(queries), 2)
+
+        data, queries = self.get(url, expand='similar_posts')
+        self.assertIn('body', data)
+        self.assertIn('similar_posts', data)
+        self.assertNotIn('users_liked', data)
+
+        data, queries = self.get(f'{API_URL}posts/', fields='id,title')
+        self.assertEqual(set(data['results'][0]), {'id', 'title'})
+        self.assertNotIn('"content_post"."body"',
+                         ''.join(query['sql'] for query in queries))
+
+
+class TrigramSearchTest(TestCase):
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            if cursor.fetchone() is None:
+                self.skipTest('pg_trgm is not installed')
+        author = create_user('author')
+        self.close = create_post(author, 'Django tips')
+        self.far = create_post(author, 'Django tips and tricks for testing')
+        create_post(author, 'Cooking pasta')
+        create_post(author, 'Django tips draft', status=Post.Status.DRAFT)
+
+    def search(self, url, query):
+        response = self.client.get(url, {'query': query})
+        self.assertEqual(response.status_code, 200)
+        return [post['id'] for post in response.data['results']]
+
+    def test_closest_titles_first(self):
+        for url in (f'{API_URL}search/', '/api/v2/content/search/'):
+            with self.subTest(url=url):
+                self.assertEqual(self.search(url, 'django tips'),
+                                 [self.close.pk, self.far.pk])
+
+    @override_settings(SEARCH_SIMILARITY_THRESHOLD=0.5)
+    def test_similarity_threshold(self):
+        self.assertEqual(self.search(f'{API_URL}search/', 'django tips'),
+                         [self.close.pk])
+
+
+class FullTextSearchTest(TestCase):
+    def setUp(self):
+        author = create_user('author')
+        self.in_title = create_post(author, 'Caching with Redis')
+        self.in_body = Post.objects.create(
+            author=author, title='Notes', status=Post.Status.PUBLISHED,
+            body='Redis keeps the response cache warm.')
+        create_post(author, 'Cooking pasta')
+        create_post(author, 'Redis draft', status=Post.Status.DRAFT)
+
+    def search(self, url, **params):
+        response = self.client.get(url, {'mode': 'fulltext', **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def test_titles_ranked_before_bodies(self):
+        for url in (f'{API_URL}search/', '/api/v2/content/search/'):
+            with self.subTest(url=url):
+                results = self.search(url, query='redis')
+                self.assertEqual([post['id'] for post in results],
+                                 [self.in_title.pk, self.in_body.pk])
+                self.assertNotIn('headline', results[0])
+
+                results = self.search(url, query='redis -warm')
+                self.assertEqual([post['id'] for post in results],
+                                 [self.in_title.pk])
+
+    def test_headlines(self):
+        for url in (f'{API_URL}search/', '/api/v2/content/search/'):
+            with self.subTest(url=url):
+                results = self.search(url, query='warm caches',
+                                      highlight='true')
+                self.assertEqual(
+                    [post['headline'] for post in results],
+                    ['Redis keeps the response <b>cache</b> <b>warm</b>.'])
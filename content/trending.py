@@ -0,0 +1,325 @@
+"""
+Trending posts.
+
+Each window in TRENDING_WINDOWS ranks published posts in a Redis ZSET by
+the weighted sum of their likes, dislikes and comments (TRENDING_WEIGHTS),
+where every event counts half as much after each half-life of the window.
+A window without a half-life never decays.
+
+Decayed scores are kept relative to the window's epoch: an event at time
+t adds weight * 2 ** ((t - epoch) / half_life), so older events never
+need to be rescored and the order is the same as with decay to the
+current time. Events are recorded with record() once their transaction
+commits, and each ZSET is trimmed to the TRENDING_SIZE best posts.
+
+rebuild() scores all published posts in one SQL query per window, streamed
+in chunks into a staging ZSET that atomically replaces the window's one
+with a new epoch, and reports the drift it corrected. Without event times
+in the database, the likes, dislikes and comments of a post are counted as
+of its publish date. The 'rebuild_trending' command rebuilds every window,
+e.g. at startup after Redis lost its data. Otherwise the first read of a
+window that is not built rebuilds it, while concurrent reads rank its
+posts in the database, as do all reads without Redis.
+
+Rendered windows are cached by content.api.cache and stay valid until the
+window's version is bumped: when its ranking changes, a post leaves it or
+a ranked post is edited (touch()).
+"""
+import functools
+import operator
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import (CharField, ExpressionWrapper, F, FloatField,
+                              Value)
+from django.db.models.functions import Cast, Extract, Greatest, Power
+from redis import RedisError
+from redis.exceptions import LockNotOwnedError
+from blog import redis_client
+from content.api.cache import TRENDING_VERSION_KEY
+from content.models import Post
+
+
+TRENDING_KEY = 'trending:{window}'
+EPOCH_KEY = 'trending:{window}:epoch'
+STAGING_KEY = 'trending:{window}:staging:{token}'
+REBUILD_LOCK_KEY = 'trending:{window}:rebuild:lock'
+
+# Staging ZSETs of interrupted rebuilds expire after an hour.
+STAGING_TTL = 60 * 60
+
+# Seconds after which the lock of a crashed rebuild by a read expires.
+REBUILD_LOCK_TIMEOUT = 300
+
+REBUILD_CHUNK_SIZE = 2000
+
+# Lowest power of two computed in SQL, to stay clear of underflow.
+MIN_EXPONENT = -1000
+
+# KEYS are triples of a ZSET, its epoch key and its payload version key,
+# ARGV the post id, the current time, the size, the event weight, 1 if the
+# post is published and the half-life of each window, 0 for none. Windows
+# that were never built are skipped. Posts that are not ranked are only
+# added by positive weights, if published. The version is bumped if the
+# post was or is ranked.
+RECORD = """
+local post_id, now = ARGV[1], tonumber(ARGV[2])
+local size, weight = tonumber(ARGV[3]), tonumber(ARGV[4])
+local published = ARGV[5] == '1'
+for i = 1, #KEYS, 3 do
+    local epoch = redis.call('GET', KEYS[i + 1])
+    local ranked = redis.call('ZSCORE', KEYS[i], post_id)
+    if epoch and (ranked or (weight > 0 and published)) then
+        local half_life = tonumber(ARGV[5 + (i + 2) / 3])
+        local increment = weight
+        if half_life > 0 then
+            increment = weight * math.pow(2, (now - tonumber(epoch)) / half_life)
+        end
+        redis.call('ZINCRBY', KEYS[i], increment, post_id)
+        redis.call('ZREMRANGEBYRANK', KEYS[i], 0, -size - 1)
+        if ranked or redis.call('ZSCORE', KEYS[i], post_id) then
+            redis.call('INCR', KEYS[i + 2])
+        end
+    end
+end
+"""
+
+# KEYS are pairs of a ZSET and its payload version key, ARGV the post id.
+TOUCH = """
+for i = 1, #KEYS, 2 do
+    if redis.call('ZSCORE', KEYS[i], ARGV[1]) then
+        redis.call('INCR', KEYS[i + 1])
+    end
+end
+"""
+
+
+def get_weight(deltas):
+    """
+    Return the weight of counter deltas like {'likes': 1, 'dislikes': -1}.
+    """
+    weights = settings.TRENDING_WEIGHTS
+    return sum(weights.get(field, 0) * delta
+               for field, delta in deltas.items())
+
+
+def record(post_id, deltas, published=None):
+    """
+    Add the counter deltas of a post to every window once the current
+    transaction commits. Drafts are never ranked: unless 'published' is
+    given, a positive weight checks that the post is published.
+    """
+    weight = get_weight(deltas)
+    if not weight:
+        return
+    if weight > 0 and published is None:
+        published = Post.published.filter(pk=post_id).exists()
+    windows = settings.TRENDING_WINDOWS
+
+    def add(pipe):
+        keys = []
+        for window in windows:
+            keys += [TRENDING_KEY.format(window=window),
+                     EPOCH_KEY.format(window=window),
+                     get_version_key(window)]
+        args = [post_id, time.time(), settings.TRENDING_SIZE, weight,
+                int(bool(published))]
+        args += [half_life or 0 for half_life in windows.values()]
+        pipe.eval(RECORD, len(keys), *keys, *args)
+    redis_client.on_commit(add)
+
+
+def remove(post_id):
+    """
+    Remove a post from every window once the current transaction commits.
+    """
+    def zrem(pipe):
+        for window in settings.TRENDING_WINDOWS:
+            pipe.zrem(TRENDING_KEY.format(window=window), post_id)
+            pipe.incr(get_version_key(window))
+    redis_client.on_commit(zrem)
+
+
+def touch(post_id):
+    """
+    Invalidate the cached payloads of the windows ranking the post
+    once the current transaction commits.
+    """
+    def bump(pipe):
+        keys = []
+        for window in settings.TRENDING_WINDOWS:
+            keys += [TRENDING_KEY.format(window=window),
+                     get_version_key(window)]
+        pipe.eval(TOUCH, len(keys), *keys, post_id)
+    redis_client.on_commit(bump)
+
+
+def get_version_key(window):
+    """
+    Return the Redis key of the version of the window's cached payloads.
+    """
+    return cache.make_key(TRENDING_VERSION_KEY.format(window=window))
+
+
+def get_scores(window, epoch):
+    """
+    Return a queryset of the (post id, score) pairs of all published
+    posts in the window relative to 'epoch'.
+    """
+    weights = settings.TRENDING_WEIGHTS
+    score = functools.reduce(operator.add, [
+        F(field) * Value(float(weight))
+        for field, weight in weights.items()
+    ])
+    half_life = settings.TRENDING_WINDOWS[window]
+    if half_life:
+        exponent = ((Extract('publish', 'epoch') - Value(float(epoch)))
+                    / Value(float(half_life)))
+        score = score * Power(
+            Value(2.0), Greatest(exponent, Value(float(MIN_EXPONENT)),
+                                 output_field=FloatField())
+        )
+    score = ExpressionWrapper(score, output_field=FloatField())
+    return Post.published.annotate(score=score).order_by().values_list(
+        'pk', 'score')
+
+
+def rebuild(window, chunk_size=REBUILD_CHUNK_SIZE):
+    """
+    Rescore the window from the database with a new epoch and return
+    the drift of the replaced ZSET, see get_drift().
+
+    Published posts are streamed with a server-side cursor into a staging
+    ZSET, one ZADD per chunk, which is trimmed to TRENDING_SIZE along the
+    way and then renamed over the window's ZSET.
+    """
+    client = redis_client.get_client()
+    size = settings.TRENDING_SIZE
+    key = TRENDING_KEY.format(window=window)
+    staging_key = STAGING_KEY.format(window=window, token=uuid.uuid4().hex)
+    epoch = time.time()
+    scored = 0
+    try:
+        chunk = {}
+        for post_id, score in get_scores(window, epoch).iterator(
+                chunk_size=chunk_size):
+            chunk[post_id] = score
+            if len(chunk) == chunk_size:
+                add_chunk(client, staging_key, chunk, size)
+                scored += len(chunk)
+                chunk = {}
+        if chunk:
+            add_chunk(client, staging_key, chunk, size)
+            scored += len(chunk)
+
+        with client.pipeline() as pipe:
+            pipe.zrevrange(key, 0, -1)
+            pipe.zrevrange(staging_key, 0, -1)
+            if scored:
+                pipe.rename(staging_key, key)
+                # The window keeps the TTL of the staging ZSET otherwise.
+                pipe.persist(key)
+            else:
+                pipe.delete(key)
+            pipe.set(EPOCH_KEY.format(window=window), epoch)
+            pipe.incr(get_version_key(window))
+            previous, current = pipe.execute()[:2]
+    finally:
+        client.delete(staging_key)
+
+    previous = [int(post_id) for post_id in previous]
+    current = [int(post_id) for post_id in current]
+    return get_drift(window, scored, previous, current)
+
+
+def add_chunk(client, staging_key, chunk, size):
+    with client.pipeline(transaction=False) as pipe:
+        pipe.zadd(staging_key, chunk)
+        pipe.zremrangebyrank(staging_key, 0, -size - 1)
+        pipe.expire(staging_key, STAGING_TTL)
+        pipe.execute()
+
+
+def get_drift(window, scored, previous, current):
+    """
+    Compare the ranked post ids of a window before and after a rebuild:
+    posts that were missing, stale ones that dropped out, of which those
+    unpublished or deleted, and the number of posts whose rank moved.
+    """
+    previous_ranks = {post_id: rank for rank, post_id in enumerate(previous)}
+    current_ids = set(current)
+    stale = [post_id for post_id in previous if post_id not in current_ids]
+    published = set(Post.published.filter(pk__in=stale).values_list(
+        'pk', flat=True))
+    return {
+        'window': window,
+        'scored': scored,
+        'ranked': len(current),
+        'missing': [post_id for post_id in current
+                    if post_id not in previous_ranks],
+        'stale': stale,
+        'unpublished': [post_id for post_id in stale
+                        if post_id not in published],
+        'moved': sum(1 for rank, post_id in enumerate(current)
+                     if previous_ranks.get(post_id, rank) != rank),
+        'post_ids': current,
+    }
+
+
+def get_post_ids(window):
+    """
+    Return the ids of the window's posts, best first. A window that was
+    not built yet is rebuilt by one read and ranked in the database by
+    the others meanwhile.
+    """
+    client = redis_client.get_client()
+    if client is None:
+        return rank_post_ids(window)
+    try:
+        post_ids = get_built_post_ids(client, window)
+        if post_ids is not None:
+            return post_ids
+        lock = client.lock(REBUILD_LOCK_KEY.format(window=window),
+                           timeout=REBUILD_LOCK_TIMEOUT, blocking=False)
+        if not lock.acquire():
+            return rank_post_ids(window)
+        try:
+            # Another read may have built it before the lock was taken.
+            post_ids = get_built_post_ids(client, window)
+            if post_ids is None:
+                post_ids = rebuild(window)['post_ids']
+            return post_ids
+        finally:
+            try:
+                lock.release()
+            except LockNotOwnedError:
+                # The rebuild outlived the lock timeout.
+                pass
+    except RedisError:
+        return rank_post_ids(window)
+
+
+def get_built_post_ids(client, window):
+    """
+    Return the ids of the window's posts from its ZSET, or None if the
+    window was not built.
+    """
+    with client.pipeline(transaction=False) as pipe:
+        pipe.exists(EPOCH_KEY.format(window=window))
+        pipe.zrevrange(TRENDING_KEY.format(window=window), 0, -1)
+        built, post_ids = pipe.execute()
+    if not built:
+        return None
+    return [int(post_id) for post_id in post_ids]
+
+
+def rank_post_ids(window):
+    """
+    Return the ids of the window's posts ranked in the database.
+    """
+    # Ties are ordered like in the ZSET, by member in reverse
+    # lexicographic order.
+    scores = get_scores(window, time.time()).order_by(
+        '-score', Cast('pk', CharField()).desc())
+    return list(scores.values_list('pk', flat=True)[:settings.TRENDING_SIZE])
@@ -0,0 +1,295 @@
+"""
+Write-behind counters of posts.
+
+With COUNTER_WRITE_BEHIND set, changes of Post.likes, Post.dislikes and
+Post.comments_count are not written to the post row, where concurrent
+writers of a popular post would queue on its lock. Their deltas are added
+to one Redis hash per counter, keyed by post id, once the transaction
+commits, and applied in batches by flush(), run by the
+'flush_post_counters' command. Rendered posts overlay the deltas that are
+not flushed yet with apply_pending(), so users read their own writes.
+
+flush() first moves the pending hashes aside as a batch with a new id, so
+that new deltas collect in fresh ones, updates the posts in a single
+transaction that also saves the batch id as a CounterFlush and drops the
+moved hashes once it commits. A batch left aside, because its flush failed
+or the hashes could not be dropped, is taken up by the next flush, which
+only applies it if its id was not saved, so each batch is applied exactly
+once, even by runs of the command that outlive their Redis lock. Until it
+is dropped, a batch that was applied is also counted by apply_pending().
+"""
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import F
+from django.utils import timezone
+from redis.exceptions import LockNotOwnedError
+from blog import redis_client
+from content.api import cache
+from content.models import CounterFlush, Post
+
+
+COUNTER_FIELDS = ('likes', 'dislikes', 'comments_count')
+
+PENDING_KEY = 'posts:counters:pending:{field}'
+FLUSHING_KEY = 'posts:counters:flushing:{field}'
+FLUSHING_ID_KEY = 'posts:counters:flushing:id'
+
+FLUSH_LOCK_KEY = 'posts:counters:flush:lock'
+
+FLUSH_BATCH_SIZE = 1000
+
+# Seconds after which the lock of a crashed flush expires.
+FLUSH_LOCK_TIMEOUT = 300
+
+# Ids of applied batches are kept this long, while their hashes may be left.
+FLUSH_ID_RETENTION = timedelta(days=1)
+
+# Returns the id of the batch left by a previous flush and 1, or moves each
+# pending hash (odd keys) to its flushing hash (even keys) as a batch with
+# the id ARGV[1], kept in the last key, and returns it and 0. Flushing
+# hashes without an id, left before batches had ids, are merged into.
+TAKE_PENDING = """
+local id_key = KEYS[#KEYS]
+local id = redis.call('GET', id_key)
+if id then
+    return {id, 1}
+end
+local taken = false
+for i = 1, #KEYS - 1, 2 do
+    local pending, flushing = KEYS[i], KEYS[i + 1]
+    if redis.call('EXISTS', pending) == 1 then
+        taken = true
+        if redis.call('EXISTS', flushing) == 1 then
+            local deltas = redis.call('HGETALL', pending)
+            for j = 1, #deltas, 2 do
+                redis.call('HINCRBY', flushing, deltas[j], deltas[j + 1])
+            end
+            redis.call('DEL', pending)
+        else
+            redis.call('RENAME', pending, flushing)
+        end
+    elseif redis.call('EXISTS', flushing) == 1 then
+        taken = true
+    end
+end
+if not taken then
+    return nil
+end
+redis.call('SET', id_key, ARGV[1])
+return {ARGV[1], 0}
+"""
+
+# Drops the flushing hashes and their id (last key) if they are still the
+# batch ARGV[1], and not a later one.
+DROP_BATCH = """
+if redis.call('GET', KEYS[#KEYS]) == ARGV[1] then
+    redis.call('DEL', unpack(KEYS))
+end
+"""
+
+FLUSH_SQL = """
+UPDATE {table} AS post SET
+    {assignments}
+FROM (VALUES {values}) AS delta ({pk_column}, {columns})
+WHERE post.{pk_column} = delta.{pk_column}
+"""
+
+
+def is_enabled():
+    return (settings.COUNTER_WRITE_BEHIND
+            and redis_client.get_client() is not None)
+
+
+def add(post_id, deltas):
+    """
+    Add the counter deltas of a post, by field name, to the pending
+    hashes once the current transaction commits.
+    """
+    def incrby(pipe):
+        for field, delta in deltas.items():
+            if delta:
+                pipe.hincrby(PENDING_KEY.format(field=field), post_id, delta)
+    redis_client.on_commit(incrby)
+
+
+def adjust(post_id, field, delta):
+    """
+    Add 'delta' to a counter of the post, behind or in the database.
+    """
+    if is_enabled():
+        add(post_id, {field: delta})
+    else:
+        Post.objects.filter(pk=post_id).update(**{field: F(field) + delta})
+
+
+def discard(post_id, field):
+    """
+    Drop the deltas of a counter of the post once the current transaction
+    commits, after the counter was set to an exact value.
+    """
+    def delete(pipe):
+        pipe.hdel(PENDING_KEY.format(field=field), post_id)
+        pipe.hdel(FLUSHING_KEY.format(field=field), post_id)
+    redis_client.on_commit(delete)
+
+
+def get_pending(post_ids):
+    """
+    Return the non-zero deltas of the posts not flushed yet,
+    by post id and field name.
+    """
+    client = redis_client.get_client()
+    if client is None or not post_ids:
+        return {}
+    post_ids = list(post_ids)
+    with client.pipeline(transaction=False) as pipe:
+        for field in COUNTER_FIELDS:
+            pipe.hmget(PENDING_KEY.format(field=field), post_ids)
+            pipe.hmget(FLUSHING_KEY.format(field=field), post_ids)
+        results = pipe.execute()
+
+    pending = {}
+    for index, field in enumerate(COUNTER_FIELDS):
+        values = zip(post_ids, results[2 * index], results[2 * index + 1])
+        for post_id, delta, flushing in values:
+            delta = int(delta or 0) + int(flushing or 0)
+            if delta:
+                pending.setdefault(post_id, {})[field] = delta
+    return pending
+
+
+def apply_pending(items):
+    """
+    Add the pending deltas to the counters of rendered posts in place.
+    """
+    if not is_enabled():
+        return
+    pending = get_pending([item['id'] for item in items])
+    for item in items:
+        for field, delta in pending.get(item['id'], {}).items():
+            if field in item:
+                item[field] = max(item[field] + delta, 0)
+
+
+def get_counters(post_id, deltas=None):
+    """
+    Return the counters of the post, by field name, with the pending deltas
+    and 'deltas' that are not queued yet added.
+    """
+    counters = Post.objects.filter(pk=post_id).values(*COUNTER_FIELDS).get()
+    pending = get_pending([post_id]).get(post_id, {})
+    for field in COUNTER_FIELDS:
+        delta = pending.get(field, 0) + (deltas or {}).get(field, 0)
+        counters[field] = max(counters[field] + delta, 0)
+    return counters
+
+
+def get_flush_sql(count, connection):
+    quote = connection.ops.quote_name
+    pk_column = quote(Post._meta.pk.column)
+    columns = [quote(Post._meta.get_field(field).column)
+               for field in COUNTER_FIELDS]
+    row = '({})'.format(', '.join(
+        ['%s::bigint'] + ['%s::integer'] * len(columns)
+    ))
+    return FLUSH_SQL.format(
+        table=quote(Post._meta.db_table),
+        assignments=',\n    '.join(
+            f'{column} = GREATEST(post.{column} + delta.{column}, 0)'
+            for column in columns
+        ),
+        values=', '.join([row] * count),
+        pk_column=pk_column,
+        columns=', '.join(columns),
+    )
+
+
+def flush(batch_size=FLUSH_BATCH_SIZE):
+    """
+    Apply the pending deltas to the posts in UPDATE statements of up to
+    'batch_size' posts and return the number of posts updated, or None
+    if another flush is running. A batch left by a previous flush is
+    taken up first.
+    """
+    client = redis_client.get_client()
+    if client is None:
+        return 0
+    lock = client.lock(FLUSH_LOCK_KEY, timeout=FLUSH_LOCK_TIMEOUT,
+                       blocking=False)
+    if not lock.acquire():
+        return None
+    try:
+        updated, left = flush_batch(client, batch_size)
+        if left:
+            updated += flush_batch(client, batch_size)[0]
+        return updated
+    finally:
+        try:
+            lock.release()
+        except LockNotOwnedError:
+            # The flush outlived the lock timeout.
+            pass
+
+
+def flush_batch(client, batch_size):
+    """
+    Take a batch of deltas and apply it unless its id was saved. Return the
+    number of posts updated and whether the batch was left by a previous
+    flush.
+    """
+    flushing_keys = [FLUSHING_KEY.format(field=field)
+                     for field in COUNTER_FIELDS]
+    keys = []
+    for field, flushing_key in zip(COUNTER_FIELDS, flushing_keys):
+        keys += [PENDING_KEY.format(field=field), flushing_key]
+    keys.append(FLUSHING_ID_KEY)
+    with client.pipeline(transaction=False) as pipe:
+        pipe.eval(TAKE_PENDING, len(keys), *keys, uuid.uuid4().hex)
+        for flushing_key in flushing_keys:
+            pipe.hgetall(flushing_key)
+        taken, *results = pipe.execute()
+    if taken is None:
+        return 0, False
+    flush_id, left = taken[0].decode(), bool(taken[1])
+
+    deltas = {}
+    for field, values in zip(COUNTER_FIELDS, results):
+        for post_id, delta in values.items():
+            post_deltas = deltas.setdefault(
+                int(post_id), dict.fromkeys(COUNTER_FIELDS, 0))
+            post_deltas[field] = int(delta)
+
+    # Rows are locked in primary key order to avoid deadlocks.
+    rows = sorted(deltas.items())
+    using = router.db_for_write(Post)
+    connection = connections[using]
+    with transaction.atomic(using=using):
+        # A concurrent flush of the same batch waits here for this one
+        # to commit and then finds the id.
+        _, created = CounterFlush.objects.using(using).get_or_create(
+            id=flush_id)
+        if created and rows:
+            with connection.cursor() as cursor:
+                for start in range(0, len(rows), batch_size):
+                    batch = rows[start:start + batch_size]
+                    params = []
+                    for post_id, post_deltas in batch:
+                        params.append(post_id)
+                        params.extend(post_deltas[field]
+                                      for field in COUNTER_FIELDS)
+                    cursor.execute(get_flush_sql(len(batch), connection),
+                                   params)
+            # Responses cached while both the row and the deltas
+            # count a change are dropped with the flushed deltas.
+            for post_id, _ in rows:
+                cache.invalidate_post(post_id)
+        CounterFlush.objects.using(using).filter(
+            created_at__lt=timezone.now() - FLUSH_ID_RETENTION).delete()
+        drop_keys = [*flushing_keys, FLUSHING_ID_KEY]
+        redis_client.on_commit(
+            lambda pipe: pipe.eval(DROP_BATCH, len(drop_keys), *drop_keys,
+                                   flush_id),
+            using=using)
+    return (len(rows) if created else 0), left
@@ -8,5 +8,8 @@ python manage.py migrate
 echo "Starting load data..."
 python manage.py loaddata data.json
 
+echo "Starting rebuild trending posts..."
+python manage.py rebuild_trending
+
 echo "Starting serverl.."
 exec "$@"